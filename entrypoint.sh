@@ -33,8 +33,26 @@ else:
 " || true
 
 # Start Gunicorn
+# SERVER_MODE=asgi runs uvicorn workers with the async views
+if [ "${SERVER_MODE}" = "asgi" ]; then
+    echo "Starting Gunicorn (ASGI)..."
+    exec gunicorn --config gunicorn.conf.py \
+        --bind 0.0.0.0:9111 \
+        --worker-class uvicorn.workers.UvicornWorker \
+        --workers 3 \
+        --max-requests 1000 \
+        --max-requests-jitter 100 \
+        --timeout 30 \
+        --keep-alive 5 \
+        --access-logfile /app/logs/gunicorn_access.log \
+        --error-logfile /app/logs/gunicorn_error.log \
+        --log-level info \
+        mysite.asgi:application
+fi
+
 echo "Starting Gunicorn..."
-exec gunicorn --bind 0.0.0.0:9111 \
+exec gunicorn --config gunicorn.conf.py \
+    --bind 0.0.0.0:9111 \
     --workers 3 \
     --max-requests 1000 \
     --max-requests-jitter 100 \
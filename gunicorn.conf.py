@@ -0,0 +1,16 @@
+"""
+Gunicorn configuration hooks; the command-line flags live in entrypoint.sh
+"""
+
+import os
+
+
+def on_starting(server):
+    """
+    Create the shared-memory cache files in the master, before any worker
+    forks, so every worker maps the same file and recycled workers find it
+    warm
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+    from stream.cache_backends.shared_memory import create_segments
+    create_segments()
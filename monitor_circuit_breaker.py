@@ -6,7 +6,6 @@ Script untuk monitoring dan reset circuit breaker
 import os
 import sys
 import django
-import requests
 import time
 
 # Setup Django environment
@@ -14,31 +13,37 @@ sys.path.append('/home/korteks/Documents/project/fekortekstream/kortekstreamV2')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 django.setup()
 
-from stream.views import is_circuit_breaker_open, record_api_success, CIRCUIT_BREAKER_KEY
-from django.core.cache import cache
+from stream.views import is_circuit_breaker_open, record_api_success
+from stream.api_client import api_client, reset_circuit_breakers, api_health_check
 
 def check_circuit_breaker_status():
     """Check current circuit breaker status"""
     print("=== Circuit Breaker Status ===")
     
     is_open = is_circuit_breaker_open()
-    breaker_data = cache.get(CIRCUIT_BREAKER_KEY, {'failures': 0, 'last_failure': 0})
+    breaker_stats = api_client.get_circuit_breaker_stats()
     
     print(f"Circuit Breaker: {'OPEN' if is_open else 'CLOSED'}")
-    print(f"Failures: {breaker_data['failures']}")
+    if not breaker_stats:
+        print("No endpoint breakers recorded yet")
     
-    if breaker_data['last_failure'] > 0:
-        last_failure_time = time.time() - breaker_data['last_failure']
-        print(f"Last failure: {last_failure_time:.2f} seconds ago")
-    else:
-        print("Last failure: Never")
+    for endpoint, stats in breaker_stats.items():
+        print(f"\n[{endpoint}] {stats['state']}")
+        print(f"  Failures: {stats['failures']}")
+        print(f"  Slow call rate: {stats['slow_call_rate']:.0%}")
+        
+        if stats.get('last_failure_time'):
+            last_failure_time = time.time() - stats['last_failure_time']
+            print(f"  Last failure: {last_failure_time:.2f} seconds ago")
+        else:
+            print("  Last failure: Never")
     
     return is_open
 
 def reset_circuit_breaker():
     """Reset circuit breaker manually"""
     print("\n=== Resetting Circuit Breaker ===")
-    cache.delete(CIRCUIT_BREAKER_KEY)
+    reset_circuit_breakers()
     print("✅ Circuit breaker has been reset")
 
 def test_api_endpoint():
@@ -46,15 +51,20 @@ def test_api_endpoint():
     print("\n=== Testing API Endpoint ===")
     
     try:
-        url = "http://apigatway.humanmade.my.id:8080/api/categories/names"
-        response = requests.get(url, timeout=10)
+        health = api_health_check()
+        for gateway, stats in health.get('gateways', {}).items():
+            print(f"  {gateway}: {stats['state']}, EWMA {stats['ewma_ms']} ms")
         
-        if response.status_code == 200:
+        if health['healthy']:
             print("✅ API is reachable and responding")
-            record_api_success()
+            # The health check calls this endpoint, so only its breaker is reset
+            record_api_success('api/categories/names')
             return True
+        elif 'status_code' in health:
+            print(f"❌ API returned status code: {health['status_code']}")
+            return False
         else:
-            print(f"❌ API returned status code: {response.status_code}")
+            print(f"❌ API test failed: {health.get('error')}")
             return False
             
     except Exception as e:
@@ -12,5 +12,27 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# Route the stream pages to the async views, which await upstream API calls
+# on a shared aiohttp session instead of blocking a worker thread
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from stream.async_api_client import async_api_client  # noqa: E402  (needs the settings above)
+
+
+async def application(scope, receive, send):
+    """
+    Django's ASGI application, plus the lifespan events it doesn't handle:
+    on shutdown the async API client's aiohttp session is closed
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_api_client.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -69,6 +69,7 @@ MIDDLEWARE = [
 try:
     import stream.middleware
     MIDDLEWARE.extend([
+        'stream.middleware.RequestDeadlineMiddleware',  # Time budget for upstream API calls
         'stream.middleware.SEOMiddleware',        # SEO optimizations
         'stream.middleware.PerformanceMiddleware', # Performance monitoring
         'stream.middleware.CompressionMiddleware', # Response compression
@@ -205,8 +206,9 @@ SECURE_FRAME_DENY = False
 if IS_PRODUCTION:
     # Redis cache for production (recommended for multiple servers)
     CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        # Redis itself; used through 'default', which fails over to 'disk' while it is down
+        'redis': {
+            'BACKEND': 'django_redis.cache.RedisCache',
             'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
             'TIMEOUT': 300,  # 5 minutes default
             'OPTIONS': {
@@ -215,15 +217,16 @@ if IS_PRODUCTION:
                     'max_connections': 50,
                     'retry_on_timeout': True,
                 },
-                'COMPRESSOR': 'django_redis.compressors.zlib.ZlibCompressor',
-                'IGNORE_EXCEPTIONS': True,  # Don't fail if Redis is down
+                # Fail fast: errors reach the failover breaker instead of being ignored
+                'SOCKET_CONNECT_TIMEOUT': 0.5,
+                'SOCKET_TIMEOUT': 0.5,
+                # No COMPRESSOR: API payloads are already zstd-compressed by SmartCache
             },
             'KEY_PREFIX': 'kortekstream',
             'VERSION': 1,
         },
-        # Separate cache for sessions
-        'sessions': {
-            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'sessions_redis': {
+            'BACKEND': 'django_redis.cache.RedisCache',
             'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/2'),
             'TIMEOUT': 86400,  # 24 hours for sessions
             'OPTIONS': {
@@ -232,18 +235,71 @@ if IS_PRODUCTION:
                     'max_connections': 20,
                     'retry_on_timeout': True,
                 },
-                'IGNORE_EXCEPTIONS': True,
+                'SOCKET_CONNECT_TIMEOUT': 0.5,
+                'SOCKET_TIMEOUT': 0.5,
             },
             'KEY_PREFIX': 'kortekstream_session',
         },
-        # Fast cache for frequently accessed data
+        # Local tier shared by the workers on the host, only used while Redis is down;
+        # each FailoverCache alias keeps its keys there under its own LOCATION
+        'disk': {
+            'BACKEND': 'stream.cache_backends.DiskLRUCache',
+            'LOCATION': os.environ.get('DISK_CACHE_PATH', os.path.join(BASE_DIR, 'cache', 'disk-cache.sqlite3')),
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'MAX_BYTES': 256 * 1024 * 1024,
+            }
+        },
+        'default': {
+            'BACKEND': 'stream.cache_backends.FailoverCache',
+            'LOCATION': 'default',
+            'OPTIONS': {
+                'PRIMARY': 'redis',
+                'FALLBACK': 'disk',
+                'FAILURE_THRESHOLD': 3,  # consecutive Redis errors before failing over
+                'RETRY_AFTER': 10,  # seconds before probing Redis again
+            }
+        },
+        # Separate cache for sessions
+        'sessions': {
+            'BACKEND': 'stream.cache_backends.FailoverCache',
+            'LOCATION': 'sessions',
+            'OPTIONS': {
+                'PRIMARY': 'sessions_redis',
+                'FALLBACK': 'disk',
+                'FAILURE_THRESHOLD': 3,
+                'RETRY_AFTER': 10,
+            }
+        },
+        # Fast cache for frequently accessed data, evicting rarely used keys first
         'fast': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'BACKEND': 'stream.cache_backends.TinyLFUCache',
             'LOCATION': 'fast-cache',
             'TIMEOUT': 60,  # 1 minute for very fast data
             'OPTIONS': {
-                'MAX_ENTRIES': 2000,
-                'CULL_FREQUENCY': 2,
+                'MAX_BYTES': 64 * 1024 * 1024,  # per worker process
+            }
+        },
+        # One copy of the hot payloads for all workers on the host, created by the
+        # gunicorn master (gunicorn.conf.py) so it survives worker recycling
+        'shared': {
+            'BACKEND': 'stream.cache_backends.SharedMemoryCache',
+            'LOCATION': os.environ.get('SHARED_CACHE_PATH', '/dev/shm/kortekstream-l1'),
+            'TIMEOUT': 60,
+            'OPTIONS': {
+                # (slot bytes, slots) per size class: 48 MiB, within Docker's default /dev/shm
+                'SLOTS': [(2048, 4096), (16384, 1024), (131072, 192)],
+            }
+        },
+        # Hot keys served from 'shared' memory, kept coherent across hosts over Redis pub/sub
+        'tiered': {
+            'BACKEND': 'stream.cache_backends.TieredCache',
+            'LOCATION': 'tiered',
+            'OPTIONS': {
+                'L1': 'shared',
+                'L2': 'default',
+                'CHANNEL': 'kortekstream:cache_invalidation',
+                'L1_TIMEOUT': 30,  # upper bound on an L1 copy's life
             }
         }
     }
@@ -265,18 +321,26 @@ else:
             }
         },
         'fast': {
-            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'BACKEND': 'stream.cache_backends.TinyLFUCache',
             'LOCATION': 'fast-cache',
             'TIMEOUT': 60,
             'OPTIONS': {
-                'MAX_ENTRIES': 1000,
-                'CULL_FREQUENCY': 2,
+                'MAX_BYTES': 32 * 1024 * 1024,
+            }
+        },
+        'tiered': {
+            'BACKEND': 'stream.cache_backends.TieredCache',
+            'LOCATION': 'tiered',
+            'OPTIONS': {
+                'L1': 'fast',
+                'L2': 'default',
+                'L1_TIMEOUT': 30,
             }
         }
     }
 
 # Cache middleware settings
-CACHE_MIDDLEWARE_ALIAS = 'default'
+CACHE_MIDDLEWARE_ALIAS = 'tiered'  # pages served from the in-process L1 when hot
 CACHE_MIDDLEWARE_SECONDS = 300  # 5 minutes
 CACHE_MIDDLEWARE_KEY_PREFIX = 'kortekstream'
 
@@ -432,11 +496,81 @@ RATE_LIMIT_PER_HOUR = 1000  # requests per hour per IP
 RATE_LIMIT_BURST = 10  # burst allowance
 
 # API settings
+# Comma-separated gateway URLs; the first one is canonical for URLs and cache keys
+API_BASE_URLS = [
+    url.strip() for url in
+    os.environ.get('API_BASE_URLS', 'http://apigatway.humanmade.my.id:8080').split(',')
+    if url.strip()
+]
+API_BASE_URL = API_BASE_URLS[0]
+API_GATEWAY_EWMA_ALPHA = 0.3  # weight of the newest response time in each gateway's EWMA
+API_GATEWAY_FAILURE_THRESHOLD = 5  # consecutive failures before a gateway is ejected
+API_GATEWAY_EJECT_TIME = 30  # seconds an ejected gateway gets no traffic
 API_TIMEOUT = 15  # seconds
+REQUEST_DEADLINE = 25  # seconds per request for API calls, below gunicorn's --timeout 30
 API_MAX_RETRIES = 3
 API_BACKOFF_FACTOR = 1.5
+API_MIN_ATTEMPT_TIME = 0.5  # seconds of deadline needed to start an upstream attempt
+API_RETRY_BUDGET = 0.1  # retries per successful request, i.e. at most 10% extra load
+API_RETRY_BUDGET_BURST = 10  # retries available after a quiet period
+API_RETRY_BUDGET_SHARED = True  # share the retry budget across workers through Redis
+API_NEGATIVE_CACHE_TTL = 60  # seconds to remember 4xx answers and empty results
+API_NEGATIVE_CACHE_MAX_ENTRIES = 10000  # oldest negative entries are evicted beyond this
+API_NEGATIVE_CACHE_EMPTY_ENDPOINTS = ['api/v1/search']  # empty results here are negative-cached
 API_CIRCUIT_BREAKER_THRESHOLD = 10
 API_CIRCUIT_BREAKER_TIMEOUT = 300  # 5 minutes
+API_CIRCUIT_BREAKER_WINDOW = 20  # recent calls per endpoint used for the slow-call rate
+API_CIRCUIT_BREAKER_MIN_CALLS = 5  # calls needed in the window before the slow-call rate can trip
+API_SLOW_CALL_DURATION = 10  # seconds, calls at least this slow count as slow
+API_SLOW_CALL_RATE_THRESHOLD = 0.5  # open the breaker when half the recent calls are slow
+API_CIRCUIT_BREAKER_HALF_OPEN_PROBES = 3  # probes allowed across all workers; all must succeed to close
+API_CIRCUIT_BREAKER_SLOW_START = 60  # seconds to ramp traffic back up after the breaker closes
+API_CIRCUIT_BREAKER_SLOW_START_MIN_RATE = 0.1  # share of calls admitted right after closing
+API_SINGLEFLIGHT_LEASE_TIMEOUT = 10  # seconds one worker may hold the fetch lease for a key
+API_SINGLEFLIGHT_WAIT_TIMEOUT = 5  # seconds other workers wait for the lease holder's result
+API_REFRESH_WORKERS = 4  # background refresh threads per process
+API_REFRESH_QUEUE_SIZE = 100  # pending refreshes before new ones are dropped
+API_REFRESH_SHUTDOWN_TIMEOUT = 5  # seconds to let running refreshes finish on worker exit
+API_GET_MANY_WORKERS = 16  # threads fetching get_many misses, shared by every batch in the process
+# Admission control: calls that can't get a slot within the queue timeout are
+# served stale data or a fast 503 instead of piling up on the gateway
+API_MAX_CONCURRENCY_PER_PROCESS = 32  # upstream calls in flight per process, below the pool's 50
+API_ADMISSION_QUEUE_TIMEOUT = 0.5  # seconds to wait for a slot
+API_ENDPOINT_CLASSES = {
+    'search': ['api/v1/search'],
+    'detail': ['api/v1/anime-detail', 'api/v1/episode-detail'],
+}
+# Fleet-wide limits per endpoint class, shared through Redis (0 = unlimited)
+API_ADMISSION_LIMITS = {
+    'default': {'concurrency': 100, 'rate': 200},  # rate in calls per second
+    'search': {'concurrency': 20, 'rate': 30},
+    'detail': {'concurrency': 60, 'rate': 120},
+}
+# Shared breaker, budget and admission state in Redis: for this long a worker trusts
+# the CLOSED/OPEN breaker state it last read and batches breaker successes, budget
+# earnings and admission releases, instead of a Redis round trip each per upstream call
+API_REDIS_SYNC_INTERVAL = 1  # seconds, 0 to go to Redis on every call
+REDIS_RETRY_AFTER = 5  # seconds raw Redis calls are skipped after a connection error or timeout
+# Adaptive timeouts: API_TIMEOUT_MULTIPLIER x the latency percentile of each phase
+# (read: the endpoint's time to first byte, connect: the time new connections to
+# the gateway took), clamped per phase; the maximums apply until API_LATENCY_MIN_SAMPLES are in
+API_TIMEOUT_PERCENTILE = 99
+API_TIMEOUT_MULTIPLIER = 2.0
+API_CONNECT_TIMEOUT_MIN = 1  # seconds
+API_CONNECT_TIMEOUT_MAX = 5  # seconds
+API_READ_TIMEOUT_MIN = 2  # seconds
+API_READ_TIMEOUT_MAX = API_TIMEOUT  # seconds
+API_LATENCY_WINDOW = 300  # seconds per rolling histogram window
+API_LATENCY_MIN_SAMPLES = 20
+# Hedged requests: a second identical request once the first has taken longer
+# than the endpoint's API_HEDGE_PERCENTILE latency, first response wins
+API_HEDGED_ENDPOINTS = ['api/v1/episode-detail', 'api/v1/anime-detail']
+API_HEDGE_PERCENTILE = 95
+API_HEDGE_BUDGET = 0.05  # hedges per primary request, i.e. at most 5% extra load
+API_HEDGE_WORKERS = 16  # threads running hedged requests per process
+
+# Serve the page views as coroutines on the aiohttp client (set by mysite/asgi.py)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False').lower() == 'true'
 
 # Cache timeouts (in seconds)
 CACHE_TIMEOUT_SHORT = 60      # 1 minute
@@ -444,6 +578,39 @@ CACHE_TIMEOUT_MEDIUM = 300    # 5 minutes
 CACHE_TIMEOUT_LONG = 3600     # 1 hour
 CACHE_TIMEOUT_VERY_LONG = 86400  # 24 hours
 
+# API cache envelopes: data is fresh for the caller's timeout (soft TTL) and
+# served stale while refreshing until the hard TTL
+API_CACHE_ALIAS = 'tiered'  # cache alias holding API responses
+API_CACHE_HARD_TTL = 86400  # 24 hours
+API_CACHE_TTL_JITTER = 0.1  # +/-10% spread on soft and hard TTLs
+API_CACHE_EARLY_REFRESH_BETA = 1.0  # XFetch beta, 0 disables probabilistic early refresh
+API_CACHE_CASEFOLD_PARAMS = ['category']  # params whose values are case-insensitive in cache keys
+API_CACHE_GENERATION_TTL = 2  # seconds a worker reuses endpoint/category generations (unused with a tiered cache)
+API_CACHE_CODEC = 'orjson'  # payload codec for cache envelopes: orjson, msgpack or pickle
+API_CACHE_COMPRESSION = 'zstd'  # compress cached payloads with zstd ('' to disable)
+API_CACHE_ZSTD_LEVEL = 3
+API_CACHE_COMPRESS_MIN_BYTES = 256  # smaller payloads are stored uncompressed
+API_CACHE_ZSTD_DICT_REFRESH = 60  # seconds between checks for a newly trained dictionary
+# Records in API payloads (dicts in lists with one of these ID fields) are cached
+# once and shared by every page listing them; [] caches pages whole
+API_CACHE_ITEM_ID_FIELDS = ['url', 'anime_slug', 'slug', 'id']
+API_CACHE_ITEM_LISTS = {  # endpoint -> fields (at any depth) whose lists hold such records
+    'api/v1/home': ['top10', 'new_eps', 'movies', 'jadwal_rilis'],
+    'api/v1/anime-terbaru': ['data'],
+    'api/v1/jadwal-rilis': ['data'],
+    'api/v1/search': ['data'],
+}  # other endpoints are cached whole
+# Last-known-good payloads of the hot requests, served when both the API and the cache are down
+API_SNAPSHOT_PATH = os.environ.get('API_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'cache', 'api-snapshots.bin'))
+API_SNAPSHOT_ENDPOINTS = {  # endpoint -> params a request must match to be kept ({} = any)
+    'api/categories/names': {},
+    'api/v1/home': {},  # every category
+    'api/v1/anime-terbaru': {'page': [1, 2, 3]},
+    'api/v1/jadwal-rilis': {},
+}
+API_SNAPSHOT_MAX_ENTRIES = 64  # least recently saved snapshots are dropped beyond this
+API_SNAPSHOT_MIN_INTERVAL = 60  # seconds between saves of one request's snapshot, per process
+
 # SEO Settings
 SITE_ID = 1
 SITE_NAME = 'KortekStream'
@@ -3,23 +3,53 @@ Robust API client with connection pooling, circuit breaker, and advanced caching
 Designed to handle high-traffic scenarios and API instability
 """
 
+import os
+import copy
+import math
+import queue
+import atexit
 import time
 import json
+import uuid
+import random
 import hashlib
 import logging
+import asyncio
 import threading
-from typing import Dict, Any, Optional, Tuple
-from dataclasses import dataclass, asdict
+import contextvars
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import Dict, Any, Optional, Tuple, List
+from dataclasses import dataclass, asdict, replace
 from datetime import datetime, timedelta
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlsplit
 
 import requests
 from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-from django.core.cache import cache, caches
+from requests.packages.urllib3.exceptions import ConnectTimeoutError
+from requests.packages.urllib3.util.request import ACCEPT_ENCODING
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches, InvalidCacheBackendError
 from django.conf import settings
 from django.utils import timezone
 
+from .codecs import encode as encode_payload, decode as decode_payload, loads_json
+from .compression import compress as compress_payload, decompress as decompress_payload, get_compressor
+from .cache_backends import TieredCache
+from .snapshots import SnapshotStore
+from .utils.redis_client import get_redis_connection, report_redis_error
+from .utils.deadline import DeadlineExceeded, cap, remaining as deadline_remaining
+
+# Upstream statuses worth retrying
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Negative entry that wasn't read together with the envelope
+UNREAD = object()
+
+# Float error tolerated when a token budget spends a whole token
+TOKEN_EPSILON = 1e-9
+
 # Setup loggers
 api_logger = logging.getLogger('stream.api')
 performance_logger = logging.getLogger('stream.performance')
@@ -36,142 +66,2081 @@ class APIResponse:
     source: str = 'api'
     timestamp: datetime = None
     
-    def __post_init__(self):
-        if self.timestamp is None:
-            self.timestamp = timezone.now()
+    def __post_init__(self):
+        if self.timestamp is None:
+            self.timestamp = timezone.now()
+
+
+@dataclass
+class APIRequest:
+    """One request in a get_many batch"""
+    endpoint: str
+    params: Optional[Dict] = None
+    cache_timeout: int = 300
+
+
+class CircuitBreakerOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+
+class AdmissionRejected(Exception):
+    """Raised when an upstream call can't be admitted within the queue timeout"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker implementation to handle API failures gracefully.
+    
+    The lock only guards state transitions; the protected call itself runs
+    unlocked so concurrent upstream requests are not serialized. Besides
+    consecutive failures, the breaker trips when the share of slow calls in
+    the recent window crosses ``slow_call_rate_threshold``, so a gateway that
+    answers in 14s is treated as failing before gunicorn's timeout kills the
+    worker. After closing, traffic ramps back up over ``slow_start_duration``.
+    """
+    
+    def __init__(self, failure_threshold: int = 10, timeout: int = 300, name: str = 'default',
+                 slow_call_duration: float = 10.0, slow_call_rate_threshold: float = 0.5,
+                 window_size: int = 20, minimum_calls: int = 5,
+                 half_open_max_probes: int = 1, slow_start_duration: float = 0,
+                 slow_start_min_rate: float = 0.1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.timeout = timeout
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_size = window_size
+        self.minimum_calls = minimum_calls
+        self.half_open_max_probes = half_open_max_probes
+        self.slow_start_duration = slow_start_duration
+        self.slow_start_min_rate = slow_start_min_rate
+        self.failure_count = 0
+        self.last_failure_time = None
+        self.closed_at = None
+        self.state = 'CLOSED'  # CLOSED, OPEN, HALF_OPEN
+        self.slow_start_rejections = 0
+        self._recent_calls = deque(maxlen=window_size)  # True for slow calls
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+    
+    def call(self, func, *args, **kwargs):
+        """Execute function with circuit breaker protection"""
+        probe = self._before_call()
+        
+        start_time = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self._on_failure(probe)
+            else:
+                self._on_success(time.time() - start_time, probe)
+            raise
+        
+        self._on_success(time.time() - start_time, probe)
+        return result
+    
+    async def acall(self, func, *args, **kwargs):
+        """Async counterpart of call(); state transitions run off the event loop"""
+        probe = await sync_to_async(self._before_call, thread_sensitive=False)()
+        
+        start_time = time.time()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                await sync_to_async(self._on_failure, thread_sensitive=False)(probe)
+            else:
+                await sync_to_async(self._on_success, thread_sensitive=False)(
+                    time.time() - start_time, probe
+                )
+            raise
+        
+        await sync_to_async(self._on_success, thread_sensitive=False)(time.time() - start_time, probe)
+        return result
+    
+    @staticmethod
+    def is_failure(exc: Exception) -> bool:
+        """Client errors (4xx) mean the request was bad, not that the API is down"""
+        # requests' HTTPError carries response.status_code, aiohttp's ClientResponseError .status
+        status_code = getattr(getattr(exc, 'response', None), 'status_code', None)
+        if status_code is None:
+            status_code = getattr(exc, 'status', None)
+        return not (status_code is not None and 400 <= status_code < 500 and status_code != 429)
+    
+    def _before_call(self) -> bool:
+        """
+        Reject the call while OPEN, and during slow start beyond the current
+        ramp; returns True when the call is a HALF_OPEN probe
+        """
+        with self._lock:
+            if self.state == 'OPEN':
+                if self._should_attempt_reset():
+                    self.state = 'HALF_OPEN'
+                    self._probes_in_flight = 0
+                    self._probe_successes = 0
+                    api_logger.info(f"Circuit breaker '{self.name}' moving to HALF_OPEN state")
+                else:
+                    raise CircuitBreakerOpenError(
+                        f"Circuit breaker '{self.name}' is OPEN - API temporarily unavailable"
+                    )
+            
+            if self.state == 'HALF_OPEN':
+                if self._probes_in_flight >= self.half_open_max_probes:
+                    raise CircuitBreakerOpenError(
+                        f"Circuit breaker '{self.name}' is HALF_OPEN - probe limit reached"
+                    )
+                self._probes_in_flight += 1
+                return True
+            
+            closed_at = self.closed_at
+        
+        self._check_slow_start(closed_at)
+        return False
+    
+    def _check_slow_start(self, closed_at: Optional[float]):
+        """Admit a growing share of calls while the breaker has only just closed"""
+        if not closed_at or self.slow_start_duration <= 0:
+            return
+        elapsed = time.time() - closed_at
+        if elapsed >= self.slow_start_duration:
+            return
+        admit_rate = self.slow_start_min_rate + (1 - self.slow_start_min_rate) * (
+            elapsed / self.slow_start_duration
+        )
+        if random.random() >= admit_rate:
+            self.slow_start_rejections += 1
+            raise CircuitBreakerOpenError(
+                f"Circuit breaker '{self.name}' is ramping up after recovery - request shed"
+            )
+    
+    def _should_attempt_reset(self) -> bool:
+        """Check if enough time has passed to attempt reset"""
+        if self.last_failure_time is None:
+            return True
+        return time.time() - self.last_failure_time >= self.timeout
+    
+    def slow_call_rate(self) -> float:
+        """Share of slow calls in the recent window"""
+        if not self._recent_calls:
+            return 0.0
+        return sum(self._recent_calls) / len(self._recent_calls)
+    
+    def _on_success(self, duration: float, probe: bool = False):
+        """Handle successful API call"""
+        slow = duration >= self.slow_call_duration
+        with self._lock:
+            if probe and self.state == 'HALF_OPEN':
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if slow:
+                    self._open(f"slow probe ({duration:.1f}s)")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_probes:
+                    self._close()
+                return
+            
+            if self.state != 'CLOSED':
+                return
+            
+            self._recent_calls.append(slow)
+            if not slow:
+                self.failure_count = 0
+            elif (len(self._recent_calls) >= self.minimum_calls
+                    and self.slow_call_rate() >= self.slow_call_rate_threshold):
+                self._open(f"slow call rate {self.slow_call_rate():.0%}")
+    
+    def _on_failure(self, probe: bool = False):
+        """Handle failed API call"""
+        with self._lock:
+            self.failure_count += 1
+            self.last_failure_time = time.time()
+            
+            if probe and self.state == 'HALF_OPEN':
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                self._open("failed probe")
+            elif self.state == 'CLOSED' and self.failure_count >= self.failure_threshold:
+                self._open(f"{self.failure_count} failures")
+    
+    def _open(self, reason: str):
+        """Trip the breaker (called with the lock held)"""
+        self.state = 'OPEN'
+        self.last_failure_time = time.time()
+        api_logger.error(f"Circuit breaker '{self.name}' opened after {reason}")
+    
+    def _close(self):
+        """Close the breaker and start the slow-start ramp (called with the lock held)"""
+        self.state = 'CLOSED'
+        self.failure_count = 0
+        self.closed_at = time.time()
+        self._recent_calls.clear()
+        api_logger.info(f"Circuit breaker '{self.name}' reset to CLOSED state")
+    
+    def record_failure(self):
+        """Record a failure observed outside of ``call``"""
+        self._on_failure()
+    
+    def is_open(self) -> bool:
+        """True while calls would be rejected outright"""
+        return self.state == 'OPEN' and not self._should_attempt_reset()
+    
+    def reset(self):
+        """Force the breaker back to CLOSED, without a slow-start ramp"""
+        with self._lock:
+            self.state = 'CLOSED'
+            self.failure_count = 0
+            self.last_failure_time = None
+            self.closed_at = None
+            self._probes_in_flight = 0
+            self._recent_calls.clear()
+    
+    def get_stats(self) -> Dict:
+        return {
+            'state': self.state,
+            'failures': self.failure_count,
+            'last_failure_time': self.last_failure_time,
+            'slow_call_rate': round(self.slow_call_rate(), 3),
+            'slow_start_rejections': self.slow_start_rejections,
+        }
+
+
+class DistributedCircuitBreaker(CircuitBreaker):
+    """
+    Circuit breaker whose state lives in a Redis hash shared by every worker.
+    
+    Transitions run as Lua scripts so concurrent workers can't race each other
+    the way read-modify-write cache.get/cache.set does. Once the open timeout
+    has passed, at most ``half_open_max_probes`` calls are in flight across the
+    whole fleet. Falls back to the in-process breaker when Redis is unavailable.
+    
+    With ``sync_interval``, a worker trusts the CLOSED or OPEN state it last
+    read from Redis for that long and reports fast successes in batches, so
+    a healthy endpoint costs a couple of round trips per interval rather than
+    two per call. HALF_OPEN probes, slow calls and failures always go to Redis.
+    """
+    
+    KEY_PREFIX = 'circuit_breaker'
+    NAMES_KEY = 'circuit_breaker:names'
+    
+    BEFORE_CALL_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local timeout = tonumber(ARGV[2])
+    local state = redis.call('HGET', KEYS[1], 'state') or 'CLOSED'
+    if state == 'OPEN' then
+        local opened_at = tonumber(redis.call('HGET', KEYS[1], 'opened_at') or '0')
+        if now - opened_at < timeout then
+            return {'REJECT', state}
+        end
+        state = 'HALF_OPEN'
+        redis.call('HSET', KEYS[1], 'state', state, 'half_opened_at', ARGV[1],
+                   'probes', 0, 'probe_successes', 0)
+        redis.call('EXPIRE', KEYS[1], ARGV[4])
+    end
+    if state == 'HALF_OPEN' then
+        -- Free probe slots held by workers that died mid-call
+        local half_opened_at = tonumber(redis.call('HGET', KEYS[1], 'half_opened_at') or '0')
+        if now - half_opened_at >= timeout then
+            redis.call('HSET', KEYS[1], 'half_opened_at', ARGV[1], 'probes', 0)
+        end
+        local probes = tonumber(redis.call('HGET', KEYS[1], 'probes') or '0')
+        if probes >= tonumber(ARGV[3]) then
+            return {'REJECT', state}
+        end
+        redis.call('HINCRBY', KEYS[1], 'probes', 1)
+        return {'PROBE', state}
+    end
+    return {'ALLOW', state, redis.call('HGET', KEYS[1], 'closed_at') or '0'}
+    """
+    
+    # Records ARGV[9] successes, the last of them slow when ARGV[2] is '1'
+    SUCCESS_SCRIPT = """
+    local slow = ARGV[2] == '1'
+    local state = redis.call('HGET', KEYS[1], 'state') or 'CLOSED'
+    if ARGV[3] == '1' then
+        if state ~= 'HALF_OPEN' then
+            return {state, ''}
+        end
+        redis.call('HINCRBY', KEYS[1], 'probes', -1)
+        if slow then
+            redis.call('HSET', KEYS[1], 'state', 'OPEN', 'opened_at', ARGV[1])
+            return {'OPEN', 'slow probe'}
+        end
+        local successes = redis.call('HINCRBY', KEYS[1], 'probe_successes', 1)
+        if successes >= tonumber(ARGV[4]) then
+            redis.call('HSET', KEYS[1], 'state', 'CLOSED', 'closed_at', ARGV[1],
+                       'failures', 0, 'calls', 0, 'slow_calls', 0)
+            return {'CLOSED', 'closed'}
+        end
+        return {state, ''}
+    end
+    if state ~= 'CLOSED' then
+        return {state, ''}
+    end
+    local recorded = tonumber(ARGV[9])
+    local calls = redis.call('HINCRBY', KEYS[1], 'calls', recorded)
+    local slow_calls = tonumber(redis.call('HGET', KEYS[1], 'slow_calls') or '0')
+    if slow then
+        slow_calls = redis.call('HINCRBY', KEYS[1], 'slow_calls', 1)
+    end
+    if not slow or recorded > 1 then
+        redis.call('HSET', KEYS[1], 'failures', 0)
+    end
+    local window = tonumber(ARGV[5])
+    if calls >= window then
+        -- Halve the counters so the rate tracks recent calls
+        while calls >= window and calls > 0 do
+            calls = math.floor(calls / 2)
+            slow_calls = math.floor(slow_calls / 2)
+        end
+        redis.call('HSET', KEYS[1], 'calls', calls, 'slow_calls', slow_calls)
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[8])
+    if slow and calls >= tonumber(ARGV[6]) and slow_calls / calls >= tonumber(ARGV[7]) then
+        redis.call('HSET', KEYS[1], 'state', 'OPEN', 'opened_at', ARGV[1])
+        return {'OPEN', 'slow call rate'}
+    end
+    return {state, ''}
+    """
+    
+    FAILURE_SCRIPT = """
+    local state = redis.call('HGET', KEYS[1], 'state') or 'CLOSED'
+    if state == 'CLOSED' and tonumber(ARGV[5]) > 0 then
+        -- Successes batched since the last report came before this failure
+        redis.call('HINCRBY', KEYS[1], 'calls', ARGV[5])
+        redis.call('HSET', KEYS[1], 'failures', 0)
+    end
+    local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+    redis.call('HSET', KEYS[1], 'last_failure', ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    if ARGV[2] == '1' and state == 'HALF_OPEN' then
+        redis.call('HINCRBY', KEYS[1], 'probes', -1)
+        redis.call('HSET', KEYS[1], 'state', 'OPEN', 'opened_at', ARGV[1])
+        return {'OPEN', 'failed probe', failures}
+    end
+    if state == 'CLOSED' and failures >= tonumber(ARGV[3]) then
+        redis.call('HSET', KEYS[1], 'state', 'OPEN', 'opened_at', ARGV[1])
+        return {'OPEN', failures .. ' failures', failures}
+    end
+    return {state, '', failures}
+    """
+    
+    def __init__(self, *args, sync_interval: float = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key = f"{self.KEY_PREFIX}:{self.name}"
+        self.sync_interval = sync_interval
+        self._scripts = None
+        self._scripts_client = None
+        self._registered = False
+        # When the state was last read from Redis, and successes not reported yet
+        self._synced_at = 0.0
+        self._pending_successes = 0
+        self._reported_at = 0.0
+    
+    @property
+    def _state_ttl(self) -> int:
+        return int(max(self.timeout * 10, 3600))
+    
+    def _get_scripts(self):
+        """Registered Lua scripts for the current Redis client, or None"""
+        client = get_redis_connection()
+        if client is None:
+            return None
+        if self._scripts is None or self._scripts_client is not client:
+            self._scripts = {
+                'before': client.register_script(self.BEFORE_CALL_SCRIPT),
+                'success': client.register_script(self.SUCCESS_SCRIPT),
+                'failure': client.register_script(self.FAILURE_SCRIPT),
+            }
+            self._scripts_client = client
+        if not self._registered:
+            client.sadd(self.NAMES_KEY, self.name)
+            self._registered = True
+        return self._scripts
+    
+    def _run(self, script: str, args: list):
+        """Run a transition script; returns None when Redis can't be used"""
+        try:
+            scripts = self._get_scripts()
+            if scripts is None:
+                return None
+            result = scripts[script](keys=[self.key], args=args)
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Distributed circuit breaker '{self.name}' unavailable: {str(e)}")
+            return None
+        return [part.decode() if isinstance(part, bytes) else part for part in result]
+    
+    def _before_call(self) -> bool:
+        now = time.time()
+        if self.state != 'HALF_OPEN' and now - self._synced_at < self.sync_interval:
+            if self.state == 'OPEN':
+                raise CircuitBreakerOpenError(
+                    f"Circuit breaker '{self.name}' is OPEN - API temporarily unavailable"
+                )
+            self._check_slow_start(self.closed_at)
+            return False
+        
+        result = self._run('before', [now, self.timeout, self.half_open_max_probes, self._state_ttl])
+        if result is None:
+            return super()._before_call()
+        
+        decision, self.state = result[0], result[1]
+        self._synced_at = now
+        if decision == 'REJECT':
+            raise CircuitBreakerOpenError(
+                f"Circuit breaker '{self.name}' is {self.state} - API temporarily unavailable"
+            )
+        if decision == 'PROBE':
+            return True
+        
+        self.closed_at = float(result[2]) or None
+        self._check_slow_start(self.closed_at)
+        return False
+    
+    def _on_success(self, duration: float, probe: bool = False):
+        slow = duration >= self.slow_call_duration
+        now = time.time()
+        with self._lock:
+            self._pending_successes += 1
+            if not (slow or probe) and now - self._reported_at < self.sync_interval:
+                return
+            calls, self._pending_successes = self._pending_successes, 0
+            self._reported_at = now
+        result = self._run('success', [
+            now, int(slow), int(probe), self.half_open_max_probes,
+            self.window_size, self.minimum_calls, self.slow_call_rate_threshold,
+            self._state_ttl, calls
+        ])
+        if result is None:
+            return super()._on_success(duration, probe)
+        self._apply_transition(*result)
+    
+    def _on_failure(self, probe: bool = False):
+        self.last_failure_time = time.time()
+        with self._lock:
+            pending, self._pending_successes = self._pending_successes, 0
+        result = self._run('failure', [time.time(), int(probe), self.failure_threshold,
+                                       self._state_ttl, pending])
+        if result is None:
+            return super()._on_failure(probe)
+        self.failure_count = int(result[2])
+        self._apply_transition(result[0], result[1])
+    
+    def _apply_transition(self, state: str, event: str):
+        self.state = state
+        if event == 'closed':
+            self.failure_count = 0
+            self.closed_at = time.time()
+            api_logger.info(f"Circuit breaker '{self.name}' reset to CLOSED state")
+        elif event:
+            api_logger.error(f"Circuit breaker '{self.name}' opened after {event}")
+    
+    def _load(self) -> Dict:
+        """Current shared state, or an empty dict when Redis isn't used"""
+        client = get_redis_connection()
+        if client is None:
+            return {}
+        try:
+            raw = client.hgetall(self.key)
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Could not read circuit breaker '{self.name}': {str(e)}")
+            return {}
+        return {k.decode(): v.decode() for k, v in raw.items()}
+    
+    def is_open(self) -> bool:
+        data = self._load()
+        if not data:
+            return super().is_open()
+        opened_at = float(data.get('opened_at', 0))
+        return data.get('state') == 'OPEN' and time.time() - opened_at < self.timeout
+    
+    def reset(self):
+        super().reset()
+        self._synced_at = 0.0
+        with self._lock:
+            self._pending_successes = 0
+        client = get_redis_connection()
+        if client is not None:
+            try:
+                client.delete(self.key)
+            except Exception as e:
+                report_redis_error(e)
+                api_logger.warning(f"Could not reset circuit breaker '{self.name}': {str(e)}")
+    
+    def get_stats(self) -> Dict:
+        data = self._load()
+        if not data:
+            return super().get_stats()
+        calls = int(data.get('calls', 0))
+        self.state = data.get('state', 'CLOSED')
+        self.failure_count = int(data.get('failures', 0))
+        return {
+            'state': self.state,
+            'failures': self.failure_count,
+            'last_failure_time': float(data['last_failure']) if 'last_failure' in data else None,
+            'slow_call_rate': round(int(data.get('slow_calls', 0)) / calls, 3) if calls else 0.0,
+            'half_open_probes': int(data.get('probes', 0)),
+            'slow_start_rejections': self.slow_start_rejections,
+            'distributed': True,
+        }
+
+
+class LatencyHistogram:
+    """
+    Rolling latency histogram over log-spaced buckets (10ms to ~3 minutes,
+    25% apart). Samples go into the current window; when it is older than
+    ``window`` seconds it becomes the previous window, so percentiles always
+    cover the last one to two windows.
+    """
+    
+    BOUNDS = tuple(0.01 * 1.25 ** i for i in range(45))
+    
+    def __init__(self, window: float = 300):
+        self.window = window
+        self._current = [0] * (len(self.BOUNDS) + 1)
+        self._previous = [0] * (len(self.BOUNDS) + 1)
+        self._window_started = time.time()
+        self._lock = threading.Lock()
+    
+    def _rotate(self, now: float):
+        if now - self._window_started >= self.window:
+            # Skip straight to empty windows after a long idle period
+            idle = now - self._window_started >= 2 * self.window
+            self._previous = [0] * len(self._current) if idle else self._current
+            self._current = [0] * len(self._current)
+            self._window_started = now
+    
+    def record(self, seconds: float):
+        index = 0
+        while index < len(self.BOUNDS) and seconds > self.BOUNDS[index]:
+            index += 1
+        with self._lock:
+            self._rotate(time.time())
+            self._current[index] += 1
+    
+    def _counts(self) -> list:
+        with self._lock:
+            self._rotate(time.time())
+            return [a + b for a, b in zip(self._current, self._previous)]
+    
+    def count(self) -> int:
+        return sum(self._counts())
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile, None without samples"""
+        counts = self._counts()
+        total = sum(counts)
+        if not total:
+            return None
+        rank = total * p / 100.0
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                break
+        return self.BOUNDS[min(index, len(self.BOUNDS) - 1)]
+
+
+class TokenBudget:
+    """
+    Token bucket capping extra requests (retries, hedges) at a fraction of
+    regular ones: every regular request earns ``ratio`` of a token, up to
+    ``burst``, and every extra request spends a whole one
+    """
+    
+    def __init__(self, ratio: float = 0.1, burst: float = 10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = float(burst)
+        self._lock = threading.Lock()
+    
+    def earn(self):
+        with self._lock:
+            self.tokens = min(self.tokens + self.ratio, self.burst)
+    
+    def spend(self) -> bool:
+        with self._lock:
+            # Ten earnings of 0.1 add up to 0.999..., still a whole token
+            if self.tokens < 1 - TOKEN_EPSILON:
+                return False
+            self.tokens = max(self.tokens - 1, 0.0)
+            return True
+    
+    def get_tokens(self) -> float:
+        return self.tokens
+
+
+class DistributedTokenBudget(TokenBudget):
+    """
+    Token budget shared by every worker through a Redis key, so the fleet as
+    a whole stays within the ratio. Falls back to the in-process bucket when
+    Redis is unavailable. Earnings are added up locally and written at most
+    once per ``sync_interval``, or with the next spend.
+    """
+    
+    KEY_PREFIX = 'token_budget'
+    
+    # A missing key is a full bucket
+    EARN_SCRIPT = """
+    local tokens = tonumber(redis.call('GET', KEYS[1]) or ARGV[2])
+    tokens = math.min(tokens + tonumber(ARGV[1]), tonumber(ARGV[2]))
+    redis.call('SET', KEYS[1], tostring(tokens), 'EX', ARGV[3])
+    return tostring(tokens)
+    """
+    
+    # ARGV[4] is what the worker earned since its last write
+    SPEND_SCRIPT = """
+    local burst = tonumber(ARGV[1])
+    local tokens = math.min(tonumber(redis.call('GET', KEYS[1]) or ARGV[1]) + tonumber(ARGV[4]), burst)
+    if tokens < 1 - tonumber(ARGV[3]) then
+        if tonumber(ARGV[4]) > 0 then
+            redis.call('SET', KEYS[1], tostring(tokens), 'EX', ARGV[2])
+        end
+        return 0
+    end
+    redis.call('SET', KEYS[1], tostring(math.max(tokens - 1, 0)), 'EX', ARGV[2])
+    return 1
+    """
+    
+    STATE_TTL = 3600
+    
+    def __init__(self, name: str, *args, sync_interval: float = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key = f"{self.KEY_PREFIX}:{name}"
+        self.sync_interval = sync_interval
+        self._scripts = None
+        self._scripts_client = None
+        self._earned = 0.0
+        self._written_at = 0.0
+    
+    def _run(self, script: str, args: list):
+        """Run a bucket script; returns None when Redis can't be used"""
+        try:
+            client = get_redis_connection()
+            if client is None:
+                return None
+            if self._scripts is None or self._scripts_client is not client:
+                self._scripts = {
+                    'earn': client.register_script(self.EARN_SCRIPT),
+                    'spend': client.register_script(self.SPEND_SCRIPT),
+                }
+                self._scripts_client = client
+            return self._scripts[script](keys=[self.key], args=args)
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Distributed token budget '{self.key}' unavailable: {str(e)}")
+            return None
+    
+    def _take_earned(self) -> float:
+        """Earnings not written to Redis yet, resetting them"""
+        with self._lock:
+            earned, self._earned = self._earned, 0.0
+            self._written_at = time.time()
+        return earned
+    
+    def _earn_locally(self, earned: float):
+        with self._lock:
+            self.tokens = min(self.tokens + earned, self.burst)
+    
+    def earn(self):
+        with self._lock:
+            self._earned += self.ratio
+            if time.time() - self._written_at < self.sync_interval:
+                return
+        earned = self._take_earned()
+        if self._run('earn', [earned, self.burst, self.STATE_TTL]) is None:
+            self._earn_locally(earned)
+    
+    def spend(self) -> bool:
+        earned = self._take_earned()
+        result = self._run('spend', [self.burst, self.STATE_TTL, TOKEN_EPSILON, earned])
+        if result is None:
+            self._earn_locally(earned)
+            return super().spend()
+        return bool(int(result))
+    
+    def get_tokens(self) -> float:
+        client = get_redis_connection()
+        if client is not None:
+            try:
+                tokens = client.get(self.key)
+                tokens = float(tokens) if tokens is not None else float(self.burst)
+                return min(tokens + self._earned, self.burst)
+            except Exception as e:
+                report_redis_error(e)
+        return super().get_tokens()
+
+
+def _close_response(future):
+    """Release the connection of a hedged request that lost the race"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+@dataclass
+class CacheEnvelope:
+    """
+    Cached payload with freshness metadata.
+
+    Within ``soft_ttl`` the payload is fresh. Between ``soft_ttl`` and
+    ``hard_ttl`` it is served immediately while one refresh runs in the
+    background. ``delta`` is how long the last upstream fetch took and feeds
+    the probabilistic early refresh. ``etag`` and ``last_modified`` are the
+    upstream validators used to revalidate the payload with a conditional GET.
+    
+    Stored envelopes carry ``data`` encoded in ``payload``, with the codec tag
+    (``<name>:<version>``, see stream.codecs) in ``codec`` and, when the
+    payload is compressed, the compression tag (``zstd:<dictionary id>``,
+    see stream.compression) in ``compression``. When the listed records were
+    moved to the ItemStore, ``items`` holds their keys and ``data`` refers to
+    them until SmartCache puts them back.
+    """
+    data: Any
+    fetched_at: float
+    soft_ttl: float
+    hard_ttl: float
+    delta: float = 0.0
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    codec: Optional[str] = None
+    payload: Optional[bytes] = None
+    compression: Optional[str] = None
+    items: Optional[List[str]] = None
+    
+    def pack(self) -> 'CacheEnvelope':
+        """Copy for storage, with ``data`` encoded by the active codec and compressed"""
+        codec, payload = encode_payload(self.data)
+        compression, payload = compress_payload(payload)
+        return replace(self, data=None, codec=codec, payload=payload, compression=compression)
+    
+    def unpack(self) -> 'CacheEnvelope':
+        """
+        Copy with ``data`` decoded; raises KeyError for a codec or compression
+        dictionary this build doesn't have
+        """
+        if self.codec is None:
+            return self
+        payload = decompress_payload(self.compression, self.payload) if self.compression else self.payload
+        return replace(self, data=decode_payload(self.codec, payload), codec=None, payload=None,
+                       compression=None)
+    
+    def conditional_headers(self) -> Dict[str, str]:
+        """If-None-Match/If-Modified-Since headers for revalidating this payload"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+    
+    def age(self, now: float = None) -> float:
+        return (now or time.time()) - self.fetched_at
+    
+    def is_stale(self, now: float = None) -> bool:
+        """Past the soft TTL (but still within the hard TTL)"""
+        return self.age(now) >= self.soft_ttl
+    
+    def should_refresh_early(self, beta: float = 1.0, now: float = None) -> bool:
+        """
+        Probabilistic early expiration (XFetch): the closer the entry is to its
+        soft TTL, and the slower it is to recompute, the likelier a refresh
+        """
+        if beta <= 0 or self.delta <= 0:
+            return False
+        now = now or time.time()
+        # -log(random()) is exponentially distributed with mean 1
+        gap = -self.delta * beta * math.log(max(random.random(), 1e-12))
+        return now + gap >= self.fetched_at + self.soft_ttl
+
+
+class ItemStore:
+    """
+    Content-addressed store for the records (anime, episodes) that API
+    payloads list, so a card shown on the home pages, several latest pages,
+    the schedule and search results is cached once rather than once per page.
+    
+    Only the listing endpoints in ``lists`` are split, and only below the
+    fields named for them (e.g. ``new_eps`` on the home page): there, dicts in
+    lists that carry one of ``id_fields`` are items. Each is kept
+    under ``api_item:<stable ID hash>:<content hash>``; the page lists those
+    keys once and keeps an ``{'$item': <index in that list>}`` reference in
+    each item's place. An item's key changes with its
+    content, so entries are never rewritten or invalidated; they are written
+    straight to the shared tier, outlive the pages that refer to them by
+    ``ttl``, and are read back for a whole batch of pages with one get_many.
+    A page whose items were partly evicted is served without them.
+    """
+    
+    KEY_PREFIX = 'api_item'
+    REF = '$item'
+    
+    def __init__(self, cache_backend, shared_cache, id_fields: List[str],
+                 lists: Dict[str, List[str]], ttl: int):
+        self.cache = cache_backend
+        self.shared_cache = shared_cache
+        self.id_fields = list(id_fields)
+        self.lists = {endpoint.strip('/').lower(): set(fields) for endpoint, fields in lists.items()}
+        self.ttl = ttl
+        self.stats = {
+            'pages_split': 0,
+            'items_stored': 0,
+            'items_read': 0,
+            'items_missing': 0,
+            'pages_partial': 0,
+        }
+    
+    def _stable_id(self, item: Dict) -> Optional[str]:
+        for field in self.id_fields:
+            value = item.get(field)
+            if isinstance(value, (str, int)) and value != '':
+                return f"{field}={value}"
+        return None
+    
+    def split(self, data: Any, endpoint: str) -> Tuple[Any, Dict[str, Tuple[str, bytes]]]:
+        """
+        (skeleton, items): ``data`` of ``endpoint`` with its items replaced by
+        references, and each item's key mapped to its (codec tag, encoded
+        item), in the order the references index. ``data`` is left as it is.
+        """
+        fields = self.lists.get(endpoint.strip('/').lower())
+        if not self.id_fields or not fields:
+            return data, {}
+        items = {}
+        indexes = {}
+        
+        def walk(value, listed, selected):
+            if isinstance(value, dict):
+                stable_id = self._stable_id(value) if listed and selected else None
+                if stable_id is None:
+                    return {
+                        name: walk(child, False, selected or name in fields) for name, child in value.items()
+                    }
+                codec, payload = encode_payload(value)
+                key = (f"{self.KEY_PREFIX}:{hashlib.md5(stable_id.encode()).hexdigest()[:10]}:"
+                       f"{hashlib.blake2b(codec.encode() + payload, digest_size=6).hexdigest()}")
+                if key not in items:
+                    indexes[key] = len(items)
+                    items[key] = (codec, payload)
+                return {self.REF: indexes[key]}
+            if isinstance(value, list):
+                return [walk(child, True, selected) for child in value]
+            return value
+        
+        return walk(data, False, False), items
+    
+    def store(self, items: Dict[str, Tuple[str, bytes]], timeout: int):
+        """Write split items compressed, extending the life of the ones already stored"""
+        self.shared_cache.set_many(
+            {key: (codec, *compress_payload(payload)) for key, (codec, payload) in items.items()},
+            timeout=max(timeout, self.ttl)
+        )
+        self.stats['pages_split'] += 1
+        self.stats['items_stored'] += len(items)
+    
+    def fetch(self, keys: List[str]) -> Dict[str, Any]:
+        """Decoded items by key; missing or undecodable ones are left out"""
+        items = {}
+        for key, stored in self.cache.get_many(keys).items():
+            try:
+                codec, compression, payload = stored
+                if compression:
+                    payload = decompress_payload(compression, payload)
+                items[key] = decode_payload(codec, payload)
+            except Exception as e:
+                api_logger.info(f"Could not decode cached item {key}: {str(e)}")
+        self.stats['items_read'] += len(items)
+        self.stats['items_missing'] += len(keys) - len(items)
+        return items
+    
+    def rebuild(self, skeleton: Any, keys: List[str], items: Dict[str, Any]) -> Tuple[Any, int]:
+        """
+        (data, dropped): ``skeleton`` with its references to ``keys`` replaced
+        by ``items``; references to items that are missing are dropped from
+        their lists and counted
+        """
+        used = set()
+        dropped = 0
+        
+        def walk(value):
+            nonlocal dropped
+            if isinstance(value, dict):
+                return {name: walk(child) for name, child in value.items()}
+            if isinstance(value, list):
+                rebuilt = []
+                for child in value:
+                    if not (isinstance(child, dict) and len(child) == 1 and self.REF in child):
+                        rebuilt.append(walk(child))
+                        continue
+                    index = child[self.REF]
+                    key = keys[index] if isinstance(index, int) and 0 <= index < len(keys) else None
+                    if key not in items:
+                        dropped += 1
+                    elif key in used:
+                        # Each occurrence gets its own copy, views annotate items in place
+                        rebuilt.append(copy.deepcopy(items[key]))
+                    else:
+                        used.add(key)
+                        rebuilt.append(items[key])
+                return rebuilt
+            return value
+        
+        return walk(skeleton), dropped
+    
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+class SmartCache:
+    """
+    Advanced caching system with multiple cache layers and stale-while-revalidate.
+    
+    Each key holds a single CacheEnvelope that lives for the hard TTL, so stale
+    data stays available for fallback without a separate ``:stale`` copy.
+    
+    Keys are built from the endpoint and its normalized params, plus a
+    generation number for the endpoint and for the ``category`` param, e.g.
+    ``api_cache:api/v1/anime-detail:g7:anime:g3:<md5>``. Bumping a generation
+    invalidates every key in its namespace at once; the old entries are
+    never read again and expire on their own.
+    
+    Entries live in the API_CACHE_ALIAS cache, normally a TieredCache that
+    serves hot keys from process memory and keeps every worker's copy
+    coherent over Redis pub/sub. The records they list are kept once in the
+    ItemStore and put back on read.
+    """
+    
+    KEY_PREFIX = 'api_cache'
+    GENERATION_PREFIX = 'api_cache_generation'
+    
+    def __init__(self):
+        try:
+            self.default_cache = caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+        except InvalidCacheBackendError:
+            self.default_cache = cache
+        # Refresh claims must be seen by every worker at once, never from a local tier
+        self.shared_cache = getattr(self.default_cache, 'l2', self.default_cache)
+        self.hard_ttl = getattr(settings, 'API_CACHE_HARD_TTL', 86400)
+        self.ttl_jitter = getattr(settings, 'API_CACHE_TTL_JITTER', 0.1)
+        self.early_refresh_beta = getattr(settings, 'API_CACHE_EARLY_REFRESH_BETA', 1.0)
+        self.refresh_claim_timeout = 30
+        self.casefold_params = {
+            name.lower() for name in getattr(settings, 'API_CACHE_CASEFOLD_PARAMS', ['category'])
+        }
+        # A tiered cache already keeps generations in L1 and drops them when
+        # another worker bumps one, so there's no need to hold them here too
+        self.generation_ttl = 0 if isinstance(self.default_cache, TieredCache) \
+            else getattr(settings, 'API_CACHE_GENERATION_TTL', 2)
+        self._generations: Dict[str, Tuple[int, float]] = {}
+        self._generations_lock = threading.Lock()
+        # Listed records are stored once and shared by every page listing them,
+        # living until the last page that may refer to them has expired
+        self.items = ItemStore(
+            self.default_cache, self.shared_cache,
+            id_fields=getattr(settings, 'API_CACHE_ITEM_ID_FIELDS', []),
+            lists=getattr(settings, 'API_CACHE_ITEM_LISTS', {}),
+            ttl=math.ceil(self.hard_ttl * (1 + self.ttl_jitter))
+        )
+    
+    @staticmethod
+    def normalize_endpoint(endpoint: str) -> str:
+        """Endpoint path without gateway host, query or surrounding slashes"""
+        return urlsplit(endpoint).path.strip('/').lower()
+    
+    def _normalize_value(self, name: str, value: Any) -> str:
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        value = str(value).strip()
+        return value.lower() if name in self.casefold_params else value
+    
+    def normalize_params(self, params: Dict = None) -> List[Tuple[str, str]]:
+        """
+        Params as sorted (name, value) string pairs: names lower-cased, None
+        dropped, numbers and booleans written one way, and the values of
+        API_CACHE_CASEFOLD_PARAMS lower-cased. ``page=1`` and ``page='1'``
+        normalize the same.
+        """
+        normalized = []
+        for name, value in (params or {}).items():
+            name = str(name).strip().lower()
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple)) else [value]
+            normalized.extend((name, self._normalize_value(name, v)) for v in values if v is not None)
+        return sorted(normalized)
+    
+    def endpoint_namespace(self, endpoint: str) -> str:
+        return f"endpoint:{self.normalize_endpoint(endpoint)}"
+    
+    def category_namespace(self, category: str) -> str:
+        return f"category:{self._normalize_value('category', category)}"
+    
+    def _namespaces(self, endpoint: str, params: List[Tuple[str, str]]) -> List[str]:
+        """Generation namespaces a request's key belongs to"""
+        namespaces = [self.endpoint_namespace(endpoint)]
+        category = dict(params).get('category')
+        if category:
+            namespaces.append(self.category_namespace(category))
+        return namespaces
+    
+    def get_generations(self, namespaces: List[str]) -> Dict[str, int]:
+        """
+        Current generation of each namespace. Generations are kept in-process
+        for ``generation_ttl`` seconds, so key building rarely touches the
+        cache; the ones that expired are read in one get_many.
+        """
+        now = time.time()
+        generations = {}
+        with self._generations_lock:
+            for namespace in namespaces:
+                generation, fetched_at = self._generations.get(namespace, (None, 0))
+                if generation is not None and now - fetched_at < self.generation_ttl:
+                    generations[namespace] = generation
+        
+        missing = [namespace for namespace in dict.fromkeys(namespaces) if namespace not in generations]
+        if not missing:
+            return generations
+        
+        keys = {f"{self.GENERATION_PREFIX}:{namespace}": namespace for namespace in missing}
+        try:
+            found = self.default_cache.get_many(list(keys))
+            for key in keys:
+                if key not in found:
+                    # Start at the current time rather than 1, so a generation
+                    # lost from the cache can't come back lower than before
+                    self.default_cache.add(key, int(now), timeout=None)
+                    found[key] = self.default_cache.get(key, int(now))
+        except Exception as e:
+            api_logger.warning(f"Cache generations unavailable: {str(e)}")
+            found = {}
+        
+        with self._generations_lock:
+            for key, namespace in keys.items():
+                generation = int(found.get(key) or 0)
+                self._generations[namespace] = (generation, now)
+                generations[namespace] = generation
+        return generations
+    
+    def bump_generation(self, namespace: str) -> int:
+        """Invalidate every key in a namespace (``endpoint:<path>`` or ``category:<name>``)"""
+        key = f"{self.GENERATION_PREFIX}:{namespace}"
+        self.default_cache.add(key, int(time.time()), timeout=None)
+        generation = self.default_cache.incr(key)
+        with self._generations_lock:
+            self._generations[namespace] = (generation, time.time())
+        return generation
+    
+    def get_cache_keys(self, requests: List[Tuple[str, Dict]]) -> List[str]:
+        """Cache keys for (endpoint, params) pairs, reading their generations together"""
+        prepared = []
+        for endpoint, params in requests:
+            endpoint = self.normalize_endpoint(endpoint)
+            normalized = self.normalize_params(params)
+            prepared.append((endpoint, normalized, self._namespaces(endpoint, normalized)))
+        generations = self.get_generations(
+            [namespace for _, _, namespaces in prepared for namespace in namespaces]
+        )
+        
+        keys = []
+        for endpoint, normalized, namespaces in prepared:
+            parts = [self.KEY_PREFIX, endpoint, f"g{generations[namespaces[0]]}"]
+            if len(namespaces) > 1:
+                parts += [dict(normalized)['category'], f"g{generations[namespaces[1]]}"]
+            parts.append(hashlib.md5(urlencode(normalized).encode()).hexdigest())
+            keys.append(':'.join(parts))
+        return keys
+    
+    def get_cache_key(self, endpoint: str, params: Dict = None) -> str:
+        """
+        Canonical cache key for an endpoint (a path or full URL; the gateway
+        host is ignored) and its params
+        """
+        return self.get_cache_keys([(endpoint, params)])[0]
+    
+    def _jitter(self, ttl: float) -> float:
+        """Spread TTLs so keys written together don't expire in lockstep"""
+        if not self.ttl_jitter:
+            return ttl
+        return ttl * random.uniform(1 - self.ttl_jitter, 1 + self.ttl_jitter)
+    
+    def get_envelope(self, key: str) -> Optional[CacheEnvelope]:
+        """Get the cache envelope for a key, or None on a miss"""
+        envelope = self._load(key, self.default_cache.get(key))
+        if envelope is None:
+            return None
+        return self._attach_items({key: envelope}).get(key)
+    
+    def _load(self, key: str, envelope: Any) -> Optional[CacheEnvelope]:
+        """Decode a stored envelope; entries this build can't decode count as misses"""
+        if envelope is None:
+            return None
+        
+        if not isinstance(envelope, CacheEnvelope):
+            # Entry written before envelopes existed: serve it, but as stale
+            return CacheEnvelope(data=envelope, fetched_at=0, soft_ttl=0, hard_ttl=self.hard_ttl)
+        
+        try:
+            return envelope.unpack()
+        except KeyError:
+            api_logger.info(f"Cache entry {key} uses unknown codec {envelope.codec}, treating as a miss")
+        except Exception as e:
+            api_logger.warning(f"Could not decode cache entry {key}: {str(e)}")
+        return None
+    
+    def _attach_items(self, envelopes: Dict[str, CacheEnvelope]) -> Dict[str, CacheEnvelope]:
+        """
+        Put the shared items back into envelopes that refer to them, reading
+        all of them in one get_many. An envelope missing some items is served
+        with what is left, as stale so a refresh stores them again.
+        """
+        keys = sorted({key for envelope in envelopes.values() for key in envelope.items or ()})
+        if not keys:
+            return envelopes
+        items = self.items.fetch(keys)
+        complete = {}
+        for key, envelope in envelopes.items():
+            if envelope.items:
+                data, dropped = self.items.rebuild(envelope.data, envelope.items, items)
+                if dropped:
+                    self.items.stats['pages_partial'] += 1
+                    api_logger.info(f"Cache entry {key} refers to {dropped} evicted items, "
+                                    f"serving it without them")
+                    envelope = replace(envelope, data=data, items=None, soft_ttl=0)
+                else:
+                    envelope = replace(envelope, data=data, items=None)
+            complete[key] = envelope
+        return complete
+    
+    def key_endpoint(self, key: str) -> str:
+        """The normalized endpoint a cache key was built for"""
+        return key.split(':', 2)[1]
+    
+    def get_envelopes(self, keys: List[str]) -> Dict[str, CacheEnvelope]:
+        """Batched get_envelope in one get_many"""
+        return self.read(keys)[0]
+    
+    def read(self, keys: List[str],
+             related: List[str] = ()) -> Tuple[Dict[str, CacheEnvelope], Dict[str, Any]]:
+        """
+        Envelopes for ``keys`` plus other entries that belong to the same
+        requests (e.g. their negative entries), in one round trip. With a
+        tiered cache only what L1 doesn't hold is read from Redis, and
+        ``related`` is only read alongside envelopes that miss L1; entries
+        that weren't read are left out of the related values.
+        """
+        if isinstance(self.default_cache, TieredCache):
+            found, related_values = self.default_cache.get_many_with(keys, related)
+        else:
+            found = self.default_cache.get_many(list(keys) + list(related)) if keys else {}
+            related_values = {key: found.pop(key, None) for key in related}
+        
+        envelopes = {}
+        for key, stored in found.items():
+            envelope = self._load(key, stored)
+            if envelope is not None:
+                envelopes[key] = envelope
+        return self._attach_items(envelopes), related_values
+    
+    def get(self, key: str) -> Tuple[Any, bool]:
+        """Get data from cache, return (data, is_stale)"""
+        envelope = self.get_envelope(key)
+        if envelope is None:
+            return None, False
+        return envelope.data, envelope.is_stale()
+    
+    def set(self, key: str, data: Any, timeout: int = 300, delta: float = 0.0,
+            etag: str = None, last_modified: str = None) -> CacheEnvelope:
+        """Store data in an envelope that stays fresh for ``timeout`` seconds"""
+        soft_ttl = self._jitter(timeout)
+        hard_ttl = max(self._jitter(self.hard_ttl), soft_ttl)
+        envelope = CacheEnvelope(
+            data=data,
+            fetched_at=time.time(),
+            soft_ttl=soft_ttl,
+            hard_ttl=hard_ttl,
+            delta=delta,
+            etag=etag,
+            last_modified=last_modified
+        )
+        
+        # Items first, so no reader finds the page before what it refers to
+        stored = envelope
+        skeleton, items = self.items.split(data, self.key_endpoint(key))
+        if items:
+            self.items.store(items, timeout=int(hard_ttl))
+            stored = replace(envelope, data=skeleton, items=list(items))
+        self.default_cache.set(key, stored.pack(), timeout=int(hard_ttl))
+        return envelope
+    
+    def revalidate(self, key: str, envelope: CacheEnvelope, timeout: int = 300,
+                   delta: float = 0.0) -> CacheEnvelope:
+        """Upstream answered 304: keep the payload and validators, restart the TTLs"""
+        return self.set(key, envelope.data, timeout=timeout, delta=delta,
+                        etag=envelope.etag, last_modified=envelope.last_modified)
+    
+    def claim_refresh(self, key: str, timeout: int = None) -> bool:
+        """
+        Atomically claim the right to refresh a key, so only one worker
+        schedules a refresh per stale period
+        """
+        try:
+            return bool(self.shared_cache.add(f"{key}:refreshing", 1,
+                                              timeout=timeout or self.refresh_claim_timeout))
+        except Exception:
+            return True
+    
+    def release_refresh(self, key: str, envelope: Optional[CacheEnvelope] = None):
+        """
+        Release a refresh claim. Given the envelope the refresh just stored,
+        the claim is left to expire when it lapses before that envelope can go
+        stale, saving the extra write.
+        """
+        if envelope is not None and envelope.soft_ttl > self.refresh_claim_timeout:
+            return
+        self.shared_cache.delete(f"{key}:refreshing")
+    
+    def delete(self, key: str):
+        """Delete from every tier (and every worker's L1)"""
+        self.default_cache.delete(key)
+    
+    def get_stats(self) -> Dict:
+        """Per-tier hit counts and ratios, when the cache is tiered"""
+        get_stats = getattr(self.default_cache, 'get_stats', None)
+        return get_stats() if get_stats else None
+
+
+class NegativeCache:
+    """
+    Short-lived cache of upstream answers that carry no content: 4xx
+    responses and empty results. Bots asking for nonexistent slugs or
+    nonsense queries are answered from here instead of the gateway.
+    
+    Entries live in the default cache next to the response they stand in
+    for (``<key>:negative``), so SmartCache.read can fetch both in one round
+    trip. With Redis, a sorted-set index by expiry holds at most
+    ``max_entries``; the entries closest to expiring are evicted first,
+    through the cache API so a tiered cache drops them from every worker's
+    L1 too. Without Redis the default cache's own culling bounds them.
+    """
+    
+    INDEX_KEY = 'negative_cache:index'
+    
+    # Only touches the index; returns the cache keys of the evicted entries,
+    # which the caller deletes through the cache
+    INDEX_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local ttl = tonumber(ARGV[3])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    redis.call('ZADD', KEYS[1], now + ttl, ARGV[2])
+    if redis.call('TTL', KEYS[1]) < ttl then
+        redis.call('EXPIRE', KEYS[1], ttl)
+    end
+    local excess = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[4])
+    if excess <= 0 then
+        return {}
+    end
+    local evicted = redis.call('ZRANGE', KEYS[1], 0, excess - 1)
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, excess - 1)
+    return evicted
+    """
+    
+    def __init__(self, ttl: int = 60, max_entries: int = 10000, cache_backend=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache = cache_backend or cache
+        self._script = None
+        self._script_client = None
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stored': 0,
+            'evicted': 0,
+        }
+    
+    @staticmethod
+    def key(key: str) -> str:
+        """Default-cache key of the negative entry for a response cache key"""
+        return f"{key}:negative"
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """The negative entry ({'status_code', 'data'}) for a response cache key, or None"""
+        entry = None
+        try:
+            entry = self.cache.get(self.key(key))
+        except Exception as e:
+            api_logger.warning(f"Negative cache read failed: {str(e)}")
+        return self.record(entry)
+    
+    def record(self, entry: Optional[Dict]) -> Optional[Dict]:
+        """Count a lookup whose entry was read elsewhere (SmartCache.read)"""
+        self.stats['hits' if entry is not None else 'misses'] += 1
+        return entry
+    
+    def set(self, key: str, status_code: int, data: Any, ttl: Optional[int] = None):
+        ttl = int(ttl or self.ttl)
+        try:
+            self.cache.set(self.key(key), {'status_code': status_code, 'data': data}, timeout=ttl)
+            self.stats['stored'] += 1
+        except Exception as e:
+            api_logger.warning(f"Negative cache write failed: {str(e)}")
+            return
+        
+        client = get_redis_connection()
+        if client is None:
+            return
+        try:
+            if self._script is None or self._script_client is not client:
+                self._script = client.register_script(self.INDEX_SCRIPT)
+                self._script_client = client
+            evicted = self._script(
+                keys=[self.INDEX_KEY],
+                args=[time.time(), self.key(key), ttl, self.max_entries]
+            )
+            if evicted:
+                self.cache.delete_many([k.decode() if isinstance(k, bytes) else k for k in evicted])
+                self.stats['evicted'] += len(evicted)
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Negative cache index update failed: {str(e)}")
+    
+    def delete(self, key: str):
+        client = get_redis_connection()
+        try:
+            # Through the cache, so a tiered cache drops it from every worker's L1
+            self.cache.delete(self.key(key))
+            if client is not None:
+                client.zrem(self.INDEX_KEY, self.key(key))
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Negative cache delete failed: {str(e)}")
+    
+    def get_stats(self) -> Dict:
+        client = get_redis_connection()
+        try:
+            entries = client.zcard(self.INDEX_KEY) if client is not None else None
+        except Exception as e:
+            report_redis_error(e)
+            entries = None
+        return {**self.stats, 'entries': entries, 'max_entries': self.max_entries}
+
+
+class _InFlightCall:
+    """A fetch in progress that other threads can wait on"""
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """
+    Request coalescing for cache misses.
+
+    Within a process, concurrent callers for the same key wait on one in-flight
+    fetch. Across workers, a short Redis lease elects one fetcher; the others
+    poll the cache for its result and only fetch themselves if the lease holder
+    doesn't deliver in time.
+    """
+
+    LEASE_PREFIX = 'singleflight'
+
+    # Compare-and-delete so a worker never releases a lease it no longer owns
+    RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, lease_timeout: float = 10, wait_timeout: float = 5,
+                 poll_interval: float = 0.05):
+        self.lease_timeout = lease_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self.stats = {
+            'leaders': 0,
+            'coalesced_local': 0,
+            'coalesced_remote': 0,
+            'lease_wait_timeouts': 0,
+        }
+
+    def do(self, key: str, fetch, poll=None, use_lease: bool = True):
+        """
+        Run ``fetch()`` once per key across concurrent callers.
+
+        ``poll()`` is used while another worker holds the lease and should
+        return a result (or None) from the shared cache.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                call = _InFlightCall()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            if call.event.wait(cap(self.wait_timeout + self.lease_timeout)) and call.result is not None:
+                self.stats['coalesced_local'] += 1
+                return copy.deepcopy(call.result)
+            # Leader took too long or failed without a result, fetch ourselves
+            return fetch()
+
+        try:
+            self.stats['leaders'] += 1
+            call.result = self._fetch_with_lease(key, fetch, poll) if use_lease else fetch()
+            return call.result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def acquire_lease(self, key: str) -> Optional[str]:
+        """
+        Try to become the cross-worker fetcher for a key. Returns the lease
+        token, '' when no lease is needed (no Redis), or None if another
+        worker holds it
+        """
+        client = get_redis_connection()
+        if client is None:
+            return ''
+        token = uuid.uuid4().hex
+        try:
+            acquired = client.set(f"{self.LEASE_PREFIX}:{key}", token, nx=True,
+                                  px=int(self.lease_timeout * 1000))
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Single-flight lease unavailable for {key}: {str(e)}")
+            return ''
+        return token if acquired else None
+
+    def release_lease(self, key: str, token: str):
+        if not token:
+            return
+        lease_key = f"{self.LEASE_PREFIX}:{key}"
+        try:
+            client = get_redis_connection()
+            if client is not None:
+                client.eval(self.RELEASE_SCRIPT, 1, lease_key, token)
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Failed to release single-flight lease {lease_key}: {str(e)}")
+
+    def _fetch_with_lease(self, key: str, fetch, poll):
+        """Fetch while holding the cross-worker lease, or wait for the holder"""
+        token = self.acquire_lease(key)
+        if token is not None:
+            try:
+                return fetch()
+            finally:
+                self.release_lease(key, token)
+
+        # Another worker is fetching, wait for its result to land in the cache
+        if poll is not None:
+            deadline = time.time() + cap(self.wait_timeout)
+            while time.time() < deadline:
+                result = poll()
+                if result is not None:
+                    self.stats['coalesced_remote'] += 1
+                    return result
+                time.sleep(self.poll_interval)
+
+        self.stats['lease_wait_timeouts'] += 1
+        api_logger.info(f"Single-flight wait timed out for {key}, fetching directly")
+        return fetch()
+
+
+class RefreshExecutor:
+    """
+    Bounded pool for background cache refreshes.
+
+    A fixed number of worker threads drain a bounded queue. A key that is
+    already queued or running is not queued again, and when the queue is full
+    new refreshes are dropped (the stale copy keeps being served). Workers are
+    started lazily so nothing is spawned before gunicorn forks.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 100,
+                 shutdown_timeout: float = 5):
+        self.max_workers = max_workers
+        self.shutdown_timeout = shutdown_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._shutdown = False
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'dropped_duplicate': 0,
+            'dropped_full': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0,
+        }
+
+    def submit(self, key: str, fn, on_drop=None) -> bool:
+        """Queue ``fn`` to refresh ``key``; returns False if it was dropped"""
+        with self._lock:
+            if self._shutdown:
+                if on_drop:
+                    on_drop()
+                return False
+            if key in self._pending:
+                self.stats['dropped_duplicate'] += 1
+                return False
+            self._ensure_workers()
+            try:
+                self._queue.put_nowait((key, fn))
+            except queue.Full:
+                self.stats['dropped_full'] += 1
+                api_logger.warning(f"Refresh queue full, dropping refresh for {key}")
+                if on_drop:
+                    on_drop()
+                return False
+            self._pending.add(key)
+            self.stats['submitted'] += 1
+            return True
+
+    def _ensure_workers(self):
+        """Start worker threads in the current process (called with the lock held)"""
+        pid = os.getpid()
+        if self._pid == pid and self._threads:
+            return
+        # Threads don't survive fork, start a fresh set in this process
+        self._pid = pid
+        self._threads = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"api-refresh-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            key, fn = item
+            start_time = time.time()
+            outcome = 'failed'
+            try:
+                fn()
+                outcome = 'completed'
+            except Exception as e:
+                api_logger.warning(f"Background refresh for {key} raised: {str(e)}")
+            finally:
+                latency = time.time() - start_time
+                # Workers finish concurrently, count under the lock so no update is lost
+                with self._lock:
+                    self.stats[outcome] += 1
+                    self.stats['total_latency'] += latency
+                    self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+                    self._pending.discard(key)
+                self._queue.task_done()
+
+    def shutdown(self, timeout: float = None):
+        """Stop accepting work and give running refreshes time to finish"""
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            threads = self._threads if self._pid == os.getpid() else []
+        
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=max(deadline - time.time(), 0.01))
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(max(deadline - time.time(), 0))
+        
+        unfinished = self._queue.qsize()
+        if unfinished:
+            api_logger.info(f"Refresh executor shut down with {unfinished} refreshes still queued")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            in_flight = len(self._pending)
+        finished = stats['completed'] + stats['failed']
+        return {
+            **stats,
+            'queue_depth': self._queue.qsize(),
+            'in_flight': in_flight,
+            'avg_latency': stats['total_latency'] / finished if finished else 0,
+        }
+
+
+class AdmissionController:
+    """
+    Limits upstream calls before they reach the gateway.
+
+    Each process holds at most ``max_concurrency`` calls. Across the fleet,
+    each endpoint class (``classes`` maps class names to endpoints, anything
+    else is 'default') is limited to ``limits[class]['concurrency']``
+    concurrent calls and ``limits[class]['rate']`` calls per second, tracked
+    in Redis. A call that can't be admitted within ``queue_timeout`` raises
+    AdmissionRejected so the caller serves stale data or a fast error.
+    Without Redis only the per-process limit applies.
+    
+    Released leases are removed from Redis along with the next acquire, or
+    on their own once ``sync_interval`` has passed since the last removal,
+    so a call costs about one round trip instead of two. The last leases
+    released before a worker goes idle hold their slots until they expire.
+    """
+    
+    KEY_PREFIX = 'admission'
+    
+    # Leases of calls in flight live in a sorted set scored by expiry, so slots
+    # held by dead workers free themselves; the rate is a per-second counter.
+    # KEYS[3...] and ARGV[6...] are lease sets and tokens this worker released
+    ACQUIRE_SCRIPT = """
+    for i = 3, #KEYS do
+        redis.call('ZREM', KEYS[i], ARGV[i + 3])
+    end
+    local now = tonumber(ARGV[1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    local concurrency = tonumber(ARGV[3])
+    if concurrency > 0 and redis.call('ZCARD', KEYS[1]) >= concurrency then
+        return 'concurrency'
+    end
+    local rate = tonumber(ARGV[4])
+    if rate > 0 then
+        if tonumber(redis.call('GET', KEYS[2]) or '0') >= rate then
+            return 'rate'
+        end
+        redis.call('INCR', KEYS[2])
+        redis.call('EXPIRE', KEYS[2], 2)
+    end
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[5])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 'ok'
+    """
+    
+    def __init__(self, max_concurrency: int = 32, limits: Dict = None, classes: Dict = None,
+                 queue_timeout: float = 0.5, lease_ttl: float = 30, poll_interval: float = 0.02,
+                 sync_interval: float = 0):
+        self.max_concurrency = max_concurrency
+        self.limits = limits or {}
+        self.endpoint_classes = {
+            endpoint.strip('/'): name
+            for name, endpoints in (classes or {}).items()
+            for endpoint in endpoints
+        }
+        self.queue_timeout = queue_timeout
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.sync_interval = sync_interval
+        # Process slots are only ever taken without blocking, so a counter does
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._script = None
+        self._script_client = None
+        # (lease set, token) of released leases still in Redis
+        self._released: List[Tuple[str, str]] = []
+        self._released_sent_at = 0.0
+        self.stats = {
+            'admitted': 0,
+            'rejected_process': 0,
+            'rejected_concurrency': 0,
+            'rejected_rate': 0,
+        }
+    
+    def endpoint_class(self, endpoint: str) -> str:
+        return self.endpoint_classes.get(endpoint.strip('/'), 'default')
+    
+    def _take_released(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            released, self._released = self._released, []
+            self._released_sent_at = time.time()
+        return released
+    
+    def _acquire_global(self, endpoint_class: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Try to take a fleet-wide slot. Returns (token, None) when admitted,
+        (None, reason) when the class is at its concurrency or rate limit, and
+        (None, None) when Redis can't be used.
+        """
+        limits = self.limits.get(endpoint_class) or self.limits.get('default') or {}
+        if not limits:
+            return None, None
+        try:
+            client = get_redis_connection()
+            if client is None:
+                return None, None
+            if self._script is None or self._script_client is not client:
+                self._script = client.register_script(self.ACQUIRE_SCRIPT)
+                self._script_client = client
+            now = time.time()
+            token = uuid.uuid4().hex
+            key = f"{self.KEY_PREFIX}:{endpoint_class}"
+            released = self._take_released()
+            result = self._script(
+                keys=[f"{key}:leases", f"{key}:rate:{int(now)}"] + [lease_set for lease_set, _ in released],
+                args=[now, self.lease_ttl, limits.get('concurrency', 0), limits.get('rate', 0), token]
+                     + [released_token for _, released_token in released]
+            )
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Fleet admission control unavailable: {str(e)}")
+            return None, None
+        result = result.decode() if isinstance(result, bytes) else result
+        return (token, None) if result == 'ok' else (None, result)
+    
+    def _release_global(self, endpoint_class: str, token: Optional[str]):
+        if token is None:
+            return
+        with self._lock:
+            self._released.append((f"{self.KEY_PREFIX}:{endpoint_class}:leases", token))
+            if time.time() - self._released_sent_at < self.sync_interval:
+                return
+        released = self._take_released()
+        try:
+            client = get_redis_connection()
+            if client is not None and released:
+                pipe = client.pipeline(transaction=False)
+                for lease_set, released_token in released:
+                    pipe.zrem(lease_set, released_token)
+                pipe.execute()
+        except Exception as e:
+            report_redis_error(e)
+            api_logger.warning(f"Could not release admission leases: {str(e)}")
+    
+    def try_acquire(self, endpoint: str, reasons: Optional[set] = None) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Take a process slot and a fleet slot without waiting. Returns the
+        admission to pass to release(), or None; ``reasons`` collects why.
+        """
+        with self._lock:
+            if self.in_flight >= self.max_concurrency:
+                if reasons is not None:
+                    reasons.add('process')
+                return None
+            self.in_flight += 1
+        endpoint_class = self.endpoint_class(endpoint)
+        token, reason = self._acquire_global(endpoint_class)
+        if reason is not None:
+            self._release_local()
+            if reasons is not None:
+                reasons.add(reason)
+            return None
+        return endpoint_class, token
+    
+    def _reject(self, endpoint: str, reasons: set):
+        reason = 'rate' if 'rate' in reasons else 'concurrency' if 'concurrency' in reasons else 'process'
+        self.stats[f'rejected_{reason}'] += 1
+        raise AdmissionRejected(f"Upstream {reason} limit reached for {endpoint}")
+    
+    def acquire(self, endpoint: str, timeout: Optional[float] = None):
+        """Wait up to ``timeout`` (default queue_timeout, capped to the deadline) for admission"""
+        reasons = set()
+        wait_until = time.time() + cap(self.queue_timeout if timeout is None else timeout)
+        while True:
+            admission = self.try_acquire(endpoint, reasons)
+            if admission is not None:
+                self.stats['admitted'] += 1
+                return admission
+            if time.time() + self.poll_interval > wait_until:
+                self._reject(endpoint, reasons)
+            time.sleep(self.poll_interval)
+    
+    async def aacquire(self, endpoint: str, timeout: Optional[float] = None):
+        """Async counterpart of acquire(); Redis is checked off the event loop"""
+        reasons = set()
+        wait_until = time.time() + cap(self.queue_timeout if timeout is None else timeout)
+        while True:
+            admission = await sync_to_async(self.try_acquire, thread_sensitive=False)(endpoint, reasons)
+            if admission is not None:
+                self.stats['admitted'] += 1
+                return admission
+            if time.time() + self.poll_interval > wait_until:
+                self._reject(endpoint, reasons)
+            await asyncio.sleep(self.poll_interval)
+    
+    def _release_local(self):
+        with self._lock:
+            if self.in_flight <= 0:
+                raise ValueError("Admission released more times than acquired")
+            self.in_flight -= 1
+    
+    def release(self, admission: Tuple[str, Optional[str]]):
+        endpoint_class, token = admission
+        self._release_global(endpoint_class, token)
+        self._release_local()
+    
+    @contextmanager
+    def admit(self, endpoint: str, timeout: Optional[float] = None):
+        admission = self.acquire(endpoint, timeout)
+        try:
+            yield
+        finally:
+            self.release(admission)
+    
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'limits': self.limits,
+        }
 
 
-class CircuitBreaker:
+class Gateway:
     """
-    Circuit breaker implementation to handle API failures gracefully
+    One upstream gateway: EWMA of its response times, requests in flight and
+    passive health. ``failure_threshold`` consecutive failures (connection
+    errors, timeouts, 5xx) open its breaker for ``eject_time`` seconds; after
+    that it takes traffic again and one more failure reopens it.
     """
     
-    def __init__(self, failure_threshold: int = 10, timeout: int = 300):
+    def __init__(self, base_url: str, alpha: float = 0.3, failure_threshold: int = 5,
+                 eject_time: float = 30, latency_window: float = 300):
+        self.base_url = base_url.rstrip('/')
+        parts = urlsplit(self.base_url)
+        self.address = (parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        # Time to open a new connection, drives the adaptive connect timeout
+        self.connect_latency = LatencyHistogram(window=latency_window)
+        self.alpha = alpha
         self.failure_threshold = failure_threshold
-        self.timeout = timeout
-        self.failure_count = 0
-        self.last_failure_time = None
-        self.state = 'CLOSED'  # CLOSED, OPEN, HALF_OPEN
+        self.eject_time = eject_time
+        self.ewma: Optional[float] = None
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
         self._lock = threading.Lock()
     
-    def call(self, func, *args, **kwargs):
-        """Execute function with circuit breaker protection"""
-        with self._lock:
-            if self.state == 'OPEN':
-                if self._should_attempt_reset():
-                    self.state = 'HALF_OPEN'
-                    api_logger.info("Circuit breaker moving to HALF_OPEN state")
-                else:
-                    raise Exception("Circuit breaker is OPEN - API temporarily unavailable")
-            
-            try:
-                result = func(*args, **kwargs)
-                self._on_success()
-                return result
-            except Exception as e:
-                self._on_failure()
-                raise e
+    def is_available(self) -> bool:
+        return time.time() >= self.ejected_until
     
-    def _should_attempt_reset(self) -> bool:
-        """Check if enough time has passed to attempt reset"""
-        if self.last_failure_time is None:
-            return True
-        return time.time() - self.last_failure_time >= self.timeout
+    def score(self) -> float:
+        """Expected wait: lower is better. Unmeasured gateways score 0 so they get tried."""
+        return (self.ewma or 0.0) * (self.in_flight + 1)
     
-    def _on_success(self):
-        """Handle successful API call"""
-        self.failure_count = 0
-        self.state = 'CLOSED'
-        api_logger.info("Circuit breaker reset to CLOSED state")
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
     
-    def _on_failure(self):
-        """Handle failed API call"""
-        self.failure_count += 1
-        self.last_failure_time = time.time()
-        
-        if self.failure_count >= self.failure_threshold:
-            self.state = 'OPEN'
-            api_logger.error(f"Circuit breaker opened after {self.failure_count} failures")
+    def end(self, latency: Optional[float], failed: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if latency is not None:
+                self.ewma = latency if self.ewma is None else (
+                    self.alpha * latency + (1 - self.alpha) * self.ewma
+                )
+            if not failed:
+                self.consecutive_failures = 0
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold and self.is_available():
+                self.ejected_until = time.time() + self.eject_time
+                api_logger.error(
+                    f"Gateway {self.base_url} ejected for {self.eject_time}s after "
+                    f"{self.consecutive_failures} consecutive failures"
+                )
+    
+    def get_stats(self) -> Dict:
+        connect_p99 = self.connect_latency.percentile(99)
+        return {
+            'state': 'CLOSED' if self.is_available() else 'OPEN',
+            'ewma_ms': round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'connects': self.connect_latency.count(),
+            'connect_p99_ms': round(connect_p99 * 1000, 1) if connect_p99 is not None else None,
+        }
 
 
-class SmartCache:
+class GatewayPool:
     """
-    Advanced caching system with multiple cache layers and stale-while-revalidate
+    Routes requests across gateways with power-of-two-choices: two random
+    healthy gateways are compared and the one with the lower score wins.
+    URLs are built on the first (canonical) gateway, so cache keys don't
+    depend on which gateway serves a request, and rebased at send time.
     """
     
-    def __init__(self):
-        self.default_cache = cache
-        try:
-            self.fast_cache = caches['fast']
-        except KeyError:
-            self.fast_cache = cache
-    
-    def get_cache_key(self, url: str, params: Dict = None) -> str:
-        """Generate consistent cache key"""
-        if params:
-            # Sort params for consistent key generation
-            sorted_params = sorted(params.items())
-            param_string = urlencode(sorted_params)
-            key_data = f"{url}?{param_string}"
-        else:
-            key_data = url
-        
-        # Create hash for long URLs
-        key_hash = hashlib.md5(key_data.encode()).hexdigest()
-        return f"api_cache:{key_hash}"
+    def __init__(self, base_urls: List[str], **gateway_kwargs):
+        self.gateways = [Gateway(url, **gateway_kwargs) for url in base_urls]
+        self.canonical = self.gateways[0].base_url
     
-    def get(self, key: str) -> Tuple[Any, bool]:
-        """Get data from cache, return (data, is_stale)"""
-        # Try fast cache first
-        data = self.fast_cache.get(key)
-        if data:
-            return data, False
-        
-        # Try default cache
-        data = self.default_cache.get(key)
-        if data:
-            return data, False
-        
-        # Try stale cache
-        stale_key = f"{key}:stale"
-        stale_data = self.default_cache.get(stale_key)
-        if stale_data:
-            return stale_data, True
-        
-        return None, False
+    def choose(self, exclude=()) -> Gateway:
+        """Pick a gateway, avoiding ``exclude`` and open breakers while there are others"""
+        candidates = [g for g in self.gateways if g not in exclude and g.is_available()]
+        if not candidates:
+            candidates = [g for g in self.gateways if g.is_available()]
+        if not candidates:
+            # Every breaker is open: the one ejected longest ago is the best bet
+            return min(self.gateways, key=lambda g: g.ejected_until)
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if first.score() <= second.score() else second
+    
+    def find(self, host: str, port: int) -> Optional[Gateway]:
+        """The gateway at a host and port, None for other hosts"""
+        for gateway in self.gateways:
+            if gateway.address == (host, port):
+                return gateway
+        return None
+    
+    def rebase(self, url: str, gateway: Gateway) -> str:
+        """Point a URL built on the canonical gateway (or any other) at ``gateway``"""
+        for other in self.gateways:
+            if url.startswith(other.base_url):
+                return gateway.base_url + url[len(other.base_url):]
+        return url
+    
+    def get_stats(self) -> Dict:
+        return {gateway.base_url: gateway.get_stats() for gateway in self.gateways}
+
+
+class ConnectTimingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter reporting how long every new connection took to open (DNS
+    lookup and TCP handshake) as ``on_connect(host, port, seconds)``.
+    Connections that time out are reported at the connect timeout.
+    """
     
-    def set(self, key: str, data: Any, timeout: int = 300):
-        """Set data in multiple cache layers"""
-        # Store in fast cache for frequently accessed data
-        if timeout <= 60:
-            self.fast_cache.set(key, data, timeout=timeout)
+    def __init__(self, on_connect, **kwargs):
+        self.on_connect = on_connect
+        super().__init__(**kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_connect = self.on_connect
         
-        # Store in default cache
-        self.default_cache.set(key, data, timeout=timeout)
+        def timed(connection_class):
+            class TimedConnection(connection_class):
+                def _new_conn(self):
+                    started = time.perf_counter()
+                    try:
+                        sock = super()._new_conn()
+                    except ConnectTimeoutError:
+                        if isinstance(self.timeout, (int, float)):
+                            on_connect(self.host, self.port, self.timeout)
+                        raise
+                    on_connect(self.host, self.port, time.perf_counter() - started)
+                    return sock
+            return TimedConnection
         
-        # Store as stale cache for fallback (24 hours)
-        stale_key = f"{key}:stale"
-        self.default_cache.set(stale_key, data, timeout=86400)
-    
-    def delete(self, key: str):
-        """Delete from all cache layers"""
-        self.fast_cache.delete(key)
-        self.default_cache.delete(key)
-        self.default_cache.delete(f"{key}:stale")
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(pool_class.__name__, (pool_class,), {'ConnectionCls': timed(pool_class.ConnectionCls)})
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
 
 
 class RobustAPIClient:
     """
     Production-ready API client with all optimizations
+    
+    The request path steps other than sending (serving envelopes and negative
+    entries, attempt timeouts, retry and hedge decisions, handling responses
+    and failures) are public: AsyncRobustAPIClient runs the same steps and
+    only sends over aiohttp.
     """
     
-    def __init__(self, base_url: str):
-        self.base_url = base_url.rstrip('/')
+    def __init__(self, base_url):
+        # One gateway URL or a list of them; URLs and cache keys use the first
+        base_urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        self.gateways = GatewayPool(
+            base_urls,
+            alpha=getattr(settings, 'API_GATEWAY_EWMA_ALPHA', 0.3),
+            failure_threshold=getattr(settings, 'API_GATEWAY_FAILURE_THRESHOLD', 5),
+            eject_time=getattr(settings, 'API_GATEWAY_EJECT_TIME', 30),
+            latency_window=getattr(settings, 'API_LATENCY_WINDOW', 300)
+        )
+        self.base_url = self.gateways.canonical
         self.cache = SmartCache()
-        self.circuit_breaker = CircuitBreaker(
-            failure_threshold=getattr(settings, 'API_CIRCUIT_BREAKER_THRESHOLD', 10),
-            timeout=getattr(settings, 'API_CIRCUIT_BREAKER_TIMEOUT', 300)
+        # One breaker per endpoint, so a failing search backend doesn't block home pages
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self._circuit_breakers_lock = threading.Lock()
+        # Time-to-first-byte per endpoint, drives the adaptive timeouts
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self._latency_lock = threading.Lock()
+        # Endpoints whose slow requests get a second, hedged request
+        self.hedged_endpoints = {e.strip('/') for e in getattr(settings, 'API_HEDGED_ENDPOINTS', [])}
+        self.hedge_budget = TokenBudget(ratio=getattr(settings, 'API_HEDGE_BUDGET', 0.05))
+        # How long shared state in Redis may be read from or written to a local copy
+        self.redis_sync_interval = getattr(settings, 'API_REDIS_SYNC_INTERVAL', 1)
+        # Retries may add at most API_RETRY_BUDGET extra load on top of successful requests
+        budget_class = TokenBudget
+        budget_args, budget_kwargs = (), {}
+        if getattr(settings, 'API_RETRY_BUDGET_SHARED', True):
+            budget_class, budget_args = DistributedTokenBudget, ('retries',)
+            budget_kwargs = {'sync_interval': self.redis_sync_interval}
+        self.retry_budget = budget_class(
+            *budget_args,
+            ratio=getattr(settings, 'API_RETRY_BUDGET', 0.1),
+            burst=getattr(settings, 'API_RETRY_BUDGET_BURST', 10),
+            **budget_kwargs
+        )
+        self.hedge_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'API_HEDGE_WORKERS', 16),
+            thread_name_prefix='api-hedge'
+        )
+        # Fetches the misses of get_many batches; long-lived so a page render doesn't spawn threads
+        self.batch_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'API_GET_MANY_WORKERS', 16),
+            thread_name_prefix='api-get-many'
+        )
+        self.hedge_stats = {
+            'hedged': 0,
+            'wins': 0,
+            'losses': 0,
+            'skipped_budget': 0,
+        }
+        self.single_flight = SingleFlight(
+            lease_timeout=getattr(settings, 'API_SINGLEFLIGHT_LEASE_TIMEOUT', 10),
+            wait_timeout=getattr(settings, 'API_SINGLEFLIGHT_WAIT_TIMEOUT', 5)
+        )
+        # Short-lived answers for 4xx responses and empty results
+        self.negative_cache = NegativeCache(
+            ttl=getattr(settings, 'API_NEGATIVE_CACHE_TTL', 60),
+            max_entries=getattr(settings, 'API_NEGATIVE_CACHE_MAX_ENTRIES', 10000),
+            cache_backend=self.cache.default_cache
+        )
+        self.empty_result_endpoints = {
+            e.strip('/') for e in getattr(settings, 'API_NEGATIVE_CACHE_EMPTY_ENDPOINTS', [])
+        }
+        self.admission = AdmissionController(
+            max_concurrency=getattr(settings, 'API_MAX_CONCURRENCY_PER_PROCESS', 32),
+            limits=getattr(settings, 'API_ADMISSION_LIMITS', {}),
+            classes=getattr(settings, 'API_ENDPOINT_CLASSES', {}),
+            queue_timeout=getattr(settings, 'API_ADMISSION_QUEUE_TIMEOUT', 0.5),
+            lease_ttl=getattr(settings, 'REQUEST_DEADLINE', 25) + 5,
+            sync_interval=self.redis_sync_interval
+        )
+        # Last good payloads of the hot endpoints, the final fallback when the API and cache are down
+        self.snapshots = SnapshotStore(
+            path=getattr(settings, 'API_SNAPSHOT_PATH', os.path.join(settings.BASE_DIR, 'cache', 'api-snapshots.bin')),
+            endpoints=getattr(settings, 'API_SNAPSHOT_ENDPOINTS', {}),
+            max_entries=getattr(settings, 'API_SNAPSHOT_MAX_ENTRIES', 64),
+            min_interval=getattr(settings, 'API_SNAPSHOT_MIN_INTERVAL', 60)
         )
+        self.refresh_executor = RefreshExecutor(
+            max_workers=getattr(settings, 'API_REFRESH_WORKERS', 4),
+            max_queue=getattr(settings, 'API_REFRESH_QUEUE_SIZE', 100),
+            shutdown_timeout=getattr(settings, 'API_REFRESH_SHUTDOWN_TIMEOUT', 5)
+        )
+        # gunicorn workers exit through sys.exit on graceful shutdown and
+        # --max-requests recycling, which runs atexit handlers
+        atexit.register(self.refresh_executor.shutdown)
         
         # Setup session with connection pooling
         self.session = self._create_session()
@@ -182,24 +2151,261 @@ class RobustAPIClient:
             'cache_hits': 0,
             'cache_misses': 0,
             'api_errors': 0,
+            'early_refreshes': 0,
+            'not_modified': 0,
+            'deadline_exceeded': 0,
+            'retries': 0,
+            'retries_skipped_budget': 0,
             'avg_response_time': 0
         }
     
+    def get_circuit_breaker(self, endpoint: str) -> CircuitBreaker:
+        """Return the circuit breaker for an endpoint, creating it on first use"""
+        name = endpoint.strip('/')
+        breaker = self.circuit_breakers.get(name)
+        if breaker is None:
+            with self._circuit_breakers_lock:
+                breaker = self.circuit_breakers.get(name)
+                if breaker is None:
+                    breaker = DistributedCircuitBreaker(
+                        name=name,
+                        failure_threshold=getattr(settings, 'API_CIRCUIT_BREAKER_THRESHOLD', 10),
+                        timeout=getattr(settings, 'API_CIRCUIT_BREAKER_TIMEOUT', 300),
+                        slow_call_duration=getattr(settings, 'API_SLOW_CALL_DURATION', 10),
+                        slow_call_rate_threshold=getattr(settings, 'API_SLOW_CALL_RATE_THRESHOLD', 0.5),
+                        window_size=getattr(settings, 'API_CIRCUIT_BREAKER_WINDOW', 20),
+                        minimum_calls=getattr(settings, 'API_CIRCUIT_BREAKER_MIN_CALLS', 5),
+                        half_open_max_probes=getattr(settings, 'API_CIRCUIT_BREAKER_HALF_OPEN_PROBES', 3),
+                        slow_start_duration=getattr(settings, 'API_CIRCUIT_BREAKER_SLOW_START', 60),
+                        slow_start_min_rate=getattr(settings, 'API_CIRCUIT_BREAKER_SLOW_START_MIN_RATE', 0.1),
+                        sync_interval=self.redis_sync_interval
+                    )
+                    self.circuit_breakers[name] = breaker
+        return breaker
+    
+    def get_circuit_breaker_names(self) -> list:
+        """Endpoints with a breaker in this process or anywhere in the fleet"""
+        names = set(self.circuit_breakers)
+        client = get_redis_connection()
+        if client is not None:
+            try:
+                names.update(n.decode() for n in client.smembers(DistributedCircuitBreaker.NAMES_KEY))
+            except Exception as e:
+                report_redis_error(e)
+                api_logger.warning(f"Could not list circuit breakers: {str(e)}")
+        return sorted(names)
+    
+    def get_circuit_breaker_stats(self) -> Dict:
+        return {name: self.get_circuit_breaker(name).get_stats()
+                for name in self.get_circuit_breaker_names()}
+    
+    def reset_circuit_breakers(self):
+        """Reset every endpoint breaker across the fleet"""
+        for name in self.get_circuit_breaker_names():
+            self.get_circuit_breaker(name).reset()
+        api_logger.info("All circuit breakers have been reset")
+    
+    def get_latency_histogram(self, endpoint: str) -> LatencyHistogram:
+        """Return the latency histogram for an endpoint, creating it on first use"""
+        name = endpoint.strip('/')
+        histogram = self.latency.get(name)
+        if histogram is None:
+            with self._latency_lock:
+                histogram = self.latency.setdefault(
+                    name, LatencyHistogram(window=getattr(settings, 'API_LATENCY_WINDOW', 300))
+                )
+        return histogram
+    
+    @staticmethod
+    def _adaptive_timeout(histogram: LatencyHistogram, floor: float, ceiling: float) -> float:
+        """A multiple of the histogram's latency percentile, clamped; the ceiling until enough samples are in"""
+        if histogram.count() < getattr(settings, 'API_LATENCY_MIN_SAMPLES', 20):
+            return ceiling
+        latency = histogram.percentile(getattr(settings, 'API_TIMEOUT_PERCENTILE', 99))
+        budget = latency * getattr(settings, 'API_TIMEOUT_MULTIPLIER', 2.0)
+        return round(min(max(budget, floor), ceiling), 3)
+    
+    def get_connect_timeout(self, gateway: Optional[Gateway] = None) -> float:
+        """Connect timeout derived from the time new connections to ``gateway`` took to open"""
+        connect_max = getattr(settings, 'API_CONNECT_TIMEOUT_MAX', 5)
+        if gateway is None:
+            return connect_max
+        return self._adaptive_timeout(
+            gateway.connect_latency, getattr(settings, 'API_CONNECT_TIMEOUT_MIN', 1), connect_max
+        )
+    
+    def get_timeouts(self, endpoint: str, gateway: Optional[Gateway] = None) -> Tuple[float, float]:
+        """
+        (connect, read) timeouts for an endpoint. Each phase is measured on its
+        own: the read timeout follows the endpoint's time to first byte, the
+        connect timeout the time connections to ``gateway`` took to open (its
+        ceiling without a gateway).
+        """
+        read_timeout = self._adaptive_timeout(
+            self.get_latency_histogram(endpoint),
+            getattr(settings, 'API_READ_TIMEOUT_MIN', 2),
+            getattr(settings, 'API_READ_TIMEOUT_MAX', getattr(settings, 'API_TIMEOUT', 15))
+        )
+        return self.get_connect_timeout(gateway), read_timeout
+    
+    def record_latency(self, endpoint: str, seconds: float):
+        self.get_latency_histogram(endpoint).record(seconds)
+    
+    def record_connect(self, host: str, port: int, seconds: float):
+        """Record how long a new connection to a gateway took to open"""
+        gateway = self.gateways.find(host, port)
+        if gateway is not None:
+            gateway.connect_latency.record(seconds)
+    
+    def attempt_timeouts(self, endpoint: Optional[str]) -> Tuple[float, float]:
+        """
+        (connect, read) timeouts for one attempt, capped to the request
+        deadline; the connect timeout is narrowed further once the gateway
+        is picked (see _gateway_timeout)
+        """
+        if endpoint is None:
+            connect_timeout = read_timeout = getattr(settings, 'API_TIMEOUT', 15)
+        else:
+            connect_timeout, read_timeout = self.get_timeouts(endpoint)
+        left = deadline_remaining()
+        if left is not None:
+            left = max(left, 0.01)
+            connect_timeout, read_timeout = min(connect_timeout, left), min(read_timeout, left)
+        return connect_timeout, read_timeout
+    
+    def hedge_delay(self, endpoint: Optional[str], read_timeout: float) -> Optional[float]:
+        """
+        How long to wait on a request before hedging it: the endpoint's
+        API_HEDGE_PERCENTILE latency. None when the endpoint isn't hedged,
+        has too few samples, or a hedge couldn't answer within ``read_timeout``.
+        """
+        if endpoint is None or endpoint.strip('/') not in self.hedged_endpoints:
+            return None
+        histogram = self.get_latency_histogram(endpoint)
+        if histogram.count() < getattr(settings, 'API_LATENCY_MIN_SAMPLES', 20):
+            return None
+        delay = histogram.percentile(getattr(settings, 'API_HEDGE_PERCENTILE', 95))
+        return delay if delay < read_timeout else None
+    
+    def _gateway_timeout(self, timeout, gateway: Gateway):
+        """An attempt's (connect, read) timeouts with the connect timeout of the gateway it goes to"""
+        if not isinstance(timeout, tuple):
+            return timeout
+        return min(timeout[0], self.get_connect_timeout(gateway)), timeout[1]
+    
+    def has_time_for_attempt(self, wait: float = 0.0) -> bool:
+        """Whether an upstream attempt still fits in the request deadline after ``wait``"""
+        left = deadline_remaining()
+        return left is None or left - wait >= getattr(settings, 'API_MIN_ATTEMPT_TIME', 0.5)
+    
+    @staticmethod
+    def _retry_delay(retry: int) -> float:
+        """Backoff before the n-th retry: exponential with full jitter"""
+        return random.uniform(0, getattr(settings, 'API_BACKOFF_FACTOR', 1.5) * (2 ** (retry - 1)))
+    
+    def retry_wait(self, retry: int) -> Optional[float]:
+        """
+        Backoff to wait before the n-th retry, or None when it isn't allowed:
+        past API_MAX_RETRIES, past the request deadline, or over the retry budget
+        """
+        if retry > getattr(settings, 'API_MAX_RETRIES', 3):
+            return None
+        delay = self._retry_delay(retry)
+        return delay if self.allow_retry(delay) else None
+    
+    def allow_retry(self, delay: float) -> bool:
+        """
+        Whether a retry after waiting ``delay`` may go ahead: it must fit in the
+        request deadline and the shared retry budget. Counted in the retry stats.
+        """
+        if not self.has_time_for_attempt(delay):
+            return False
+        if not self.retry_budget.spend():
+            self.stats['retries_skipped_budget'] += 1
+            return False
+        self.stats['retries'] += 1
+        return True
+    
+    def send_attempt(self, url: str, params: Dict = None, timeout=None) -> requests.Response:
+        """
+        Send one GET attempt for callers running their own retry loop: through
+        the circuit breaker of the URL's endpoint and the gateway pool, within
+        the request deadline. Raises DeadlineExceeded when no attempt fits,
+        CircuitBreakerOpenError while the breaker is open, and requests'
+        exceptions (HTTPError for error statuses) when the attempt fails.
+        """
+        if not self.has_time_for_attempt():
+            raise DeadlineExceeded(f"No time left in the request deadline for {url}")
+        breaker = self.get_circuit_breaker(urlsplit(url).path.strip('/') or 'default')
+        if timeout is None:
+            timeout = getattr(settings, 'API_TIMEOUT', 15)
+        
+        def attempt():
+            response = self._send(url, params, None, cap(timeout), None)
+            response.raise_for_status()
+            return response
+        
+        response = breaker.call(attempt)
+        self.retry_budget.earn()
+        return response
+    
+    def _should_retry(self, retry: int) -> bool:
+        """Wait out the backoff for the n-th retry if it is allowed"""
+        delay = self.retry_wait(retry)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+    
+    @staticmethod
+    def _round(value: Optional[float]) -> Optional[float]:
+        return round(value, 3) if value is not None else None
+    
+    def get_timeout_stats(self) -> Dict:
+        stats = {}
+        for name in sorted(self.latency):
+            histogram = self.latency[name]
+            connect, read = self.get_timeouts(name)
+            stats[name] = {
+                'connect_timeout': connect,
+                'read_timeout': read,
+                'samples': histogram.count(),
+                'p50': self._round(histogram.percentile(50)),
+                'p99': self._round(histogram.percentile(99)),
+            }
+        return stats
+    
+    def get_hedge_stats(self) -> Dict:
+        return {
+            **self.hedge_stats,
+            'endpoints': sorted(self.hedged_endpoints),
+            'delays': {name: self._round(self.hedge_delay(name, float('inf')))
+                       for name in sorted(self.hedged_endpoints)},
+        }
+    
+    @property
+    def circuit_breaker_state(self) -> str:
+        """Worst state across endpoint breakers"""
+        return self._worst_state(self.get_circuit_breaker_stats())
+    
+    @staticmethod
+    def _worst_state(breaker_stats: Dict) -> str:
+        states = {stats['state'] for stats in breaker_stats.values()}
+        for state in ('OPEN', 'HALF_OPEN'):
+            if state in states:
+                return state
+        return 'CLOSED'
+    
     def _create_session(self) -> requests.Session:
         """Create optimized requests session"""
         session = requests.Session()
         
-        # Retry strategy
-        retry_strategy = Retry(
-            total=getattr(settings, 'API_MAX_RETRIES', 3),
-            backoff_factor=getattr(settings, 'API_BACKOFF_FACTOR', 1.5),
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS"]
-        )
-        
-        # HTTP adapter with connection pooling
-        adapter = HTTPAdapter(
-            max_retries=retry_strategy,
+        # HTTP adapter with connection pooling, timing new connections for the
+        # connect timeouts. Retries are done in _make_request, where they can
+        # respect the request deadline
+        adapter = ConnectTimingAdapter(
+            self.record_connect,
+            max_retries=0,
             pool_connections=20,  # Number of connection pools
             pool_maxsize=50,      # Max connections per pool
             pool_block=False      # Don't block when pool is full
@@ -212,12 +2418,29 @@ class RobustAPIClient:
         session.headers.update({
             'User-Agent': 'KortekStream/1.0 (Production)',
             'Accept': 'application/json',
-            'Accept-Encoding': 'gzip, deflate',
+            # gzip, deflate plus br/zstd when Brotli/zstandard are installed
+            'Accept-Encoding': ACCEPT_ENCODING,
             'Connection': 'keep-alive'
         })
         
         return session
     
+    def invalidate(self, endpoint: str = None, params: Dict = None, category: str = None):
+        """
+        Drop cached responses. With ``params`` only that request's entry goes;
+        otherwise the endpoint's and/or the category's generation is bumped,
+        invalidating all of their keys at once.
+        """
+        if endpoint is not None and params is not None:
+            cache_key = self.cache.get_cache_key(endpoint, params)
+            self.cache.delete(cache_key)
+            self.negative_cache.delete(cache_key)
+            return
+        if endpoint is not None:
+            self.cache.bump_generation(self.cache.endpoint_namespace(endpoint))
+        if category is not None:
+            self.cache.bump_generation(self.cache.category_namespace(category))
+    
     def get(self, endpoint: str, params: Dict = None, 
             cache_timeout: int = 300, force_refresh: bool = False) -> APIResponse:
         """
@@ -226,145 +2449,530 @@ class RobustAPIClient:
         start_time = time.time()
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
         
-        # Generate cache key
-        cache_key = self.cache.get_cache_key(url, params)
+        # Generate cache key, then read the envelope and negative entry in one round trip
+        cache_key = self.cache.get_cache_key(endpoint, params)
+        negative_key = self.negative_cache.key(cache_key)
+        envelopes, related = self.cache.read([cache_key], [negative_key])
+        envelope = envelopes.get(cache_key)
+        negative = related.get(negative_key, UNREAD)
         
         # Try cache first (unless force refresh)
         if not force_refresh:
-            cached_data, is_stale = self.cache.get(cache_key)
-            if cached_data:
-                self.stats['cache_hits'] += 1
-                
-                # If data is stale, trigger background refresh
-                if is_stale:
-                    self._background_refresh(url, params, cache_key, cache_timeout)
-                
-                response_time = time.time() - start_time
-                return APIResponse(
-                    data=cached_data,
-                    status_code=200,
-                    response_time=response_time,
-                    cached=True,
-                    stale=is_stale,
-                    source='cache'
+            cached_response = self.serve_envelope(envelope, endpoint, cache_key, url, params,
+                                                   cache_timeout, start_time)
+            if cached_response is not None:
+                return cached_response
+        else:
+            self.negative_cache.delete(cache_key)
+            negative = None
+        
+        # Coalesce concurrent misses for this key into one upstream call,
+        # revalidating the cached copy when there is one
+        self.stats['cache_misses'] += 1
+        return self.single_flight.do(
+            cache_key,
+            lambda: self._fetch(endpoint, url, params, cache_key, cache_timeout, start_time,
+                                envelope, negative),
+            poll=lambda: self.cached_response(cache_key, start_time),
+            use_lease=not force_refresh
+        )
+    
+    def get_many(self, batch: List, force_refresh: bool = False) -> List[APIResponse]:
+        """
+        Fetch several endpoints at once. ``batch`` holds APIRequest objects
+        or ``(endpoint, params, cache_timeout)`` tuples; responses come back in
+        the same order.
+        
+        Cache lookups for the whole batch are batched per cache layer, and the
+        misses are fetched concurrently over the pooled session, so the batch
+        takes as long as its slowest miss.
+        """
+        start_time = time.time()
+        batch = [item if isinstance(item, APIRequest) else APIRequest(*item) for item in batch]
+        urls = [f"{self.base_url}/{item.endpoint.lstrip('/')}" for item in batch]
+        cache_keys = self.cache.get_cache_keys([(item.endpoint, item.params) for item in batch])
+        
+        unique_keys = list(dict.fromkeys(cache_keys))
+        envelopes, related = self.cache.read(
+            unique_keys, [self.negative_cache.key(key) for key in unique_keys]
+        )
+        
+        results: List[Optional[APIResponse]] = [None] * len(batch)
+        misses = []
+        for index, (item, url, cache_key) in enumerate(zip(batch, urls, cache_keys)):
+            response = None
+            if not force_refresh:
+                response = self.serve_envelope(envelopes.get(cache_key), item.endpoint, cache_key,
+                                                url, item.params, item.cache_timeout, start_time)
+            else:
+                self.negative_cache.delete(cache_key)
+                related[self.negative_cache.key(cache_key)] = None
+            if response is not None:
+                results[index] = response
+            else:
+                misses.append(index)
+        
+        if misses:
+            self.stats['cache_misses'] += len(misses)
+            
+            def fetch(index):
+                item, url, cache_key = batch[index], urls[index], cache_keys[index]
+                return self.single_flight.do(
+                    cache_key,
+                    lambda: self._fetch(item.endpoint, url, item.params, cache_key,
+                                        item.cache_timeout, start_time, envelopes.get(cache_key),
+                                        related.get(self.negative_cache.key(cache_key), UNREAD)),
+                    poll=lambda: self.cached_response(cache_key, start_time),
+                    use_lease=not force_refresh
                 )
+            
+            # The first miss is fetched on this thread, the others on the shared
+            # executor, each in a copy of this context so the request deadline carries over
+            futures = [self.batch_executor.submit(contextvars.copy_context().run, fetch, index)
+                       for index in misses[1:]]
+            results[misses[0]] = fetch(misses[0])
+            for index, future in zip(misses[1:], futures):
+                results[index] = future.result()
+        
+        return results
+    
+    def serve_envelope(self, envelope: Optional[CacheEnvelope], endpoint: str, cache_key: str,
+                        url: str, params: Dict, cache_timeout: int,
+                        start_time: float) -> Optional[APIResponse]:
+        """
+        Build a cached response from an envelope, or None on a miss, scheduling
+        a refresh when the entry is stale or about to be
+        """
+        if envelope is None or not envelope.data:
+            return None
+        
+        self.stats['cache_hits'] += 1
+        is_stale = envelope.is_stale()
+        
+        # Stale, or probabilistically close to going stale: serve now
+        # and let a single background refresh fetch the new copy
+        if is_stale or envelope.should_refresh_early(self.cache.early_refresh_beta):
+            if self.cache.claim_refresh(cache_key):
+                if not is_stale:
+                    self.stats['early_refreshes'] += 1
+                self._background_refresh(endpoint, url, params, cache_key, cache_timeout, envelope)
+        
+        response_time = time.time() - start_time
+        return APIResponse(
+            data=envelope.data,
+            status_code=200,
+            response_time=response_time,
+            cached=True,
+            stale=is_stale,
+            source='cache'
+        )
+    
+    def cached_response(self, cache_key: str, start_time: float) -> Optional[APIResponse]:
+        """Build a response from cache if another worker already stored the data"""
+        cached_data, is_stale = self.cache.get(cache_key)
+        if not cached_data:
+            return None
+        return APIResponse(
+            data=cached_data,
+            status_code=200,
+            response_time=time.time() - start_time,
+            cached=True,
+            stale=is_stale,
+            source='cache'
+        )
+    
+    def _fetch(self, endpoint: str, url: str, params: Dict, cache_key: str,
+               cache_timeout: int, start_time: float,
+               envelope: Optional[CacheEnvelope] = None, negative: Any = UNREAD) -> APIResponse:
+        """
+        Fetch from upstream, cache the result and fall back to stale data on failure.
+        With a cached envelope the request is conditional, and a 304 reuses its payload.
+        ``negative`` is the negative entry when it was read with the envelope.
+        """
+        negative_response = self.negative_response(cache_key, start_time, negative)
+        if negative_response is not None:
+            return negative_response
         
-        # Make API request
+        envelope = envelope if envelope is not None and envelope.data else None
         try:
-            self.stats['cache_misses'] += 1
-            response = self.circuit_breaker.call(
-                self._make_request, url, params
-            )
+            if not self.has_time_for_attempt():
+                raise DeadlineExceeded(f"No time left in the request deadline for {endpoint}")
             
-            response_time = time.time() - start_time
-            self.stats['total_requests'] += 1
+            with self.admission.admit(endpoint):
+                response = self.get_circuit_breaker(endpoint).call(
+                    self._make_request, url, params,
+                    envelope.conditional_headers() if envelope else None,
+                    endpoint
+                )
             
-            # Update average response time
-            total_requests = self.stats['total_requests']
-            current_avg = self.stats['avg_response_time']
-            self.stats['avg_response_time'] = (
-                (current_avg * (total_requests - 1) + response_time) / total_requests
-            )
+            # Nothing changed upstream: no body to download or decode
+            if response.status_code == 304 and envelope:
+                return self.handle_response(endpoint, params, cache_key, cache_timeout,
+                                             start_time, 304, None, envelope=envelope)
             
             # Parse response
             try:
-                data = response.json()
+                data = loads_json(response.content)
             except ValueError:
                 data = {'error': 'Invalid JSON response', 'raw': response.text[:500]}
             
-            # Cache successful responses
-            if response.status_code == 200 and 'error' not in data:
-                self.cache.set(cache_key, data, timeout=cache_timeout)
-            
-            # Log performance
-            performance_logger.info(json.dumps({
-                'endpoint': endpoint,
-                'response_time_ms': round(response_time * 1000, 2),
-                'status_code': response.status_code,
-                'cached': False,
-                'params': params
-            }))
+            return self.handle_response(endpoint, params, cache_key, cache_timeout,
+                                         start_time, response.status_code, data,
+                                         validators=self.response_validators(response.headers))
             
+        except requests.exceptions.HTTPError as e:
+            return self.handle_http_error(url, cache_key, start_time, e.response.status_code, e,
+                                           envelope=envelope, endpoint=endpoint, params=params)
+        except Exception as e:
+            return self.handle_failure(url, cache_key, start_time, e, envelope=envelope,
+                                        endpoint=endpoint, params=params)
+    
+    @staticmethod
+    def _is_negative_status(status_code: int) -> bool:
+        """4xx answers worth caching; timeouts and rate limits are worth retrying soon"""
+        return 400 <= status_code < 500 and status_code not in (408, 429)
+    
+    @staticmethod
+    def _is_empty_result(data: Any) -> bool:
+        return isinstance(data, dict) and not data.get('data') and not data.get('data_by_category')
+    
+    def negative_response(self, cache_key: str, start_time: float,
+                           entry: Any = UNREAD) -> Optional[APIResponse]:
+        """
+        Answer from the negative cache, or None when the key isn't in it.
+        The entry is only looked up when it wasn't read with the envelope.
+        """
+        if entry is UNREAD:
+            entry = self.negative_cache.get(cache_key)
+        else:
+            self.negative_cache.record(entry)
+        if entry is None:
+            return None
+        status_code = entry['status_code']
+        return APIResponse(
+            data=copy.deepcopy(entry['data']),
+            status_code=status_code,
+            response_time=time.time() - start_time,
+            cached=True,
+            source='error' if status_code >= 400 else 'negative_cache'
+        )
+    
+    def handle_http_error(self, url: str, cache_key: str, start_time: float,
+                           status_code: int, exc: Exception,
+                           envelope: Optional[CacheEnvelope] = None,
+                           endpoint: str = None, params: Dict = None) -> APIResponse:
+        """Negative-cache client errors before falling back like any failed fetch"""
+        if not self._is_negative_status(status_code):
+            return self.handle_failure(url, cache_key, start_time, exc, envelope=envelope,
+                                        endpoint=endpoint, params=params)
+        message = 'Not found' if status_code == 404 else 'The request was rejected by the API'
+        self.negative_cache.set(cache_key, status_code, {'error': str(exc), 'message': message})
+        return self.handle_failure(url, cache_key, start_time, exc,
+                                    status_code=status_code, message=message, envelope=envelope)
+    
+    def _snapshot_request(self, endpoint: str, params: Dict = None) -> Tuple[str, List[Tuple[str, str]]]:
+        """A request as the snapshot store keys it, normalized like cache keys"""
+        return self.cache.normalize_endpoint(endpoint), self.cache.normalize_params(params)
+    
+    @staticmethod
+    def response_validators(headers) -> Dict[str, Optional[str]]:
+        """ETag/Last-Modified from upstream response headers, as SmartCache.set kwargs"""
+        return {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+    
+    def handle_response(self, endpoint: str, params: Dict, cache_key: str, cache_timeout: int,
+                         start_time: float, status_code: int, data: Any,
+                         validators: Dict = None,
+                         envelope: Optional[CacheEnvelope] = None) -> APIResponse:
+        """
+        Record stats, cache a successful upstream response and wrap it.
+        A 304 for ``envelope`` only restarts its TTLs and returns its payload.
+        """
+        response_time = time.time() - start_time
+        self.stats['total_requests'] += 1
+        
+        # Update average response time
+        total_requests = self.stats['total_requests']
+        current_avg = self.stats['avg_response_time']
+        self.stats['avg_response_time'] = (
+            (current_avg * (total_requests - 1) + response_time) / total_requests
+        )
+        
+        not_modified = status_code == 304 and envelope is not None
+        if not_modified:
+            self.stats['not_modified'] += 1
+            self.cache.revalidate(cache_key, envelope, timeout=cache_timeout, delta=response_time)
+            data = envelope.data
+        # Empty results only go in the short-lived negative cache
+        elif (status_code == 200 and endpoint.strip('/') in self.empty_result_endpoints
+              and self._is_empty_result(data)):
+            self.negative_cache.set(cache_key, status_code, data)
+        # Cache successful responses
+        elif status_code == 200 and 'error' not in data:
+            self.cache.set(cache_key, data, timeout=cache_timeout, delta=response_time,
+                           **(validators or {}))
+            self.snapshots.save_in_background(*self._snapshot_request(endpoint, params), data,
+                                              self.refresh_executor)
+        
+        # Log performance
+        performance_logger.info(json.dumps({
+            'endpoint': endpoint,
+            'response_time_ms': round(response_time * 1000, 2),
+            'status_code': status_code,
+            'cached': False,
+            'params': params
+        }))
+        
+        if not_modified:
             return APIResponse(
                 data=data,
-                status_code=response.status_code,
+                status_code=200,
                 response_time=response_time,
-                cached=False,
-                source='api'
+                cached=True,
+                source='revalidated'
             )
-            
-        except Exception as e:
-            self.stats['api_errors'] += 1
-            api_logger.error(f"API request failed for {url}: {str(e)}")
-            
-            # Try to return stale cache data as fallback
-            cached_data, is_stale = self.cache.get(cache_key)
-            if cached_data:
-                api_logger.info(f"Returning stale cache data for {url}")
-                response_time = time.time() - start_time
+        
+        return APIResponse(
+            data=data,
+            status_code=status_code,
+            response_time=response_time,
+            cached=False,
+            source='api'
+        )
+    
+    def handle_failure(self, url: str, cache_key: str, start_time: float, exc: Exception,
+                        status_code: int = 503,
+                        message: str = 'Service temporarily unavailable',
+                        envelope: Optional[CacheEnvelope] = None,
+                        endpoint: str = None, params: Dict = None) -> APIResponse:
+        """
+        Fall back to stale cache data, or an error response, after a failed fetch.
+        The cache is only read again when the request had no ``envelope`` to fall back to.
+        Server-side failures of hot requests (``endpoint`` given) fall back to
+        their last-known-good snapshot when the cache has nothing.
+        """
+        self.stats['api_errors'] += 1
+        if isinstance(exc, DeadlineExceeded):
+            self.stats['deadline_exceeded'] += 1
+        api_logger.error(f"API request failed for {url}: {str(exc)}")
+        
+        # Try to return stale cache data as fallback
+        cached_data = envelope.data if envelope is not None else self.cache.get(cache_key)[0]
+        if cached_data:
+            api_logger.info(f"Returning stale cache data for {url}")
+            response_time = time.time() - start_time
+            return APIResponse(
+                data=cached_data,
+                status_code=200,
+                response_time=response_time,
+                cached=True,
+                stale=True,
+                source='stale_cache'
+            )
+        
+        if endpoint is not None and status_code >= 500:
+            snapshot = self.snapshots.get(*self._snapshot_request(endpoint, params))
+            if snapshot is not None:
+                api_logger.info(f"Returning last-known-good snapshot for {url}")
                 return APIResponse(
-                    data=cached_data,
+                    data=snapshot[0],
                     status_code=200,
-                    response_time=response_time,
+                    response_time=time.time() - start_time,
                     cached=True,
                     stale=True,
-                    source='stale_cache'
+                    source='snapshot'
                 )
+        
+        # No cache available, return error
+        response_time = time.time() - start_time
+        return APIResponse(
+            data={'error': str(exc), 'message': message},
+            status_code=status_code,
+            response_time=response_time,
+            source='error'
+        )
+    
+    def _make_request(self, url: str, params: Dict = None, headers: Dict = None,
+                      endpoint: str = None, hedge: bool = True) -> requests.Response:
+        """
+        Make the actual HTTP request, retrying connection errors, timeouts and
+        RETRY_STATUSES with exponential backoff. Each attempt's timeouts and
+        each backoff wait fit in the request deadline; once it is spent the
+        last error is raised. With an endpoint, its adaptive timeouts apply
+        and the time to first byte is recorded in its histogram. Attempts on
+        hedged endpoints are hedged unless ``hedge`` is False. Retries and
+        hedges go to gateways that haven't been tried yet when there are any.
+        """
+        retry = 0
+        tried = set()
+        while True:
+            timeout = self.attempt_timeouts(endpoint)
+            hedge_delay = self.hedge_delay(endpoint, timeout[1]) if hedge else None
+            try:
+                if hedge_delay is None:
+                    response = self._send(url, params, headers, timeout, endpoint, tried)
+                else:
+                    response = self._hedged_send(url, params, headers, timeout, endpoint,
+                                                 hedge_delay, tried)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                retry += 1
+                if not self._should_retry(retry):
+                    raise
+                api_logger.info(f"Retrying {url} ({retry}) after {type(e).__name__}")
+                continue
             
-            # No cache available, return error
-            response_time = time.time() - start_time
-            return APIResponse(
-                data={'error': str(e), 'message': 'Service temporarily unavailable'},
-                status_code=503,
-                response_time=response_time,
-                source='error'
-            )
+            if response.status_code in RETRY_STATUSES and self._should_retry(retry + 1):
+                retry += 1
+                api_logger.info(f"Retrying {url} ({retry}) after HTTP {response.status_code}")
+                response.close()
+                continue
+            response.raise_for_status()
+            self.retry_budget.earn()
+            return response
     
-    def _make_request(self, url: str, params: Dict = None) -> requests.Response:
-        """Make the actual HTTP request"""
-        timeout = getattr(settings, 'API_TIMEOUT', 15)
+    def _send(self, url: str, params: Dict, headers: Dict, timeout,
+              endpoint: Optional[str], tried: Optional[set] = None) -> requests.Response:
+        """
+        Send one GET to a gateway picked by the pool (one not in ``tried``,
+        which it is added to), recording its time to first byte for the
+        endpoint and the gateway
+        """
+        gateway = self.gateways.choose(exclude=tried or ())
+        if tried is not None:
+            tried.add(gateway)
+        timeout = self._gateway_timeout(timeout, gateway)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
         
-        response = self.session.get(
-            url, 
-            params=params, 
-            timeout=timeout
-        )
-        response.raise_for_status()
+        gateway.begin()
+        try:
+            response = self.session.get(
+                self.gateways.rebase(url, gateway), 
+                params=params, 
+                headers=headers,
+                timeout=timeout
+            )
+        except requests.exceptions.RequestException as e:
+            # Count timeouts at the read timeout so the histogram can grow
+            # back out of a too-tight timeout
+            timed_out = isinstance(e, requests.exceptions.ReadTimeout)
+            gateway.end(read_timeout if timed_out else None, failed=True)
+            if endpoint is not None and timed_out:
+                self.record_latency(endpoint, read_timeout)
+            raise
+        
+        elapsed = response.elapsed.total_seconds()
+        gateway.end(elapsed, failed=response.status_code >= 500)
+        if endpoint is not None:
+            self.record_latency(endpoint, elapsed)
         return response
     
-    def _background_refresh(self, url: str, params: Dict, cache_key: str, cache_timeout: int):
-        """Refresh stale cache data in background"""
+    def _hedged_send(self, url: str, params: Dict, headers: Dict, timeout: Tuple[float, float],
+                     endpoint: str, delay: float, tried: Optional[set] = None) -> requests.Response:
+        """
+        Send a GET and, if it hasn't answered after ``delay`` and the hedge
+        budget allows, an identical one, to another gateway when there is one.
+        The first response wins; the other request runs to completion in the
+        background and is discarded.
+        """
+        tried = set() if tried is None else tried
+        
+        def submit():
+            return self.hedge_executor.submit(
+                contextvars.copy_context().run, self._send, url, params, headers, timeout,
+                endpoint, tried
+            )
+        
+        self.hedge_budget.earn()
+        primary = submit()
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        if not self.hedge_budget.spend():
+            self.hedge_stats['skipped_budget'] += 1
+            return primary.result()
+        
+        self.hedge_stats['hedged'] += 1
+        hedged = submit()
+        error = None
+        for future in as_completed([primary, hedged]):
+            try:
+                response = future.result()
+            except Exception as e:
+                error = e
+                continue
+            self.hedge_stats['wins' if future is hedged else 'losses'] += 1
+            (primary if future is hedged else hedged).add_done_callback(_close_response)
+            return response
+        raise error
+    
+    def _background_refresh(self, endpoint: str, url: str, params: Dict, cache_key: str,
+                            cache_timeout: int, envelope: Optional[CacheEnvelope] = None):
+        """Refresh stale cache data in background, revalidating ``envelope`` when given"""
         def refresh():
+            stored = None
             try:
-                response = self._make_request(url, params)
-                data = response.json()
+                start_time = time.time()
+                # Refreshes don't queue for admission, the stale copy is still served
+                with self.admission.admit(endpoint, timeout=0):
+                    response = self._make_request(
+                        url, params, envelope.conditional_headers() if envelope else None, endpoint,
+                        hedge=False
+                    )
+                if response.status_code == 304 and envelope:
+                    self.stats['not_modified'] += 1
+                    stored = self.cache.revalidate(cache_key, envelope, timeout=cache_timeout,
+                                                   delta=time.time() - start_time)
+                    api_logger.info(f"Background refresh for {url}: not modified")
+                    return
+                data = loads_json(response.content)
                 if response.status_code == 200 and 'error' not in data:
-                    self.cache.set(cache_key, data, timeout=cache_timeout)
+                    stored = self.cache.set(cache_key, data, timeout=cache_timeout,
+                                            delta=time.time() - start_time,
+                                            **self.response_validators(response.headers))
+                    # Already on the refresh executor
+                    self.snapshots.save(*self._snapshot_request(endpoint, params), data)
                     api_logger.info(f"Background refresh completed for {url}")
             except Exception as e:
                 api_logger.warning(f"Background refresh failed for {url}: {str(e)}")
+            finally:
+                self.cache.release_refresh(cache_key, stored)
         
-        # Run in background thread
-        import threading
-        thread = threading.Thread(target=refresh)
-        thread.daemon = True
-        thread.start()
+        self.refresh_executor.submit(
+            cache_key, refresh,
+            on_drop=lambda: self.cache.release_refresh(cache_key)
+        )
     
     def get_stats(self) -> Dict:
         """Get client statistics"""
+        breaker_stats = self.get_circuit_breaker_stats()
         return {
             **self.stats,
-            'circuit_breaker_state': self.circuit_breaker.state,
-            'circuit_breaker_failures': self.circuit_breaker.failure_count
+            'circuit_breaker_state': self._worst_state(breaker_stats),
+            'circuit_breaker_failures': sum(b['failures'] for b in breaker_stats.values()),
+            'circuit_breakers': breaker_stats,
+            'singleflight': dict(self.single_flight.stats),
+            'refresh_executor': self.refresh_executor.get_stats(),
+            'admission': self.admission.get_stats(),
+            'negative_cache': self.negative_cache.get_stats(),
+            'compression': get_compressor().get_stats() if get_compressor() else None,
+            'cache_tiers': self.cache.get_stats(),
+            'item_store': self.cache.items.get_stats(),
+            'snapshots': self.snapshots.get_stats(),
+            'gateways': self.gateways.get_stats(),
+            'timeouts': self.get_timeout_stats(),
+            'hedging': self.get_hedge_stats(),
+            'retry_budget_tokens': round(self.retry_budget.get_tokens(), 2)
         }
     
     def health_check(self) -> Dict:
-        """Perform health check"""
+        """Perform health check through the gateway the pool would pick"""
         try:
             start_time = time.time()
-            response = self.session.get(
-                f"{self.base_url}/api/categories/names",
-                timeout=5
+            response = self._send(
+                f"{self.base_url}/api/categories/names", None, None,
+                self.get_timeouts('api/categories/names'), None
             )
             response_time = time.time() - start_time
             
@@ -372,19 +2980,22 @@ class RobustAPIClient:
                 'healthy': response.status_code == 200,
                 'response_time': response_time,
                 'status_code': response.status_code,
-                'circuit_breaker_state': self.circuit_breaker.state
+                'circuit_breaker_state': self.circuit_breaker_state,
+                'gateways': self.gateways.get_stats()
             }
         except Exception as e:
             return {
                 'healthy': False,
                 'error': str(e),
-                'circuit_breaker_state': self.circuit_breaker.state
+                'circuit_breaker_state': self.circuit_breaker_state,
+                'gateways': self.gateways.get_stats()
             }
 
 
 # Global API client instance
 api_client = RobustAPIClient(
-    base_url=getattr(settings, 'API_BASE_URL', 'http://apigatway.humanmade.my.id:8080')
+    base_url=getattr(settings, 'API_BASE_URLS', None)
+    or getattr(settings, 'API_BASE_URL', 'http://apigatway.humanmade.my.id:8080')
 )
 
 
@@ -395,11 +3006,26 @@ def make_api_request(endpoint: str, params: Dict = None,
     return api_client.get(endpoint, params, cache_timeout, force_refresh)
 
 
+def make_api_requests(batch: List, force_refresh: bool = False) -> List[APIResponse]:
+    """Make several API requests concurrently using the global client"""
+    return api_client.get_many(batch, force_refresh)
+
+
+def invalidate_api_cache(endpoint: str = None, params: Dict = None, category: str = None):
+    """Drop cached API responses for a request, an endpoint or a category"""
+    api_client.invalidate(endpoint, params, category)
+
+
 def get_api_stats() -> Dict:
     """Get API client statistics"""
     return api_client.get_stats()
 
 
+def reset_circuit_breakers():
+    """Reset all API circuit breakers across the fleet"""
+    api_client.reset_circuit_breakers()
+
+
 def api_health_check() -> Dict:
     """Perform API health check"""
     return api_client.health_check()
\ No newline at end of file
@@ -0,0 +1,391 @@
+"""
+Asyncio counterpart of the robust API client
+Upstream calls go through a shared aiohttp session so one ASGI worker can
+wait on hundreds of gateway requests at once, while caching, circuit
+breakers, stale fallback and background refresh are shared with the sync
+client
+"""
+
+import copy
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Tuple, List
+
+import aiohttp
+from aiohttp.http_parser import HAS_BROTLI
+from asgiref.sync import sync_to_async
+
+from .api_client import api_client, APIRequest, APIResponse, RobustAPIClient, RETRY_STATUSES, UNREAD
+from .codecs import loads_json
+from .utils.deadline import DeadlineExceeded, cap
+
+api_logger = logging.getLogger('stream.api')
+
+# aiohttp decodes br when Brotli is installed, but has no zstd decoder
+ACCEPT_ENCODING = 'gzip, deflate, br' if HAS_BROTLI else 'gzip, deflate'
+
+
+class AsyncRobustAPIClient:
+    """
+    Async API client reusing a RobustAPIClient's cache, breakers and stats
+    """
+
+    def __init__(self, client: RobustAPIClient):
+        self.client = client
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Shared session for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Sessions are bound to the loop they were created on
+            self._loop = loop
+            self._in_flight = {}
+            # Time new connections for the adaptive connect timeouts, like the sync client's adapter
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_start.append(self._connect_started)
+            trace.on_connection_create_end.append(self._connect_ended)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=50, ttl_dns_cache=300),
+                trace_configs=[trace],
+                headers={
+                    'User-Agent': 'KortekStream/1.0 (Production)',
+                    'Accept': 'application/json',
+                    'Accept-Encoding': ACCEPT_ENCODING,
+                },
+            )
+        return self._session
+
+    @staticmethod
+    async def _connect_started(session, context, params):
+        context.connect_started = time.perf_counter()
+
+    @staticmethod
+    async def _connect_ended(session, context, params):
+        gateway = (context.trace_request_ctx or {}).get('gateway')
+        if gateway is not None:
+            gateway.connect_latency.record(time.perf_counter() - context.connect_started)
+
+    async def close(self):
+        """Close the shared session; called on ASGI lifespan shutdown (mysite/asgi.py)"""
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def get(self, endpoint: str, params: Dict = None,
+                  cache_timeout: int = 300, force_refresh: bool = False) -> APIResponse:
+        """
+        Make GET request with caching and circuit breaker
+        """
+        start_time = time.time()
+        url = f"{self.client.base_url}/{endpoint.lstrip('/')}"
+
+        # Generate cache key, then read the envelope and negative entry in one round trip
+        cache_key = await sync_to_async(self.client.cache.get_cache_key, thread_sensitive=False)(
+            endpoint, params
+        )
+        negative_key = self.client.negative_cache.key(cache_key)
+        envelopes, related = await sync_to_async(self.client.cache.read, thread_sensitive=False)(
+            [cache_key], [negative_key]
+        )
+        envelope = envelopes.get(cache_key)
+        negative = related.get(negative_key, UNREAD)
+
+        if force_refresh:
+            await sync_to_async(self.client.negative_cache.delete, thread_sensitive=False)(cache_key)
+            negative = None
+
+        # Try cache first (unless force refresh)
+        if not force_refresh and envelope is not None:
+            cached_response = await sync_to_async(self.client.serve_envelope, thread_sensitive=False)(
+                envelope, endpoint, cache_key, url, params, cache_timeout, start_time
+            )
+            if cached_response is not None:
+                return cached_response
+
+        self.client.stats['cache_misses'] += 1
+        return await self._coalesce(
+            cache_key,
+            lambda: self._fetch(endpoint, url, params, cache_key, cache_timeout, start_time,
+                                envelope, negative),
+            start_time,
+            use_lease=not force_refresh
+        )
+
+    async def get_many(self, batch: List, force_refresh: bool = False) -> List[APIResponse]:
+        """
+        Async counterpart of RobustAPIClient.get_many: one batched cache
+        lookup, then the misses are awaited together
+        """
+        start_time = time.time()
+        batch = [item if isinstance(item, APIRequest) else APIRequest(*item) for item in batch]
+        urls = [f"{self.client.base_url}/{item.endpoint.lstrip('/')}" for item in batch]
+        cache_keys = await sync_to_async(self.client.cache.get_cache_keys, thread_sensitive=False)(
+            [(item.endpoint, item.params) for item in batch]
+        )
+
+        unique_keys = list(dict.fromkeys(cache_keys))
+        envelopes, related = await sync_to_async(self.client.cache.read, thread_sensitive=False)(
+            unique_keys, [self.client.negative_cache.key(key) for key in unique_keys]
+        )
+
+        async def resolve(item, url, cache_key):
+            envelope = envelopes.get(cache_key)
+            negative = related.get(self.client.negative_cache.key(cache_key), UNREAD)
+            if force_refresh:
+                await sync_to_async(self.client.negative_cache.delete, thread_sensitive=False)(cache_key)
+                negative = None
+            if envelope is not None and not force_refresh:
+                response = await sync_to_async(self.client.serve_envelope, thread_sensitive=False)(
+                    envelope, item.endpoint, cache_key, url, item.params, item.cache_timeout, start_time
+                )
+                if response is not None:
+                    return response
+            self.client.stats['cache_misses'] += 1
+            return await self._coalesce(
+                cache_key,
+                lambda: self._fetch(item.endpoint, url, item.params, cache_key,
+                                    item.cache_timeout, start_time, envelope, negative),
+                start_time,
+                use_lease=not force_refresh
+            )
+
+        return list(await asyncio.gather(*[
+            resolve(item, url, cache_key) for item, url, cache_key in zip(batch, urls, cache_keys)
+        ]))
+
+    async def _coalesce(self, cache_key: str, fetch, start_time: float, use_lease: bool):
+        """Async single-flight: one fetch per key per loop, one per fleet via the lease"""
+        await self.get_session()
+        single_flight = self.client.single_flight
+
+        future = self._in_flight.get(cache_key)
+        if future is not None:
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.shield(future),
+                    cap(single_flight.wait_timeout + single_flight.lease_timeout)
+                )
+            except asyncio.TimeoutError:
+                result = None
+            if result is not None:
+                single_flight.stats['coalesced_local'] += 1
+                return copy.deepcopy(result)
+            # Leader failed without a result, fetch ourselves
+            return await fetch()
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = future
+        result = None
+        try:
+            single_flight.stats['leaders'] += 1
+            if use_lease:
+                result = await self._fetch_with_lease(cache_key, fetch, start_time)
+            else:
+                result = await fetch()
+            return result
+        finally:
+            self._in_flight.pop(cache_key, None)
+            future.set_result(result)
+
+    async def _fetch_with_lease(self, cache_key: str, fetch, start_time: float):
+        single_flight = self.client.single_flight
+        token = await sync_to_async(single_flight.acquire_lease, thread_sensitive=False)(cache_key)
+        if token is not None:
+            try:
+                return await fetch()
+            finally:
+                await sync_to_async(single_flight.release_lease, thread_sensitive=False)(cache_key, token)
+
+        # Another worker is fetching, wait for its result to land in the cache
+        poll = sync_to_async(self.client.cached_response, thread_sensitive=False)
+        deadline = time.time() + cap(single_flight.wait_timeout)
+        while time.time() < deadline:
+            result = await poll(cache_key, start_time)
+            if result is not None:
+                single_flight.stats['coalesced_remote'] += 1
+                return result
+            await asyncio.sleep(single_flight.poll_interval)
+
+        single_flight.stats['lease_wait_timeouts'] += 1
+        api_logger.info(f"Single-flight wait timed out for {cache_key}, fetching directly")
+        return await fetch()
+
+    async def _fetch(self, endpoint: str, url: str, params: Dict, cache_key: str,
+                     cache_timeout: int, start_time: float, envelope=None,
+                     negative: Any = UNREAD) -> APIResponse:
+        """Fetch from upstream, cache the result and fall back to stale data on failure"""
+        negative_response = await sync_to_async(self.client.negative_response, thread_sensitive=False)(
+            cache_key, start_time, negative
+        )
+        if negative_response is not None:
+            return negative_response
+
+        envelope = envelope if envelope is not None and envelope.data else None
+        try:
+            if not self.client.has_time_for_attempt():
+                raise DeadlineExceeded(f"No time left in the request deadline for {endpoint}")
+            
+            admission = await self.client.admission.aacquire(endpoint)
+            try:
+                status_code, data, validators = await self.client.get_circuit_breaker(endpoint).acall(
+                    self._make_request, url, params,
+                    envelope.conditional_headers() if envelope else None,
+                    endpoint
+                )
+            finally:
+                await sync_to_async(self.client.admission.release, thread_sensitive=False)(admission)
+            return await sync_to_async(self.client.handle_response, thread_sensitive=False)(
+                endpoint, params, cache_key, cache_timeout, start_time, status_code, data,
+                validators=validators, envelope=envelope
+            )
+        except aiohttp.ClientResponseError as e:
+            return await sync_to_async(self.client.handle_http_error, thread_sensitive=False)(
+                url, cache_key, start_time, e.status, e, envelope=envelope,
+                endpoint=endpoint, params=params
+            )
+        except Exception as e:
+            return await sync_to_async(self.client.handle_failure, thread_sensitive=False)(
+                url, cache_key, start_time, e, envelope=envelope,
+                endpoint=endpoint, params=params
+            )
+
+    async def _make_request(self, url: str, params: Dict = None, headers: Dict = None,
+                            endpoint: str = None) -> Tuple[int, Any, Dict]:
+        """
+        Make the actual HTTP request, retrying and hedging like the sync client
+        within the request deadline. Returns (status, data, validators); a 304
+        has no data to decode. With an endpoint, its adaptive timeouts apply
+        and latency is recorded.
+        """
+        session = await self.get_session()
+
+        attempt = 0
+        tried = set()
+        while True:
+            connect_timeout, read_timeout = self.client.attempt_timeouts(endpoint)
+            timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+            hedge_delay = self.client.hedge_delay(endpoint, read_timeout)
+            try:
+                if hedge_delay is None:
+                    result = await self._send(session, url, params, headers, timeout, endpoint, tried)
+                else:
+                    result = await self._hedged_send(session, url, params, headers, timeout,
+                                                     endpoint, hedge_delay, tried)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError,
+                    aiohttp.ClientResponseError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUSES
+                if not retryable:
+                    raise
+                attempt += 1
+                # The retry budget may live in Redis, check it off the event loop
+                delay = await sync_to_async(self.client.retry_wait, thread_sensitive=False)(attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            await sync_to_async(self.client.retry_budget.earn, thread_sensitive=False)()
+            return result
+
+    async def _send(self, session: aiohttp.ClientSession, url: str, params: Dict, headers: Dict,
+                    timeout: aiohttp.ClientTimeout, endpoint: Optional[str],
+                    tried: Optional[set] = None) -> Tuple[int, Any, Dict]:
+        """Async counterpart of RobustAPIClient._send"""
+        gateways = self.client.gateways
+        gateway = gateways.choose(exclude=tried or ())
+        if tried is not None:
+            tried.add(gateway)
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=min(timeout.sock_connect, self.client.get_connect_timeout(gateway)),
+            sock_read=timeout.sock_read
+        )
+
+        gateway.begin()
+        latency = None
+        failed = True
+        request_start = time.time()
+        try:
+            async with session.get(gateways.rebase(url, gateway), params=params, headers=headers,
+                                   timeout=timeout, trace_request_ctx={'gateway': gateway}) as response:
+                latency = time.time() - request_start
+                failed = response.status >= 500
+                if endpoint is not None:
+                    self.client.record_latency(endpoint, latency)
+                response.raise_for_status()
+                validators = self.client.response_validators(response.headers)
+                if response.status == 304 and headers:
+                    return response.status, None, validators
+                body = await response.read()
+        except aiohttp.ConnectionTimeoutError:
+            gateway.connect_latency.record(timeout.sock_connect)
+            raise
+        except aiohttp.SocketTimeoutError:
+            # Count read timeouts at the timeout so the histogram can grow back
+            latency = timeout.sock_read
+            if endpoint is not None:
+                self.client.record_latency(endpoint, latency)
+            raise
+        except asyncio.CancelledError:
+            # A hedge that lost the race says nothing about the gateway
+            failed = False
+            raise
+        finally:
+            gateway.end(latency, failed=failed)
+        try:
+            data = loads_json(body)
+        except ValueError:
+            data = {'error': 'Invalid JSON response', 'raw': body[:500].decode(errors='replace')}
+        return response.status, data, validators
+
+    async def _hedged_send(self, session: aiohttp.ClientSession, url: str, params: Dict,
+                           headers: Dict, timeout: aiohttp.ClientTimeout, endpoint: str,
+                           delay: float, tried: Optional[set] = None) -> Tuple[int, Any, Dict]:
+        """Async counterpart of RobustAPIClient._hedged_send; the losing request is cancelled"""
+        client = self.client
+        tried = set() if tried is None else tried
+        client.hedge_budget.earn()
+        primary = asyncio.ensure_future(self._send(session, url, params, headers, timeout, endpoint, tried))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        if not client.hedge_budget.spend():
+            client.hedge_stats['skipped_budget'] += 1
+            return await primary
+
+        client.hedge_stats['hedged'] += 1
+        hedged = asyncio.ensure_future(self._send(session, url, params, headers, timeout, endpoint, tried))
+        pending = {primary, hedged}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        client.hedge_stats['wins' if task is hedged else 'losses'] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self) -> Dict:
+        return self.client.get_stats()
+
+
+# Global async API client instance
+async_api_client = AsyncRobustAPIClient(api_client)
+
+
+async def async_make_api_request(endpoint: str, params: Dict = None,
+                                 cache_timeout: int = 300, force_refresh: bool = False) -> APIResponse:
+    """Make API request using the global async client"""
+    return await async_api_client.get(endpoint, params, cache_timeout, force_refresh)
+
+
+async def async_make_api_requests(batch: List, force_refresh: bool = False) -> List[APIResponse]:
+    """Make several API requests concurrently using the global async client"""
+    return await async_api_client.get_many(batch, force_refresh)
@@ -0,0 +1,230 @@
+"""
+Async versions of the stream page views
+Served under ASGI (see mysite/asgi.py) so a worker awaits upstream API calls
+instead of blocking on them. Request parsing and context building are shared
+with stream/views.py; only the API calls differ.
+"""
+
+import time
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+from django.utils.cache import patch_vary_headers
+
+from .api_client import APIRequest
+from .async_api_client import async_make_api_request, async_make_api_requests
+from .views import (
+    CATEGORIES_REQUEST, _categories_from_response, _cached_categories, _root_context,
+    _home_category, _home_context, _anime_detail_request, _anime_detail_context,
+    _latest_context, _schedule_context, _search_context, _episode_detail_request,
+    _episode_detail_context,
+)
+
+logger = logging.getLogger('stream.views')
+
+# Template rendering and the shared context builders are blocking (they read
+# and write the Django cache), so they run off the event loop
+arender = sync_to_async(render)
+
+
+def _off_loop(func):
+    return sync_to_async(func, thread_sensitive=False)
+
+
+async def _afetch_page_data(endpoint, params=None, cache_timeout=300):
+    """Async counterpart of views._fetch_page_data"""
+    try:
+        return await async_make_api_request(endpoint, params=params, cache_timeout=cache_timeout), None
+    except Exception as e:
+        return None, e
+
+
+async def _afetch_page_data_with_categories(endpoint, params=None, cache_timeout=300):
+    """Async counterpart of views._fetch_page_data_with_categories"""
+    try:
+        categories_response, response = await async_make_api_requests([
+            CATEGORIES_REQUEST,
+            APIRequest(endpoint, params, cache_timeout),
+        ])
+    except Exception as e:
+        logger.error(f"Failed to get categories: {str(e)}")
+        return ['anime', 'all'], None, e
+    return _categories_from_response(categories_response), response, None
+
+
+async def aget_categories():
+    """Async counterpart of views.get_categories"""
+    try:
+        response = await async_make_api_request(
+            CATEGORIES_REQUEST.endpoint,
+            cache_timeout=CATEGORIES_REQUEST.cache_timeout
+        )
+        return _categories_from_response(response)
+    except Exception as e:
+        logger.error(f"Failed to get categories: {str(e)}")
+        return ['anime', 'all']  # Fallback categories
+
+
+def _vary_on_user_agent(response):
+    # cache_page/vary_on_headers don't wrap coroutine views in Django 4.2,
+    # the site-wide cache middleware still caches these pages
+    patch_vary_headers(response, ('User-Agent',))
+    return response
+
+
+async def root(request):
+    """Root page with optimized caching and error handling"""
+    start_time = time.time()
+
+    categories, response, error = await _afetch_page_data_with_categories(
+        'api/v1/home',
+        params={'category': 'all'},
+        cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60)
+    )
+
+    context = await _off_loop(_root_context)(request, categories, response, error, start_time)
+    return _vary_on_user_agent(await arender(request, 'stream/root.html', context))
+
+
+async def home(request, category):
+    """Category home page with robust error handling and caching"""
+    start_time = time.time()
+    cache_timeout = getattr(settings, 'CACHE_TIMEOUT_SHORT', 60)
+
+    # Validated before the home endpoint is called, see views.home
+    categories = await _off_loop(_cached_categories)(request)
+    if categories is None:
+        categories = await aget_categories()
+        await _off_loop(cache.set)("categories_list", categories, 3600)
+    category = _home_category(category, categories)
+
+    response, error = await _afetch_page_data('api/v1/home', params={'category': category},
+                                              cache_timeout=cache_timeout)
+
+    context = await _off_loop(_home_context)(request, category, categories, response, error, start_time)
+    return _vary_on_user_agent(await arender(request, 'stream/index.html', context))
+
+
+async def anime_detail(request):
+    categories = await aget_categories()
+    # Clears the cached entry on retry requests, so run it off the event loop
+    identifier, category, params, cache_timeout = await _off_loop(_anime_detail_request)(
+        request, categories
+    )
+
+    if not identifier:
+        return await arender(request, 'stream/detail.html', {
+            "error": "No anime identifier provided",
+            "category": category,
+            "categories": categories
+        })
+
+    response, error = await _afetch_page_data('api/v1/anime-detail', params=params, cache_timeout=cache_timeout)
+
+    context = await _off_loop(_anime_detail_context)(request, identifier, category, categories, response, error)
+    return await arender(request, 'stream/detail.html', context)
+
+
+async def latest(request):
+    categories = await aget_categories()
+    default_category = categories[0] if categories else 'all'
+    category = request.GET.get('category', default_category)
+    page = request.GET.get('page', 1)
+
+    response, error = await _afetch_page_data(
+        'api/v1/anime-terbaru',
+        params={'category': category, 'page': page},
+        cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60)
+    )
+
+    context = await _off_loop(_latest_context)(request, category, page, categories, response, error)
+    return await arender(request, 'stream/latest.html', context)
+
+
+async def schedule(request):
+    categories = await aget_categories()
+    default_category = categories[0] if categories else 'all'
+    category = request.GET.get('category', default_category)
+    day = request.GET.get('day')
+
+    response, error = await _afetch_page_data(
+        "api/v1/jadwal-rilis",
+        params={'category': category},
+        cache_timeout=getattr(settings, 'CACHE_TIMEOUT_MEDIUM', 300)
+    )
+
+    context = await _off_loop(_schedule_context)(request, category, day, categories, response, error)
+    return await arender(request, 'stream/schedule.html', context)
+
+
+async def search(request):
+    """
+    View function for searching content across categories
+    """
+    query = request.GET.get('q', '')
+    page = request.GET.get('page', 1)
+
+    categories = await aget_categories()
+    default_category = categories[0] if categories else 'all'
+    category = request.GET.get('category', default_category)
+
+    response = error = None
+    if query:
+        response, error = await _afetch_page_data(
+            'api/v1/search',
+            params={'q': query, 'category': category, 'page': page},
+            cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60)
+        )
+
+    context = await _off_loop(_search_context)(request, query, category, page, categories, response, error)
+    return await arender(request, 'stream/search_results.html', context)
+
+
+async def episode_detail(request, encoded_id=None):
+    """
+    Optimized episode detail view with robust error handling and caching
+    Supports both encoded ID in URL path and legacy query parameters
+    """
+    start_time = time.time()
+    # Request parsing and context building read and write the Django cache
+    parse = _off_loop(_episode_detail_request)
+    cache_set = _off_loop(cache.set)
+
+    categories = await _off_loop(_cached_categories)(request)
+    lookup = await parse(request, encoded_id, categories)
+
+    if lookup['categories'] is None and (lookup['category'] is None or not lookup['identifier']):
+        categories = await aget_categories()
+        await cache_set("categories_list", categories, 3600)
+        lookup = await parse(request, encoded_id, categories)
+
+    if not lookup['identifier']:
+        return await arender(request, 'stream/episode_detail.html', {
+            "error": "No episode identifier provided",
+            "category": lookup['category'],
+            "categories": lookup['categories'],
+            "active_page": "episode_detail"
+        })
+
+    if lookup['categories'] is None:
+        categories, response, error = await _afetch_page_data_with_categories(
+            'api/v1/episode-detail',
+            params=lookup['params'],
+            cache_timeout=lookup['cache_timeout']
+        )
+        await cache_set("categories_list", categories, 3600)
+        lookup['categories'] = categories
+    else:
+        response, error = await _afetch_page_data(
+            'api/v1/episode-detail',
+            params=lookup['params'],
+            cache_timeout=lookup['cache_timeout']
+        )
+
+    context = await _off_loop(_episode_detail_context)(
+        request, lookup, response, error, start_time
+    )
+    return _vary_on_user_agent(await arender(request, 'stream/episode_detail.html', context))
@@ -0,0 +1,17 @@
+"""
+Django cache backends for the stream application
+"""
+
+from .tiered import TieredCache
+from .tinylfu import TinyLFUCache
+from .shared_memory import SharedMemoryCache
+from .disk import DiskLRUCache
+from .failover import FailoverCache
+
+__all__ = [
+    'TieredCache',
+    'TinyLFUCache',
+    'SharedMemoryCache',
+    'DiskLRUCache',
+    'FailoverCache',
+]
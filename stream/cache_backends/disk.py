@@ -0,0 +1,258 @@
+"""
+On-disk cache backend bounded by bytes, evicting least recently used entries
+
+A single SQLite file (stdlib only) shared by every worker on the host. It is
+slower than memory but survives restarts and never talks to the network,
+which makes it the fallback tier FailoverCache uses while Redis is down.
+
+The total size is kept in a one-row table maintained by triggers, so bounding
+it costs nothing per write; once MAX_BYTES is exceeded, expired entries go
+first and then the least recently read ones until the file is back under
+CULL_TO (a fraction of MAX_BYTES).
+
+Example::
+
+    'disk': {
+        'BACKEND': 'stream.cache_backends.DiskLRUCache',
+        'LOCATION': '/app/cache/disk-cache.sqlite3',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_BYTES': 256 * 1024 * 1024,
+        },
+    }
+"""
+
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from typing import Dict
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO cache_size (id, bytes) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache
+    BEGIN UPDATE cache_size SET bytes = bytes + NEW.size; END;
+CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache
+    BEGIN UPDATE cache_size SET bytes = bytes + NEW.size - OLD.size; END;
+CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache
+    BEGIN UPDATE cache_size SET bytes = bytes - OLD.size; END;
+"""
+
+UPSERT = """
+INSERT INTO cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, size = excluded.size, expires = excluded.expires, accessed = excluded.accessed
+"""
+
+# Only the first read of an entry within this many seconds updates its LRU position
+ACCESS_RESOLUTION = 1.0
+
+# SQLite limits the number of bound parameters per statement
+MAX_VARIABLES = 500
+
+
+class _Stats:
+    """Per-process counters shared by every DiskLRUCache instance with the same LOCATION"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+        }
+
+    def add(self, name: str, count: int = 1):
+        with self.lock:
+            self.counts[name] += count
+
+
+_stats: Dict[str, _Stats] = {}
+_stats_lock = threading.Lock()
+
+
+class DiskLRUCache(BaseCache):
+    """SQLite-backed cache bounded by MAX_BYTES, shared by the processes on a host"""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.max_bytes = int(options.get('MAX_BYTES', 256 * 1024 * 1024))
+        self.cull_to = int(self.max_bytes * options.get('CULL_TO', 0.9))
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5.0)
+        # Opened lazily; a forked worker must not reuse its parent's connection
+        self._connection = None
+        self._pid = None
+        with _stats_lock:
+            self._stats = _stats.setdefault(location, _Stats())
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            # Cache data: a crash may lose the last writes, but never blocks on fsync
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.executescript(SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _dumps(self, key: str, value):
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        return pickled, len(pickled) + len(key)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        values = self._get_many([key])
+        return values.get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        values = self._get_many(list(keys))
+        return {keys[key]: value for key, value in values.items()}
+
+    def _get_many(self, keys):
+        now = time.time()
+        found = {}
+        touched = []
+        for start in range(0, len(keys), MAX_VARIABLES):
+            chunk = keys[start:start + MAX_VARIABLES]
+            rows = self.connection.execute(
+                f"SELECT key, value, expires, accessed FROM cache WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = pickle.loads(value)
+                if accessed < now - ACCESS_RESOLUTION:
+                    touched.append(key)
+        if touched:
+            self.connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', [(now, key) for key in touched]
+            )
+        self._stats.add('hits', len(found))
+        self._stats.add('misses', len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled, size = self._dumps(key, value)
+        expires = self.get_backend_timeout(timeout)
+        if expires is not None and expires <= time.time():
+            self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return
+        self.connection.execute(UPSERT, (key, pickled, size, expires, time.time()))
+        self._cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled, size = self._dumps(key, value)
+        now = time.time()
+        # Replaces an expired row but never a live one
+        cursor = self.connection.execute(
+            UPSERT + ' WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, pickled, size, self.get_backend_timeout(timeout), now, now),
+        )
+        if cursor.rowcount:
+            self._cull()
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(row[0]) + delta
+            pickled, size = self._dumps(key, new_value)
+            connection.execute('UPDATE cache SET value = ?, size = ? WHERE key = ?', (pickled, size, key))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return new_value
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self.connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    # Size bound
+
+    def _size(self) -> int:
+        return self.connection.execute('SELECT bytes FROM cache_size').fetchone()[0]
+
+    def _cull(self):
+        size = self._size()
+        if size <= self.max_bytes:
+            return
+        connection = self.connection
+        evicted = connection.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),)).rowcount
+        excess = self._size() - self.cull_to
+        if excess > 0:
+            # Least recently read entries, just enough of them to get back under CULL_TO
+            evicted += connection.execute("""
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, size, SUM(size) OVER (ORDER BY accessed, key) AS running FROM cache
+                    ) WHERE running - size < ?
+                )
+            """, (excess,)).rowcount
+        self._stats.add('evictions', evicted)
+
+    def get_stats(self) -> Dict:
+        """This process's hit and eviction counts, plus the entries and bytes on disk"""
+        with self._stats.lock:
+            stats = dict(self._stats.counts)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+        entries, size = self.connection.execute(
+            'SELECT (SELECT COUNT(*) FROM cache), (SELECT bytes FROM cache_size)'
+        ).fetchone()
+        stats.update({'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes})
+        return stats
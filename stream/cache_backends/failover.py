@@ -0,0 +1,303 @@
+"""
+Cache backend that fails over from Redis to a local tier when Redis is down
+
+Every call goes to PRIMARY (a Redis alias) through a small circuit breaker.
+After FAILURE_THRESHOLD consecutive connection errors or timeouts the breaker
+opens, and for RETRY_AFTER seconds calls go straight to FALLBACK (a local
+DiskLRUCache) without waiting on a socket. After that a single call is let
+through to Redis as a probe: if it succeeds the breaker closes and traffic
+returns to Redis, otherwise it stays open for another RETRY_AFTER.
+
+The fallback is an outage-only tier, shared by every alias failing over to
+it and every worker on the host, so it is never cleared. Each alias keeps
+its keys there under its own namespace, ``<LOCATION>:<epoch>:``. The epoch
+is stored in the fallback itself. A process reads it the first time it
+needs the fallback and keeps it until Redis recovers. On recovery it writes
+a new epoch, so a later outage starts from an empty namespace and never
+serves entries (sessions included) deleted or replaced in Redis in between.
+Workers still failed over keep their epoch and data, and old namespaces
+expire or are evicted by the fallback's own bound.
+
+The PRIMARY alias should not swallow errors (no ``IGNORE_EXCEPTIONS``) and
+should have short socket timeouts, since the breaker can only react to
+errors it sees.
+
+Example::
+
+    'default': {
+        'BACKEND': 'stream.cache_backends.FailoverCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'PRIMARY': 'redis',
+            'FALLBACK': 'disk',
+            'FAILURE_THRESHOLD': 3,
+            'RETRY_AFTER': 10,
+        },
+    }
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+from ..utils.redis_client import OUTAGE_ERRORS
+
+logger = logging.getLogger('stream.api')
+
+
+class _Breaker:
+    """
+    Per-process breaker state shared by every FailoverCache instance with the
+    same LOCATION (Django creates one backend instance per thread)
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, retry_after: float):
+        self.lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.state = self.CLOSED
+        self.failures = 0
+        self.changed_at = time.time()
+        self.last_error: Optional[str] = None
+        # Fallback namespace of the current outage, read from the fallback on first use
+        self.epoch: Optional[int] = None
+        self.stats = {
+            'primary_calls': 0,
+            'primary_errors': 0,
+            'fallback_calls': 0,
+            'opens': 0,
+            'recoveries': 0,
+        }
+
+    def allow(self) -> bool:
+        """Whether this call may try Redis; moves an expired open breaker to half-open for one probe"""
+        if self.state == self.CLOSED:
+            return True
+        with self.lock:
+            if self.state == self.OPEN and time.time() - self.changed_at >= self.retry_after:
+                self._move(self.HALF_OPEN)
+                return True
+            return self.state == self.CLOSED
+
+    def success(self) -> bool:
+        """Record a successful Redis call; True when it closed the breaker"""
+        self.failures = 0
+        if self.state == self.CLOSED:
+            return False
+        with self.lock:
+            if self.state == self.CLOSED:
+                return False
+            self._move(self.CLOSED)
+            self.stats['recoveries'] += 1
+            return True
+
+    def failure(self, error: Exception):
+        with self.lock:
+            self.failures += 1
+            self.stats['primary_errors'] += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self._move(self.OPEN)
+                self.stats['opens'] += 1
+
+    def _move(self, state: str):
+        self.state = state
+        self.changed_at = time.time()
+
+
+_breakers: Dict[str, _Breaker] = {}
+_breakers_lock = threading.Lock()
+
+
+class FailoverCache(BaseCache):
+    """Django cache backend using PRIMARY while it answers and a local FALLBACK while it doesn't"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.primary_alias = options.get('PRIMARY', 'redis')
+        self.fallback_alias = options.get('FALLBACK', 'disk')
+        self.name = name = location or self.primary_alias
+        self.epoch_key = f"failover:{name}:epoch"
+        with _breakers_lock:
+            self._breaker = _breakers.get(name)
+            if self._breaker is None:
+                self._breaker = _breakers[name] = _Breaker(
+                    failure_threshold=options.get('FAILURE_THRESHOLD', 3),
+                    retry_after=options.get('RETRY_AFTER', 10),
+                )
+
+    @property
+    def primary(self) -> BaseCache:
+        return caches[self.primary_alias]
+
+    @property
+    def fallback(self) -> BaseCache:
+        return caches[self.fallback_alias]
+
+    @property
+    def available(self) -> bool:
+        """False while the breaker is open, so raw Redis users can skip Redis too"""
+        return self._breaker.state != _Breaker.OPEN
+
+    def _call(self, method: str, *args, fallback=None, **kwargs):
+        """Run ``method`` on PRIMARY through the breaker, or ``fallback()`` on FALLBACK"""
+        breaker = self._breaker
+        if breaker.allow():
+            breaker.stats['primary_calls'] += 1
+            try:
+                result = getattr(self.primary, method)(*args, **kwargs)
+            except OUTAGE_ERRORS as e:
+                was_closed = breaker.state == _Breaker.CLOSED
+                breaker.failure(e)
+                if was_closed and breaker.state == _Breaker.OPEN:
+                    logger.error(f"Cache '{self.primary_alias}' unreachable, failing over to "
+                                 f"'{self.fallback_alias}': {breaker.last_error}")
+            except Exception:
+                # Redis answered; the call itself was bad (e.g. incr of a missing key)
+                self._succeeded()
+                raise
+            else:
+                self._succeeded()
+                return result
+        breaker.stats['fallback_calls'] += 1
+        return fallback()
+
+    def _succeeded(self):
+        breaker = self._breaker
+        if breaker.success():
+            logger.info(f"Cache '{self.primary_alias}' recovered, leaving '{self.fallback_alias}'")
+        # Also after failed calls below FAILURE_THRESHOLD, which wrote to the fallback too
+        if breaker.epoch is not None:
+            self._new_epoch()
+
+    # Fallback namespace
+
+    def _new_epoch(self) -> Optional[int]:
+        """Start a new, empty fallback namespace for this alias; entries of the old one are left to expire"""
+        epoch = time.time_ns()
+        try:
+            self.fallback.set(self.epoch_key, epoch, timeout=None)
+        except Exception as e:
+            logger.warning(f"Could not start a new fallback namespace for '{self.name}': {str(e)}")
+            epoch = None
+        self._breaker.epoch = None
+        return epoch
+
+    def _fallback_key(self, key) -> str:
+        breaker = self._breaker
+        if breaker.epoch is None:
+            epoch = self.fallback.get(self.epoch_key)
+            if epoch is None:
+                # First outage, or the epoch was evicted: never reuse an old namespace
+                epoch = time.time_ns()
+                if not self.fallback.add(self.epoch_key, epoch, timeout=None):
+                    epoch = self.fallback.get(self.epoch_key, epoch)
+            breaker.epoch = epoch
+        return f"{self.name}:{breaker.epoch}:{key}"
+
+    # Cache API: keys are passed through unprefixed, each tier applies its own KEY_PREFIX
+
+    def make_key(self, key, version=None):
+        return self.primary.make_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('add', key, value, timeout=timeout, version=version, fallback=lambda: (
+            self.fallback.add(self._fallback_key(key), value, timeout=timeout, version=version)
+        ))
+
+    def get(self, key, default=None, version=None):
+        return self._call('get', key, default=default, version=version, fallback=lambda: (
+            self.fallback.get(self._fallback_key(key), default=default, version=version)
+        ))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('set', key, value, timeout=timeout, version=version, fallback=lambda: (
+            self.fallback.set(self._fallback_key(key), value, timeout=timeout, version=version)
+        ))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('touch', key, timeout=timeout, version=version, fallback=lambda: (
+            self.fallback.touch(self._fallback_key(key), timeout=timeout, version=version)
+        ))
+
+    def delete(self, key, version=None):
+        return self._call('delete', key, version=version, fallback=lambda: (
+            self.fallback.delete(self._fallback_key(key), version=version)
+        ))
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+
+        def fallback():
+            local = {self._fallback_key(key): key for key in keys}
+            values = self.fallback.get_many(list(local), version=version)
+            return {local[key]: value for key, value in values.items()}
+
+        return self._call('get_many', keys, version=version, fallback=fallback)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        def fallback():
+            local = {self._fallback_key(key): key for key in data}
+            failed = self.fallback.set_many(
+                {key: data[original] for key, original in local.items()}, timeout=timeout, version=version
+            )
+            return [local[key] for key in failed or []]
+
+        return self._call('set_many', data, timeout=timeout, version=version, fallback=fallback)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        return self._call('delete_many', keys, version=version, fallback=lambda: (
+            self.fallback.delete_many([self._fallback_key(key) for key in keys], version=version)
+        ))
+
+    def has_key(self, key, version=None):
+        return self._call('has_key', key, version=version, fallback=lambda: (
+            self.fallback.has_key(self._fallback_key(key), version=version)
+        ))
+
+    def incr(self, key, delta=1, version=None):
+        return self._call('incr', key, delta, version=version, fallback=lambda: (
+            self.fallback.incr(self._fallback_key(key), delta, version=version)
+        ))
+
+    def decr(self, key, delta=1, version=None):
+        return self._call('decr', key, delta, version=version, fallback=lambda: (
+            self.fallback.decr(self._fallback_key(key), delta, version=version)
+        ))
+
+    def clear(self):
+        # The fallback is shared with other aliases and workers: only this
+        # process's view of it is emptied, by moving to a new namespace
+        return self._call('clear', fallback=self._new_epoch)
+
+    def get_stats(self) -> Dict:
+        """Breaker state and call counts for this process, plus the fallback tier's stats"""
+        breaker = self._breaker
+        stats = dict(breaker.stats)
+        stats.update({
+            'state': breaker.state,
+            'healthy': breaker.state == _Breaker.CLOSED,
+            'seconds_in_state': round(time.time() - breaker.changed_at, 1),
+            'consecutive_failures': breaker.failures,
+            'last_error': breaker.last_error,
+            'fallback_epoch': breaker.epoch,
+        })
+        fallback_stats = getattr(self.fallback, 'get_stats', None)
+        if fallback_stats:
+            try:
+                stats['fallback'] = fallback_stats()
+            except Exception as e:
+                stats['fallback'] = {'error': str(e)}
+        return stats
@@ -0,0 +1,465 @@
+"""
+Cache backend in a memory-mapped file shared by every worker process
+
+Gunicorn workers each used to hold their own copy of the hot payloads, and
+lost it every ``--max-requests`` restart. This backend keeps one copy per
+host in a file on tmpfs (``/dev/shm``), created by the gunicorn master before
+the workers fork (see gunicorn.conf.py) so it outlives any single worker.
+
+Layout: a 16-byte header (magic, layout fingerprint), a table of write
+stamps, then one region per size class. Each region is a set-associative
+table of fixed-size slots (``WAYS`` slots per bucket). A slot is a 32-byte
+header (sequence number, flags, key hash, expiry, key and value lengths)
+followed by the key and the pickled value. An entry goes in the smallest class it fits; values too big
+for every class aren't cached.
+
+Reads take no lock. Every slot carries a seqlock: writers make the sequence
+number odd, write, and make it even again, and a reader retries when the
+number is odd or changed while it copied the slot. Writers serialise on an
+flock of the file (plus a thread lock within a process). A full bucket
+evicts the entry closest to expiring.
+
+Every write or delete of a key also bumps one of ``STAMPS`` counters picked
+by its hash. A reader filling the cache from a slower tier takes the stamps
+before its read and fills with set_many_if_unchanged, which skips keys
+written or deleted since: another worker's newer value is never overwritten
+by an older one (a colliding key only costs a skipped fill).
+
+Example::
+
+    'shared': {
+        'BACKEND': 'stream.cache_backends.SharedMemoryCache',
+        'LOCATION': '/dev/shm/kortekstream-l1',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'SLOTS': [(2048, 4096), (16384, 1024), (131072, 192)],
+        },
+    }
+"""
+
+import os
+import mmap
+import math
+import time
+import socket
+import struct
+import pickle
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger('stream.api')
+
+MAGIC = b'KSTRSHM1'
+HEADER = struct.Struct('<8sQ')
+# seq, flags, key hash, expires, key length, value length
+SLOT = struct.Struct('<IIQdII')
+SEQ = struct.Struct('<I')
+STAMP = struct.Struct('<Q')
+STAMPS = 4096
+USED = 1
+WAYS = 8
+# Attempts at a consistent copy of a slot being rewritten before giving up
+READ_RETRIES = 3
+
+DEFAULT_SLOTS = [(2048, 4096), (16384, 1024), (131072, 192)]
+
+
+def _key_hash(raw_key: bytes) -> int:
+    # Python's hash() differs per process, so use a stable one
+    return int.from_bytes(hashlib.blake2b(raw_key, digest_size=8).digest(), 'little')
+
+
+class _SizeClass:
+    """One region of equally sized slots"""
+    __slots__ = ('slot_size', 'count', 'offset', 'buckets')
+
+    def __init__(self, slot_size: int, count: int, offset: int):
+        self.slot_size = slot_size
+        self.count = max(WAYS, count - count % WAYS)
+        self.offset = offset
+        self.buckets = self.count // WAYS
+
+    @property
+    def size(self) -> int:
+        return self.slot_size * self.count
+
+    def bucket(self, key_hash: int) -> range:
+        """File offsets of the slots a key can live in"""
+        start = self.offset + (key_hash % self.buckets) * WAYS * self.slot_size
+        return range(start, start + WAYS * self.slot_size, self.slot_size)
+
+
+def _layout(slots) -> Tuple[List[_SizeClass], int, int]:
+    """Size classes, total file size and a fingerprint of the layout"""
+    classes = []
+    offset = HEADER.size + STAMPS * STAMP.size
+    for slot_size, count in sorted(slots):
+        size_class = _SizeClass(int(slot_size), int(count), offset)
+        classes.append(size_class)
+        offset += size_class.size
+    description = repr((STAMPS, [(c.slot_size, c.count) for c in classes])).encode()
+    fingerprint = int.from_bytes(hashlib.blake2b(description, digest_size=8).digest(), 'little')
+    return classes, offset, fingerprint
+
+
+class _Segment:
+    """This process's mapping of a shared cache file"""
+
+    def __init__(self, path: str, slots):
+        self.path = path
+        self.classes, self.size, self.fingerprint = _layout(slots)
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'too_large': 0,
+            'evictions': 0,
+            'read_retries': 0,
+        }
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self.write_lock():
+                if not self._valid():
+                    self._initialize()
+            self.mm = mmap.mmap(self.fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        except Exception:
+            os.close(self.fd)
+            raise
+        self.inode = os.fstat(self.fd).st_ino
+
+    def _valid(self) -> bool:
+        if os.fstat(self.fd).st_size != self.size:
+            return False
+        magic, fingerprint = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+        return magic == MAGIC and fingerprint == self.fingerprint
+
+    def _initialize(self):
+        # Truncating first zeroes every slot
+        os.ftruncate(self.fd, 0)
+        os.ftruncate(self.fd, self.size)
+        os.pwrite(self.fd, HEADER.pack(MAGIC, self.fingerprint), 0)
+
+    @staticmethod
+    def stamp_offset(key_hash: int) -> int:
+        return HEADER.size + (key_hash % STAMPS) * STAMP.size
+
+    def stamp(self, key_hash: int) -> int:
+        return STAMP.unpack_from(self.mm, self.stamp_offset(key_hash))[0]
+
+    def bump(self, key_hash: int):
+        """Record a write of a key; callers hold the write lock"""
+        offset = self.stamp_offset(key_hash)
+        STAMP.pack_into(self.mm, offset, (STAMP.unpack_from(self.mm, offset)[0] + 1) & 0xFFFFFFFFFFFFFFFF)
+
+    @contextmanager
+    def write_lock(self):
+        with self.lock:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+# One mapping per file and process, shared by the per-thread backend instances
+_segments: Dict[str, _Segment] = {}
+_segments_lock = threading.Lock()
+
+
+def create_segments():
+    """
+    Create a fresh, empty file for every SharedMemoryCache in settings.CACHES.
+    Run by the gunicorn master before it forks workers; an existing file is
+    unlinked rather than truncated, so processes still mapping it can't fault.
+    """
+    for alias, config in settings.CACHES.items():
+        if not config.get('BACKEND', '').endswith('SharedMemoryCache'):
+            continue
+        path = config['LOCATION']
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        segment = _Segment(path, config.get('OPTIONS', {}).get('SLOTS', DEFAULT_SLOTS))
+        segment.mm.close()
+        os.close(segment.fd)
+        logger.info(f"Created shared cache '{alias}' at {path} ({segment.size / 1024 / 1024:.0f} MiB)")
+
+
+class SharedMemoryCache(BaseCache):
+    """Host-wide cache in a shared memory-mapped file with lock-free reads"""
+
+    # Every process on this host sees the same entries (see TieredCache)
+    shared = True
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self.slots = params.get('OPTIONS', {}).get('SLOTS', DEFAULT_SLOTS)
+
+    def _segment(self) -> _Segment:
+        segment = _segments.get(self.path)
+        if segment is None or segment.pid != os.getpid():
+            # A forked process shares the parent's file lock; map the file again
+            with _segments_lock:
+                segment = _segments.get(self.path)
+                if segment is None or segment.pid != os.getpid():
+                    segment = _segments[self.path] = _Segment(self.path, self.slots)
+        return segment
+
+    @property
+    def node_id(self) -> str:
+        """Identifies this host's copy of the cache, the same in every worker"""
+        return f"{socket.gethostname()}:{self._segment().inode}"
+
+    # Slot access
+
+    def _read_slot(self, segment: _Segment, offset: int, raw_key: bytes, key_hash: int):
+        """
+        (found, expires, value bytes) for a slot, copied consistently;
+        found is None when the slot couldn't be read without tearing
+        """
+        mm = segment.mm
+        for _ in range(READ_RETRIES):
+            seq, flags, slot_hash, expires, key_len, value_len = SLOT.unpack_from(mm, offset)
+            if seq & 1:
+                segment.stats['read_retries'] += 1
+                continue
+            if not flags & USED or slot_hash != key_hash:
+                return False, None, None
+            start = offset + SLOT.size
+            stored_key = mm[start:start + key_len]
+            value = mm[start + key_len:start + key_len + value_len]
+            if SEQ.unpack_from(mm, offset)[0] != seq:
+                segment.stats['read_retries'] += 1
+                continue
+            if stored_key != raw_key:
+                return False, None, None
+            return True, expires, value
+        return None, None, None
+
+    def _find(self, segment: _Segment, raw_key: bytes, key_hash: int):
+        """Offset of the slot holding a key, or None; callers hold the write lock"""
+        for size_class in segment.classes:
+            for offset in size_class.bucket(key_hash):
+                found, _, _ = self._read_slot(segment, offset, raw_key, key_hash)
+                if found:
+                    return offset
+        return None
+
+    @staticmethod
+    def _write_slot(mm, offset: int, fields: Optional[tuple], data: bytes = b''):
+        """Rewrite a slot under its seqlock; ``fields`` None frees it"""
+        seq = SEQ.unpack_from(mm, offset)[0]
+        SEQ.pack_into(mm, offset, (seq + 1) & 0xFFFFFFFF)
+        if fields is None:
+            SLOT.pack_into(mm, offset, (seq + 1) & 0xFFFFFFFF, 0, 0, 0.0, 0, 0)
+        else:
+            SLOT.pack_into(mm, offset, (seq + 1) & 0xFFFFFFFF, *fields)
+            start = offset + SLOT.size
+            mm[start:start + len(data)] = data
+        SEQ.pack_into(mm, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def _store(self, key: str, value, timeout, only_if_absent: bool = False,
+               stamp: Optional[int] = None) -> bool:
+        """Write an entry; with ``stamp``, only if the key's write stamp still has that value"""
+        raw_key = key.encode()
+        key_hash = _key_hash(raw_key)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        expires = self.get_backend_timeout(timeout)
+        segment = self._segment()
+        with segment.write_lock():
+            if stamp is not None and segment.stamp(key_hash) != stamp:
+                return False
+            return self._put(segment, raw_key, key_hash, pickled,
+                             math.inf if expires is None else expires, only_if_absent)
+
+    def _put(self, segment: _Segment, raw_key: bytes, key_hash: int, pickled: bytes, expires: float,
+             only_if_absent: bool = False) -> bool:
+        """Write an entry in the smallest class it fits; callers hold the write lock"""
+        mm = segment.mm
+        now = time.time()
+        current = self._find(segment, raw_key, key_hash)
+        if only_if_absent and current is not None and SLOT.unpack_from(mm, current)[3] > now:
+            return False
+        segment.bump(key_hash)
+        if current is not None:
+            self._write_slot(mm, current, None)
+        needed = SLOT.size + len(raw_key) + len(pickled)
+        target_class = next((c for c in segment.classes if c.slot_size >= needed), None)
+        if target_class is None:
+            segment.stats['too_large'] += 1
+            return False
+        if expires <= now:
+            return True
+
+        # Prefer a free slot, then an expired one, then the one expiring first
+        target, target_expires = None, None
+        for offset in target_class.bucket(key_hash):
+            _, flags, _, slot_expires, _, _ = SLOT.unpack_from(mm, offset)
+            if not flags & USED:
+                target, target_expires = offset, None
+                break
+            if target is None or slot_expires < target_expires:
+                target, target_expires = offset, slot_expires
+        if target_expires is not None and target_expires > now:
+            segment.stats['evictions'] += 1
+        self._write_slot(mm, target, (USED, key_hash, expires, len(raw_key), len(pickled)),
+                         raw_key + pickled)
+        segment.stats['sets'] += 1
+        return True
+
+    def _load(self, key: str):
+        """(found, value) read without locking"""
+        raw_key = key.encode()
+        key_hash = _key_hash(raw_key)
+        segment = self._segment()
+        for size_class in segment.classes:
+            for offset in size_class.bucket(key_hash):
+                found, expires, value = self._read_slot(segment, offset, raw_key, key_hash)
+                if found:
+                    if expires <= time.time():
+                        return False, None
+                    return True, pickle.loads(value)
+        return False, None
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        found, value = self._load(key)
+        self._segment().stats['hits' if found else 'misses'] += 1
+        return value if found else default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._store(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._store(key, value, timeout, only_if_absent=True)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key = key.encode()
+        key_hash = _key_hash(raw_key)
+        segment = self._segment()
+        expires = self.get_backend_timeout(timeout)
+        with segment.write_lock():
+            offset = self._find(segment, raw_key, key_hash)
+            if offset is None:
+                return False
+            _, flags, _, old_expires, key_len, value_len = SLOT.unpack_from(segment.mm, offset)
+            if old_expires <= time.time():
+                return False
+            start = offset + SLOT.size
+            data = segment.mm[start:start + key_len + value_len]
+            self._write_slot(segment.mm, offset,
+                             (flags, key_hash, math.inf if expires is None else expires, key_len, value_len),
+                             data)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key = key.encode()
+        key_hash = _key_hash(raw_key)
+        segment = self._segment()
+        with segment.write_lock():
+            offset = self._find(segment, raw_key, key_hash)
+            found, expires, value = (None, None, None) if offset is None \
+                else self._read_slot(segment, offset, raw_key, key_hash)
+            if not found or expires <= time.time():
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(value) + delta
+            self._put(segment, raw_key, key_hash, pickle.dumps(new_value, self.pickle_protocol), expires)
+        return new_value
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._load(key)[0]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key = key.encode()
+        segment = self._segment()
+        key_hash = _key_hash(raw_key)
+        with segment.write_lock():
+            segment.bump(key_hash)
+            offset = self._find(segment, raw_key, key_hash)
+            if offset is None:
+                return False
+            self._write_slot(segment.mm, offset, None)
+        return True
+
+    def clear(self):
+        segment = self._segment()
+        with segment.write_lock():
+            for index in range(STAMPS):
+                segment.bump(index)
+            for size_class in segment.classes:
+                for offset in range(size_class.offset, size_class.offset + size_class.size,
+                                    size_class.slot_size):
+                    if SLOT.unpack_from(segment.mm, offset)[1] & USED:
+                        self._write_slot(segment.mm, offset, None)
+
+    # Conditional fills (see TieredCache)
+
+    def write_stamps(self, keys, version=None) -> Dict[str, int]:
+        """Current write stamp of each key, to pass to set_many_if_unchanged"""
+        segment = self._segment()
+        return {
+            key: segment.stamp(_key_hash(self.make_and_validate_key(key, version=version).encode()))
+            for key in keys
+        }
+
+    def set_many_if_unchanged(self, data, stamps: Dict[str, int], timeout=DEFAULT_TIMEOUT,
+                              version=None) -> List:
+        """
+        set_many that skips keys written or deleted since ``stamps`` were
+        taken (write_stamps); returns the keys not set
+        """
+        skipped = []
+        for key, value in data.items():
+            made_key = self.make_and_validate_key(key, version=version)
+            if key not in stamps or not self._store(made_key, value, timeout, stamp=stamps[key]):
+                skipped.append(key)
+        return skipped
+
+    def get_stats(self) -> Dict:
+        """This process's hit/miss counts plus the entries held per size class (shared)"""
+        segment = self._segment()
+        now = time.time()
+        classes = {}
+        for size_class in segment.classes:
+            entries = used_bytes = 0
+            for offset in range(size_class.offset, size_class.offset + size_class.size, size_class.slot_size):
+                _, flags, _, expires, key_len, value_len = SLOT.unpack_from(segment.mm, offset)
+                if flags & USED and expires > now:
+                    entries += 1
+                    used_bytes += SLOT.size + key_len + value_len
+            classes[size_class.slot_size] = {
+                'slots': size_class.count, 'entries': entries, 'bytes': used_bytes,
+            }
+        lookups = segment.stats['hits'] + segment.stats['misses']
+        return {
+            **segment.stats,
+            'hit_ratio': round(segment.stats['hits'] / lookups, 3) if lookups else None,
+            'size': segment.size,
+            'classes': classes,
+        }
@@ -0,0 +1,335 @@
+"""
+Two-tier cache backend: a process-local L1 in front of a shared L2
+
+Reads are answered from L1 (a local cache alias such as ``fast``) when
+possible and fall through to L2 (the Redis ``default`` alias), filling L1 on
+the way back. Every write, delete and incr goes to L2 and publishes the keys
+on a Redis channel; each worker process listens on it and drops those keys
+from its own L1, so a value refreshed by one worker is never served stale by
+another.
+
+L1 is only used while the process is subscribed. When the subscription
+drops, or L2 is a FailoverCache serving from its local fallback, reads go
+straight to L2 until it is re-established, and L1 is cleared then since
+invalidations may have been missed.
+
+An L1 shared by every worker on the host (``shared = True``, e.g.
+SharedMemoryCache) is treated as one node: a worker starting up doesn't
+clear it, since its siblings kept it coherent, and workers skip the
+invalidations their siblings publish, which only repeat deletes already
+done in the shared L1. A worker never hears of a sibling's write through
+the channel, though, so fills of a shared L1 are made conditional instead:
+the L1's write stamps are taken before the L2 read and the fill skips keys
+written or deleted since (``set_many_if_unchanged``). Writes only drop the
+key from a shared L1; the next read fills it, as two writers racing could
+otherwise leave the older value in L1.
+
+Example::
+
+    'tiered': {
+        'BACKEND': 'stream.cache_backends.TieredCache',
+        'LOCATION': 'tiered',
+        'OPTIONS': {
+            'L1': 'fast',
+            'L2': 'default',
+            'CHANNEL': 'cache_invalidation',
+            'L1_TIMEOUT': 30,
+        },
+    }
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+from ..utils.redis_client import get_redis_connection
+
+logger = logging.getLogger('stream.api')
+
+
+class _TierState:
+    """
+    Per-process state shared by every TieredCache instance with the same
+    LOCATION (Django creates one backend instance per thread): the
+    invalidation listener, its subscription status and the hit counters.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.node = None
+        self.subscribed = False
+        self.ever_subscribed = False
+        # Bumped on every invalidation received; L1 is only filled from an
+        # L2 read when no invalidation arrived while that read was in flight
+        self.sequence = 0
+        self.stats = {
+            'l1_hits': 0,
+            'l2_hits': 0,
+            'misses': 0,
+            'invalidations_published': 0,
+            'invalidations_received': 0,
+            'resubscribes': 0,
+        }
+
+
+_states: Dict[str, _TierState] = {}
+_states_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """Django cache backend serving reads from a local L1 kept coherent over Redis pub/sub"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l1_alias = options.get('L1', 'fast')
+        self.l2_alias = options.get('L2', 'default')
+        self.channel = options.get('CHANNEL', 'cache_invalidation')
+        self.l1_timeout = options.get('L1_TIMEOUT', 30)
+        self._state_name = location or f"{self.l1_alias}:{self.l2_alias}"
+        with _states_lock:
+            self._state = _states.setdefault(self._state_name, _TierState())
+
+    @property
+    def l1(self) -> BaseCache:
+        return caches[self.l1_alias]
+
+    @property
+    def l2(self) -> BaseCache:
+        return caches[self.l2_alias]
+
+    @property
+    def _shared_l1(self) -> bool:
+        """Whether L1 is one copy for the whole host that can be filled conditionally"""
+        return getattr(self.l1, 'shared', False) and hasattr(self.l1, 'set_many_if_unchanged')
+
+    # Invalidation channel
+
+    def _ensure_listener(self) -> bool:
+        """Start this process's listener if needed; True when L1 may be used"""
+        state = self._state
+        if state.pid != os.getpid():
+            with state.lock:
+                if state.pid != os.getpid():
+                    # A forked worker inherits the parent's state but not its thread
+                    state.pid = os.getpid()
+                    state.node = getattr(self.l1, 'node_id', None) or uuid.uuid4().hex
+                    state.subscribed = False
+                    state.ever_subscribed = False
+                    state.sequence += 1
+                    threading.Thread(
+                        target=self._listen, name=f'cache-invalidation-{self.channel}', daemon=True
+                    ).start()
+        return state.subscribed
+
+    def _listen(self):
+        state = self._state
+        delay = 1
+        while state.pid == os.getpid():
+            client = get_redis_connection(self.l2_alias)
+            if client is None:
+                if isinstance(self.l2, LocMemCache):
+                    # No channel needed: L2 is itself process-local
+                    state.subscribed = True
+                    return
+                # Redis is down (failover breaker open): retry until it's back
+                state.subscribed = False
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+
+            pubsub = None
+            try:
+                pubsub = client.pubsub()
+                pubsub.subscribe(self.channel)
+                while state.pid == os.getpid():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    if message['type'] == 'subscribe':
+                        self._resubscribed()
+                        delay = 1
+                    elif message['type'] == 'message':
+                        self._receive(message['data'])
+            except Exception as e:
+                logger.warning(f"Cache invalidation channel {self.channel} lost: {str(e)}")
+            finally:
+                state.subscribed = False
+                state.sequence += 1
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _resubscribed(self):
+        state = self._state
+        # Anything published while we weren't listening was missed, unless
+        # this is a new worker joining siblings that kept a shared L1 current
+        if state.ever_subscribed or not getattr(self.l1, 'shared', False):
+            self.l1.clear()
+        state.sequence += 1
+        state.subscribed = True
+        state.ever_subscribed = True
+        state.stats['resubscribes'] += 1
+
+    def _receive(self, data):
+        state = self._state
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logger.warning(f"Ignoring malformed cache invalidation on {self.channel}")
+            return
+        if message.get('node') == state.node:
+            return
+        state.sequence += 1
+        state.stats['invalidations_received'] += 1
+        if message.get('clear'):
+            self.l1.clear()
+        else:
+            self.l1.delete_many(message.get('keys', []), version=message.get('version'))
+
+    def _drop_local(self, keys: Iterable[str], version=None):
+        keys = list(keys)
+        self._state.sequence += 1
+        self.l1.delete_many(keys, version=version)
+        return keys
+
+    def invalidate(self, keys: Iterable[str], version=None):
+        """Drop keys from every worker's L1, leaving L2 as it is"""
+        keys = self._drop_local(keys, version)
+        self._publish({'keys': keys, 'version': version})
+
+    def _publish(self, message: Dict):
+        client = get_redis_connection(self.l2_alias)
+        if client is None:
+            return
+        self._ensure_listener()
+        message['node'] = self._state.node
+        try:
+            client.publish(self.channel, json.dumps(message))
+            self._state.stats['invalidations_published'] += 1
+        except Exception as e:
+            logger.warning(f"Could not publish cache invalidation on {self.channel}: {str(e)}")
+
+    # Cache API
+
+    def _local_timeout(self, timeout) -> Optional[float]:
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def make_key(self, key, version=None):
+        return self.l2.make_key(key, version=version)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None) -> Dict[str, Any]:
+        return self.get_many_with(keys, version=version)[0]
+
+    def get_many_with(self, keys, related=(), version=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        get_many for ``keys`` that also reads ``related`` keys, but only from
+        L1 or in the same L2 round trip as the keys that miss L1. Returns
+        (found, related values); related keys that weren't read are left out
+        of the second dict, ones read and missing map to None.
+        """
+        keys = list(keys)
+        related = [key for key in related if key not in keys]
+        state = self._state
+        found = {}
+        use_l1 = self._ensure_listener()
+        if use_l1:
+            found = self.l1.get_many(keys + related, version=version)
+            state.stats['l1_hits'] += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            wanted = missing + [key for key in related if key not in found]
+            sequence = state.sequence
+            stamps = self.l1.write_stamps(wanted, version=version) if use_l1 and self._shared_l1 else None
+            values = self.l2.get_many(wanted, version=version)
+            state.stats['l2_hits'] += len(values)
+            state.stats['misses'] += len(wanted) - len(values)
+            if values and use_l1 and state.sequence == sequence:
+                if stamps is not None:
+                    self.l1.set_many_if_unchanged(values, stamps, timeout=self.l1_timeout, version=version)
+                else:
+                    self.l1.set_many(values, timeout=self.l1_timeout, version=version)
+            found.update(values)
+            related_values = {key: found.pop(key, None) for key in related}
+        else:
+            related_values = {key: found.pop(key) for key in related if key in found}
+        return found, related_values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None) -> List[str]:
+        # django-redis returns None rather than the keys it failed to set
+        failed = self.l2.set_many(data, timeout=timeout, version=version) or []
+        self.invalidate(data, version=version)
+        local_timeout = self._local_timeout(timeout)
+        if self._ensure_listener() and local_timeout > 0 and not self._shared_l1:
+            self.l1.set_many({key: value for key, value in data.items() if key not in failed},
+                             timeout=local_timeout, version=version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None) -> bool:
+        # Only written when L2 doesn't hold the key; a copy another worker
+        # still has in L1 outlived its L2 entry and lapses within L1_TIMEOUT
+        return self.l2.add(key, value, timeout=timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None) -> bool:
+        return self.l2.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None) -> bool:
+        deleted = self.l2.delete(key, version=version)
+        self.invalidate([key], version=version)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        self.invalidate(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self.invalidate([key], version=version)
+        return value
+
+    def has_key(self, key, version=None) -> bool:
+        return key in self.get_many([key], version=version)
+
+    def clear(self):
+        self.l2.clear()
+        self.l1.clear()
+        self._state.sequence += 1
+        self._publish({'clear': True})
+
+    def get_stats(self) -> Dict:
+        """Hit counts and ratios per tier for this process"""
+        state = self._state
+        stats = dict(state.stats)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        for tier in ('l1', 'l2'):
+            stats[f'{tier}_hit_ratio'] = round(stats[f'{tier}_hits'] / lookups, 3) if lookups else None
+        stats['hit_ratio'] = round((stats['l1_hits'] + stats['l2_hits']) / lookups, 3) if lookups else None
+        stats['subscribed'] = state.subscribed
+        for tier in ('l1', 'l2'):
+            tier_stats = getattr(getattr(self, tier), 'get_stats', None)
+            if tier_stats:
+                stats[tier] = tier_stats()
+        return stats
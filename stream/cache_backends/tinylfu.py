@@ -0,0 +1,348 @@
+"""
+In-process cache backend bounded by bytes, with W-TinyLFU admission
+
+A drop-in replacement for LocMemCache where its culling hurts: LocMemCache
+counts entries rather than bytes and, once full, throws away a third or half
+of everything regardless of how often it is used. Here every entry is
+measured by its pickled size, and eviction follows W-TinyLFU:
+
+* New entries land in a small LRU window (``WINDOW_RATIO`` of the bytes).
+* Entries pushed out of the window compete for the main area with its LRU
+  victim and only get in if they've been asked for more often, according
+  to a count-min sketch of recent key frequencies that halves itself
+  periodically so old popularity fades.
+* The main area is a segmented LRU: entries hit again move from probation to
+  the protected segment (``PROTECTED_RATIO`` of the main area).
+
+One-off keys such as search queries therefore pass through the window
+without displacing the hot home and episode entries.
+
+Example::
+
+    'fast': {
+        'BACKEND': 'stream.cache_backends.TinyLFUCache',
+        'LOCATION': 'fast-cache',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_BYTES': 64 * 1024 * 1024,
+        },
+    }
+"""
+
+import time
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+# Rough per-entry bookkeeping cost added to the pickled size
+ENTRY_OVERHEAD = 100
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of 4-bit counters, four rows deep. After ``10 * width``
+    increments every counter is halved, so the sketch tracks recent
+    popularity rather than all-time counts.
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, width: int = 1024):
+        self.width = 1 << max(width - 1, 1).bit_length()
+        self.mask = self.width - 1
+        self.table = bytearray(self.width * self.DEPTH)
+        self.sample_size = 10 * self.width
+        self.additions = 0
+
+    def _indexes(self, key: str):
+        h = hash(key)
+        step = (h >> 17) | 1
+        return [row * self.width + ((h + row * step) & self.mask) for row in range(self.DEPTH)]
+
+    def increment(self, key: str):
+        table = self.table
+        added = False
+        for index in self._indexes(key):
+            if table[index] < self.MAX_COUNT:
+                table[index] += 1
+                added = True
+        if added:
+            self.additions += 1
+            if self.additions >= self.sample_size:
+                self.table = bytearray(count >> 1 for count in table)
+                self.additions //= 2
+
+    def frequency(self, key: str) -> int:
+        table = self.table
+        return min(table[index] for index in self._indexes(key))
+
+    def clear(self):
+        self.table = bytearray(len(self.table))
+        self.additions = 0
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires')
+
+    def __init__(self, value: bytes, size: int, expires: Optional[float]):
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+    def expired(self, now: float) -> bool:
+        return self.expires is not None and self.expires <= now
+
+
+class _Segment(OrderedDict):
+    """LRU-ordered entries (least recent first) with their total size"""
+
+    def __init__(self):
+        super().__init__()
+        self.bytes = 0
+
+    def put(self, key: str, entry: _Entry):
+        self[key] = entry
+        self.bytes += entry.size
+
+    def take(self, key: str) -> _Entry:
+        entry = self.pop(key)
+        self.bytes -= entry.size
+        return entry
+
+    def lru(self) -> Optional[str]:
+        return next(iter(self), None)
+
+
+class _Store:
+    """The W-TinyLFU structures behind one cache LOCATION; callers hold ``lock``"""
+
+    def __init__(self, max_bytes: int, window_ratio: float, protected_ratio: float, sketch_width: int):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.window_max = max(1, int(max_bytes * window_ratio))
+        self.main_max = max_bytes - self.window_max
+        self.protected_max = int(self.main_max * protected_ratio)
+        self.window = _Segment()
+        self.probation = _Segment()
+        self.protected = _Segment()
+        self.index: Dict[str, _Segment] = {}
+        self.sketch = FrequencySketch(sketch_width)
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'rejections': 0,
+            'expirations': 0,
+        }
+
+    def peek(self, key: str, now: float) -> Optional[_Entry]:
+        """The live entry for a key, without counting an access"""
+        segment = self.index.get(key)
+        if segment is None:
+            return None
+        entry = segment[key]
+        if entry.expired(now):
+            self.remove(key)
+            self.stats['expirations'] += 1
+            return None
+        return entry
+
+    def lookup(self, key: str, now: float) -> Optional[_Entry]:
+        self.sketch.increment(key)
+        entry = self.peek(key, now)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+
+        segment = self.index[key]
+        if segment is self.probation:
+            self.protected.put(key, self.probation.take(key))
+            self.index[key] = self.protected
+            self._demote()
+        else:
+            segment.move_to_end(key)
+        return entry
+
+    def _demote(self):
+        """Move protected entries over its share back to probation"""
+        while self.protected.bytes > self.protected_max:
+            demoted = self.protected.lru()
+            self.probation.put(demoted, self.protected.take(demoted))
+            self.index[demoted] = self.probation
+
+    def insert(self, key: str, entry: _Entry, now: float):
+        self.sketch.increment(key)
+        segment = self.index.get(key)
+        if segment is not None and segment is not self.window and entry.size <= self.main_max:
+            # Rewriting an entry that already earned its place: replace it there
+            segment.take(key)
+            segment.put(key, entry)
+            while self.probation.bytes + self.protected.bytes > self.main_max:
+                victim = (self.probation if self.probation else self.protected).lru()
+                self.remove(victim)
+                self.stats['evictions'] += 1
+            self._demote()
+            return
+
+        self.remove(key)
+        if entry.size > self.main_max:
+            self.stats['rejections'] += 1
+            return
+        self.window.put(key, entry)
+        self.index[key] = self.window
+        while self.window.bytes > self.window_max:
+            candidate = self.window.lru()
+            self._admit(candidate, self.window.take(candidate), now)
+
+    def _admit(self, key: str, entry: _Entry, now: float):
+        """Move an entry leaving the window into probation, if it beats the victims it would displace"""
+        del self.index[key]
+        while self.probation.bytes + self.protected.bytes + entry.size > self.main_max:
+            segment = self.probation if self.probation else self.protected
+            victim = segment.lru()
+            if segment[victim].expired(now):
+                self.remove(victim)
+                self.stats['expirations'] += 1
+            elif self.sketch.frequency(key) > self.sketch.frequency(victim):
+                self.remove(victim)
+                self.stats['evictions'] += 1
+            else:
+                self.stats['rejections'] += 1
+                return
+        self.probation.put(key, entry)
+        self.index[key] = self.probation
+
+    def replace_value(self, key: str, value: bytes, size: int):
+        segment = self.index[key]
+        entry = segment[key]
+        segment.bytes += size - entry.size
+        entry.value, entry.size = value, size
+
+    def remove(self, key: str) -> bool:
+        segment = self.index.pop(key, None)
+        if segment is None:
+            return False
+        segment.take(key)
+        return True
+
+    def clear(self):
+        for segment in (self.window, self.probation, self.protected):
+            segment.clear()
+            segment.bytes = 0
+        self.index.clear()
+        self.sketch.clear()
+
+
+# Stores are shared by every backend instance (one per thread) with the same LOCATION
+_stores: Dict[str, _Store] = {}
+_stores_lock = threading.Lock()
+
+
+class TinyLFUCache(BaseCache):
+    """Thread-safe in-process cache bounded by MAX_BYTES, evicting by W-TinyLFU"""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        max_bytes = int(options.get('MAX_BYTES', 64 * 1024 * 1024))
+        with _stores_lock:
+            self._store = _stores.get(name)
+            if self._store is None:
+                self._store = _stores[name] = _Store(
+                    max_bytes=max_bytes,
+                    window_ratio=options.get('WINDOW_RATIO', 0.01),
+                    protected_ratio=options.get('PROTECTED_RATIO', 0.8),
+                    # Sized for entries of ~2 KiB on average
+                    sketch_width=options.get('SKETCH_WIDTH', max(1024, max_bytes // 2048)),
+                )
+
+    def _entry(self, key: str, value, timeout) -> _Entry:
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        return _Entry(pickled, len(pickled) + len(key) + ENTRY_OVERHEAD, self.get_backend_timeout(timeout))
+
+    def _set(self, key: str, entry: _Entry, now: float):
+        if entry.expired(now):
+            self._store.remove(key)
+        else:
+            self._store.insert(key, entry, now)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        entry = self._entry(key, value, timeout)
+        now = time.time()
+        with self._store.lock:
+            if self._store.peek(key, now) is not None:
+                return False
+            self._set(key, entry, now)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            entry = self._store.lookup(key, time.time())
+        if entry is None:
+            return default
+        return pickle.loads(entry.value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        entry = self._entry(key, value, timeout)
+        with self._store.lock:
+            self._set(key, entry, time.time())
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            entry = self._store.peek(key, time.time())
+            if entry is None:
+                return False
+            entry.expires = self.get_backend_timeout(timeout)
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            entry = self._store.peek(key, time.time())
+            if entry is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(entry.value) + delta
+            pickled = pickle.dumps(new_value, self.pickle_protocol)
+            self._store.replace_value(key, pickled, len(pickled) + len(key) + ENTRY_OVERHEAD)
+        return new_value
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            return self._store.peek(key, time.time()) is not None
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._store.lock:
+            return self._store.remove(key)
+
+    def clear(self):
+        with self._store.lock:
+            self._store.clear()
+
+    def get_stats(self) -> Dict:
+        """Hit, miss and eviction counts plus the bytes held per segment"""
+        store = self._store
+        with store.lock:
+            lookups = store.stats['hits'] + store.stats['misses']
+            return {
+                **store.stats,
+                'hit_ratio': round(store.stats['hits'] / lookups, 3) if lookups else None,
+                'entries': len(store.index),
+                'bytes': store.window.bytes + store.probation.bytes + store.protected.bytes,
+                'max_bytes': store.max_bytes,
+                'window_bytes': store.window.bytes,
+                'probation_bytes': store.probation.bytes,
+                'protected_bytes': store.protected.bytes,
+            }
@@ -0,0 +1,151 @@
+"""
+Serialization codecs for cached API payloads and upstream response bodies
+
+Cache envelopes store their payload encoded with the codec chosen by the
+API_CACHE_CODEC setting, tagged ``<name>:<version>``. Readers decode any tag
+they know and treat the rest as a miss, so the codec can be switched (or a
+codec's format changed, with a version bump) without a cache flush.
+"""
+
+import json
+import pickle
+import logging
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+logger = logging.getLogger('stream.api')
+
+# Parser behind loads_json
+JSON_PARSER = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+
+
+class Codec:
+    """Encodes cache payloads to bytes and back"""
+    name = None
+    version = 1
+    available = True
+
+    @property
+    def tag(self) -> str:
+        return f"{self.name}:{self.version}"
+
+    def dumps(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, payload: bytes) -> Any:
+        raise NotImplementedError
+
+
+class PickleCodec(Codec):
+    """Any picklable value; the fallback for values other codecs can't encode"""
+    name = 'pickle'
+
+    def dumps(self, value: Any) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, payload: bytes) -> Any:
+        return pickle.loads(payload)
+
+
+class OrjsonCodec(Codec):
+    """JSON-shaped payloads via orjson; tuples come back as lists"""
+    name = 'orjson'
+    available = orjson is not None
+
+    def dumps(self, value: Any) -> bytes:
+        # Non-str keys raise, so such values go to pickle instead of losing their key types
+        return orjson.dumps(value)
+
+    def loads(self, payload: bytes) -> Any:
+        return orjson.loads(payload)
+
+
+class MsgpackCodec(Codec):
+    """JSON-shaped payloads via msgpack; smaller than JSON for numeric-heavy data"""
+    name = 'msgpack'
+    available = msgpack is not None
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, payload: bytes) -> Any:
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+PICKLE = PickleCodec()
+
+CODECS: Dict[str, Codec] = {codec.tag: codec for codec in (PICKLE, OrjsonCodec(), MsgpackCodec())}
+
+_active = None
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+    """
+    The codec called ``name`` (default: settings.API_CACHE_CODEC), falling
+    back to pickle with a warning when its library isn't installed;
+    ImproperlyConfigured for names no codec has
+    """
+    global _active
+    if name is None and _active is not None:
+        return _active
+
+    wanted = name or getattr(settings, 'API_CACHE_CODEC', 'orjson')
+    codec = next((c for c in CODECS.values() if c.name == wanted), None)
+    if codec is None:
+        raise ImproperlyConfigured(
+            f"Unknown cache codec '{wanted}', expected one of: "
+            + ', '.join(sorted({c.name for c in CODECS.values()}))
+        )
+    if not codec.available:
+        logger.warning(f"Cache codec '{wanted}' is configured but its library is not installed, using pickle")
+        codec = PICKLE
+
+    if name is None:
+        _active = codec
+    return codec
+
+
+def encode(value: Any, codec: Optional[Codec] = None):
+    """
+    Encode ``value`` as (tag, payload), using pickle for values the codec
+    can't represent
+    """
+    codec = codec or get_codec()
+    try:
+        return codec.tag, codec.dumps(value)
+    except (TypeError, ValueError, OverflowError):
+        return PICKLE.tag, PICKLE.dumps(value)
+
+
+def decode(tag: str, payload: bytes) -> Any:
+    """Decode a payload written with ``tag``; KeyError for codecs this build doesn't know"""
+    codec = CODECS.get(tag)
+    if codec is None or not codec.available:
+        raise KeyError(tag)
+    return codec.loads(payload)
+
+
+def loads_json(body) -> Any:
+    """Parse an upstream JSON body (bytes or str) with the fastest parser installed"""
+    if orjson is not None:
+        return orjson.loads(body)
+    if ujson is not None:
+        return ujson.loads(body)
+    return json.loads(body)
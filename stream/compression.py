@@ -0,0 +1,207 @@
+"""
+Compression for cached API payloads
+
+Payloads are compressed with zstd, using a dictionary trained on sampled
+cache entries when one has been activated (see the train_cache_dictionary
+management command). Cached JSON documents are small and share most of
+their keys, so a dictionary compresses them far better than compressing
+each one on its own.
+
+Dictionaries are shared through the default cache and never change once
+stored. Each compressed value is tagged ``zstd:<dictionary id>`` (0 for
+no dictionary), so entries written before a rotation still decode as
+long as their dictionary is kept.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('stream.api')
+
+
+class ZstdDictionaryCompressor:
+    """
+    zstd compressor using the active shared dictionary. Workers re-read
+    which dictionary is active every ``refresh_interval`` seconds and keep
+    every dictionary they have loaded, keyed by its ID.
+    """
+
+    NAME = 'zstd'
+    DICT_KEY = 'api_cache_zstd:dict:{}'
+    ACTIVE_KEY = 'api_cache_zstd:active'
+    IDS_KEY = 'api_cache_zstd:ids'
+
+    def __init__(self, level: int = 3, min_size: int = 256, refresh_interval: float = 60,
+                 cache_backend=None):
+        self.level = level
+        self.min_size = min_size
+        self.refresh_interval = refresh_interval
+        self.cache = cache_backend or cache
+        self._dictionaries: Dict[int, 'zstandard.ZstdCompressionDict'] = {}
+        self._active_id = 0
+        self._active_checked_at = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {
+            'compressed': 0,
+            'skipped_small': 0,
+            'bytes_in': 0,
+            'bytes_out': 0,
+        }
+
+    def _dictionary(self, dict_id: int) -> Optional['zstandard.ZstdCompressionDict']:
+        """A stored dictionary by ID (None for ID 0); KeyError if it is gone"""
+        if not dict_id:
+            return None
+        dictionary = self._dictionaries.get(dict_id)
+        if dictionary is not None:
+            return dictionary
+        data = self.cache.get(self.DICT_KEY.format(dict_id))
+        if data is None:
+            raise KeyError(f"zstd dictionary {dict_id} is not available")
+        dictionary = zstandard.ZstdCompressionDict(data)
+        dictionary.precompute_compress(level=self.level)
+        with self._lock:
+            self._dictionaries[dict_id] = dictionary
+        return dictionary
+
+    def active_id(self) -> int:
+        """ID of the dictionary new values are compressed with, 0 for none"""
+        now = time.time()
+        if now - self._active_checked_at >= self.refresh_interval:
+            self._active_checked_at = now
+            try:
+                active_id = int(self.cache.get(self.ACTIVE_KEY) or 0)
+                self._dictionary(active_id)
+                self._active_id = active_id
+            except Exception as e:
+                logger.warning(f"Could not load the active zstd dictionary: {str(e)}")
+        return self._active_id
+
+    def _compressor(self, dict_id: int) -> 'zstandard.ZstdCompressor':
+        # zstd (de)compressor objects aren't thread-safe, keep one per thread
+        compressors = self._local.__dict__.setdefault('compressors', {})
+        compressor = compressors.get(dict_id)
+        if compressor is None:
+            dictionary = self._dictionary(dict_id)
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary) \
+                if dictionary is not None else zstandard.ZstdCompressor(level=self.level)
+            compressors[dict_id] = compressor
+        return compressor
+
+    def _decompressor(self, dict_id: int) -> 'zstandard.ZstdDecompressor':
+        decompressors = self._local.__dict__.setdefault('decompressors', {})
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            dictionary = self._dictionary(dict_id)
+            decompressor = zstandard.ZstdDecompressor(dict_data=dictionary) \
+                if dictionary is not None else zstandard.ZstdDecompressor()
+            decompressors[dict_id] = decompressor
+        return decompressor
+
+    def compress(self, data: bytes, dict_id: Optional[int] = None) -> Tuple[Optional[str], bytes]:
+        """
+        Compress ``data`` with the active (or given) dictionary, returning
+        (tag, bytes). Values under ``min_size`` are returned as they are,
+        with no tag.
+        """
+        if len(data) < self.min_size:
+            self.stats['skipped_small'] += 1
+            return None, data
+        dict_id = self.active_id() if dict_id is None else dict_id
+        compressed = self._compressor(dict_id).compress(data)
+        self.stats['compressed'] += 1
+        self.stats['bytes_in'] += len(data)
+        self.stats['bytes_out'] += len(compressed)
+        return f"{self.NAME}:{dict_id}", compressed
+
+    def decompress(self, tag: str, data: bytes) -> bytes:
+        """Decompress a value tagged by compress(); KeyError if its dictionary is gone"""
+        name, _, dict_id = tag.partition(':')
+        if name != self.NAME:
+            raise KeyError(f"Unknown compression {tag}")
+        return self._decompressor(int(dict_id or 0)).decompress(data)
+
+    def train(self, samples: List[bytes], dict_size: int = 65536) -> 'zstandard.ZstdCompressionDict':
+        """Train a dictionary on sample payloads"""
+        return zstandard.train_dictionary(dict_size, samples, level=self.level)
+
+    def store(self, dictionary: 'zstandard.ZstdCompressionDict', activate: bool = True,
+              keep: int = 3) -> List[int]:
+        """
+        Store a trained dictionary, make it the active one, and drop all but
+        the ``keep`` newest dictionaries. Returns the IDs of the dropped ones.
+        Entries compressed with a dropped dictionary read as misses.
+        """
+        dict_id = dictionary.dict_id()
+        self.cache.set(self.DICT_KEY.format(dict_id), dictionary.as_bytes(), timeout=None)
+        ids = [i for i in (self.cache.get(self.IDS_KEY) or []) if i != dict_id] + [dict_id]
+        dropped, ids = ids[:-keep], ids[-keep:]
+        for old_id in dropped:
+            self.cache.delete(self.DICT_KEY.format(old_id))
+        self.cache.set(self.IDS_KEY, ids, timeout=None)
+        if activate:
+            self.cache.set(self.ACTIVE_KEY, dict_id, timeout=None)
+            self._active_id = dict_id
+            self._active_checked_at = time.time()
+        return dropped
+
+    def get_stats(self) -> Dict:
+        bytes_in = self.stats['bytes_in']
+        return {
+            **self.stats,
+            'active_dictionary': self._active_id,
+            'loaded_dictionaries': sorted(self._dictionaries),
+            'ratio': round(self.stats['bytes_out'] / bytes_in, 3) if bytes_in else None,
+        }
+
+
+_compressor = None
+_enabled = None
+
+
+def get_compressor() -> Optional[ZstdDictionaryCompressor]:
+    """The shared zstd compressor, or None when zstandard isn't installed"""
+    global _compressor
+    if _compressor is None and zstandard is not None:
+        _compressor = ZstdDictionaryCompressor(
+            level=getattr(settings, 'API_CACHE_ZSTD_LEVEL', 3),
+            min_size=getattr(settings, 'API_CACHE_COMPRESS_MIN_BYTES', 256),
+            refresh_interval=getattr(settings, 'API_CACHE_ZSTD_DICT_REFRESH', 60)
+        )
+    return _compressor
+
+
+def _compression_enabled() -> bool:
+    global _enabled
+    if _enabled is None:
+        name = getattr(settings, 'API_CACHE_COMPRESSION', 'zstd')
+        _enabled = name == ZstdDictionaryCompressor.NAME and zstandard is not None
+        if name and not _enabled:
+            logger.warning(f"Cache compression '{name}' is not available, storing payloads uncompressed")
+    return _enabled
+
+
+def compress(data: bytes) -> Tuple[Optional[str], bytes]:
+    """Compress a payload as configured by API_CACHE_COMPRESSION: (tag or None, bytes)"""
+    if not _compression_enabled():
+        return None, data
+    return get_compressor().compress(data)
+
+
+def decompress(tag: str, data: bytes) -> bytes:
+    """Decompress a payload, even with compression now disabled; KeyError if this build can't"""
+    compressor = get_compressor()
+    if compressor is None:
+        raise KeyError(tag)
+    return compressor.decompress(tag, data)
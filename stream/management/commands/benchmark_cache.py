@@ -0,0 +1,156 @@
+"""
+Management command for counting the Redis round trips an API access makes
+"""
+
+import copy
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import redis
+from django.core.management.base import BaseCommand
+from stream.api_client import api_client, APIRequest
+from stream.management.commands.benchmark_codecs import PAYLOAD_ENDPOINTS, sample_payloads
+
+
+_active_counter = contextvars.ContextVar('redis_round_trip_counter', default=None)
+
+
+class RoundTripCounter:
+    """
+    Counts Redis network round trips (commands sent on their own, plus one
+    per pipeline execution) made in the current context, including the
+    threads the API client runs work in with a copy of it. Background
+    refreshes run outside it and aren't counted.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _record():
+        counter = _active_counter.get()
+        if counter is not None:
+            with counter._lock:
+                counter.count += 1
+
+    @contextmanager
+    def patched(self):
+        execute_command = redis.Redis.execute_command
+        pipeline_execute = redis.client.Pipeline.execute
+        record = self._record
+
+        def counted_execute_command(self, *args, **kwargs):
+            record()
+            return execute_command(self, *args, **kwargs)
+
+        def counted_pipeline_execute(self, *args, **kwargs):
+            record()
+            return pipeline_execute(self, *args, **kwargs)
+
+        redis.Redis.execute_command = counted_execute_command
+        redis.client.Pipeline.execute = counted_pipeline_execute
+        token = _active_counter.set(self)
+        try:
+            yield self
+        finally:
+            _active_counter.reset(token)
+            redis.Redis.execute_command = execute_command
+            redis.client.Pipeline.execute = pipeline_execute
+
+
+class Command(BaseCommand):
+    help = 'Count Redis round trips per API access (miss, fresh hit, stale hit, batch)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoint',
+            default='api/categories/names',
+            help='Endpoint to fetch (default: api/categories/names)'
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=10,
+            help='Runs per scenario (default: 10)'
+        )
+        parser.add_argument(
+            '--batch',
+            type=int,
+            default=5,
+            help='Requests in the get_many scenario (default: 5)'
+        )
+        parser.add_argument(
+            '--sample',
+            choices=[name for name, _, _ in PAYLOAD_ENDPOINTS],
+            help='Time hits on a built-in sample payload of this endpoint, stored without calling the API'
+        )
+
+    def handle(self, *args, **options):
+        endpoint = options['endpoint']
+        runs = max(1, options['runs'])
+        sample = None
+        if options['sample']:
+            endpoint = next(path for name, path, _ in PAYLOAD_ENDPOINTS if name == options['sample'])
+            sample = sample_payloads()[options['sample']]
+        batch = [APIRequest(endpoint, {'_benchmark': i}) for i in range(max(1, options['batch']))]
+
+        def key_for(params=None):
+            return api_client.cache.get_cache_key(endpoint, params)
+
+        def forget(params=None):
+            key = key_for(params)
+            api_client.cache.delete(key)
+            api_client.negative_cache.delete(key)
+
+        def make_stale():
+            envelope = api_client.cache.get_envelope(key_for())
+            if envelope is not None:
+                envelope.fetched_at -= envelope.soft_ttl + 1
+                api_client.cache.default_cache.set(key_for(), envelope.pack(), timeout=300)
+            api_client.cache.release_refresh(key_for())
+
+        def forget_batch():
+            for item in batch:
+                forget(item.params)
+
+        def store_sample():
+            for params in [None] + [item.params for item in batch]:
+                api_client.cache.set(key_for(params), copy.deepcopy(sample), timeout=300)
+
+        scenarios = [
+            ('miss', forget, lambda: api_client.get(endpoint)),
+            ('fresh hit', None, lambda: api_client.get(endpoint)),
+            ('stale hit', make_stale, lambda: api_client.get(endpoint)),
+            (f'get_many x{len(batch)} (misses)', forget_batch, lambda: api_client.get_many(batch)),
+            (f'get_many x{len(batch)} (hits)', None, lambda: api_client.get_many(batch)),
+        ]
+        if sample is not None:
+            # Only hits: the sample is stored once and read back
+            store_sample()
+            scenarios = [scenarios[1], scenarios[4]]
+
+        self.stdout.write(f'Redis round trips per access to {endpoint} ({runs} runs each)')
+        for name, setup, access in scenarios:
+            round_trips = 0
+            elapsed = 0.0
+            for _ in range(runs):
+                if setup:
+                    setup()
+                counter = RoundTripCounter()
+                with counter.patched():
+                    start_time = time.time()
+                    access()
+                    elapsed += time.time() - start_time
+                round_trips += counter.count
+                # Let background refreshes finish outside the measured window
+                time.sleep(0.05)
+            self.stdout.write(
+                f'  {name:<22} {round_trips / runs:5.1f} round trips  '
+                f'{elapsed / runs * 1000:8.1f} ms'
+            )
+
+        for params in [None] + [item.params for item in batch]:
+            forget(params)
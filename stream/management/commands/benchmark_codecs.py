@@ -0,0 +1,170 @@
+"""
+Management command for comparing cache payload codecs and JSON parsers
+"""
+
+import json
+import time
+import zlib
+
+from django.core.management.base import BaseCommand
+from stream import codecs
+from stream.api_client import api_client
+
+# Endpoints whose payload shapes are benchmarked, with the params used by --live
+PAYLOAD_ENDPOINTS = [
+    ('home', 'api/v1/home', {'category': 'anime'}),
+    ('anime-terbaru', 'api/v1/anime-terbaru', {'category': 'anime', 'page': 1}),
+    ('episode-detail', 'api/v1/episode-detail', {'category': 'anime'}),
+]
+
+
+def _anime_item(i):
+    return {
+        'judul': f'Anime Title Number {i} Season 2',
+        'url': f'https://example.com/anime/anime-title-{i}/',
+        'anime_slug': f'anime-title-{i}',
+        'episode': f'Episode {i % 24 + 1}',
+        'uploader': 'admin',
+        'rilis': f'{i % 7 + 1} hari yang lalu',
+        'cover': f'https://cdn.example.com/covers/anime-title-{i}.jpg',
+        'skor': round(6 + (i % 40) / 10, 2),
+    }
+
+
+def _episode_item(i):
+    return {
+        'title': f'Anime Title Episode {i}',
+        'url': f'https://example.com/episode/anime-title-episode-{i}/',
+        'thumbnail_url': f'https://cdn.example.com/thumbs/anime-title-episode-{i}.jpg',
+        'release_date': f'2024-01-{i % 28 + 1:02d}',
+    }
+
+
+def sample_payloads():
+    """Synthetic payloads shaped like the upstream home, anime-terbaru and episode-detail responses"""
+    home = {
+        'confidence_score': 1.0,
+        'data': {
+            'top10': [_anime_item(i) for i in range(10)],
+            'new_eps': [_anime_item(i) for i in range(30)],
+            'movies': [_anime_item(i) for i in range(12)],
+            'jadwal_rilis': {
+                day: [_anime_item(i) for i in range(8)]
+                for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+            },
+        },
+    }
+    anime_terbaru = {
+        'confidence_score': 1.0,
+        'data': [_anime_item(i) for i in range(30)],
+    }
+    episode_detail = {
+        'confidence_score': 1.0,
+        'data': {
+            'title': 'Anime Title Episode 12',
+            'thumbnail_url': 'https://cdn.example.com/thumbs/anime-title-episode-12.jpg',
+            'streaming_servers': [
+                {'server_name': f'Server {i}', 'streaming_url': f'https://stream{i}.example.com/e/abcdef{i}'}
+                for i in range(6)
+            ],
+            'download_links': {
+                fmt: {
+                    quality: [{'host': f'Host {i}', 'url': f'https://dl{i}.example.com/{fmt}/{quality}'}
+                              for i in range(4)]
+                    for quality in ['360p', '480p', '720p', '1080p']
+                }
+                for fmt in ['MP4', 'MKV']
+            },
+            'navigation': {
+                'previous_episode_url': 'https://example.com/episode/anime-title-episode-11/',
+                'next_episode_url': 'https://example.com/episode/anime-title-episode-13/',
+                'all_episodes_url': 'https://example.com/anime/anime-title/',
+            },
+            'anime_info': {
+                'title': 'Anime Title',
+                'slug': 'anime-title',
+                'thumbnail_url': 'https://cdn.example.com/covers/anime-title.jpg',
+                'synopsis': 'A long synopsis of the show. ' * 20,
+                'genres': ['Action', 'Adventure', 'Fantasy', 'Shounen'],
+            },
+            'other_episodes': [_episode_item(i) for i in range(50)],
+        },
+    }
+    return {'home': home, 'anime-terbaru': anime_terbaru, 'episode-detail': episode_detail}
+
+
+class Command(BaseCommand):
+    help = 'Compare cache codecs and JSON parsers on the home, anime-terbaru and episode-detail payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Encode/decode iterations per codec (default: 200)'
+        )
+        parser.add_argument(
+            '--live',
+            action='store_true',
+            help='Benchmark the payloads the API returns now instead of the built-in samples'
+        )
+        parser.add_argument(
+            '--episode-url',
+            help='Episode fetched for the live episode-detail payload (sample used without it)'
+        )
+
+    def handle(self, *args, **options):
+        iterations = max(1, options['iterations'])
+        payloads = self.live_payloads(options['episode_url']) if options['live'] else sample_payloads()
+        active = codecs.get_codec()
+        self.stdout.write(f'Active cache codec: {active.tag}\n')
+
+        for name, payload in payloads.items():
+            body = json.dumps(payload).encode()
+            self.stdout.write(self.style.SUCCESS(f'{name} ({len(body) / 1024:.1f} KiB of JSON)'))
+
+            self.stdout.write(f'  {"codec":<10} {"encode ms":>10} {"decode ms":>10} {"bytes":>9} {"zlib bytes":>11}')
+            for codec in codecs.CODECS.values():
+                if not codec.available:
+                    self.stdout.write(f'  {codec.name:<10} not installed')
+                    continue
+                encoded = codec.dumps(payload)
+                encode_ms = self.time_ms(lambda: codec.dumps(payload), iterations)
+                decode_ms = self.time_ms(lambda: codec.loads(encoded), iterations)
+                self.stdout.write(
+                    f'  {codec.name:<10} {encode_ms:>10.3f} {decode_ms:>10.3f} '
+                    f'{len(encoded):>9} {len(zlib.compress(encoded)):>11}'
+                )
+
+            parsers = [('json', json.loads), (f'loads_json/{codecs.JSON_PARSER}', codecs.loads_json)]
+            if codecs.ujson is not None:
+                parsers.insert(1, ('ujson', codecs.ujson.loads))
+            timings = ', '.join(
+                f'{label} {self.time_ms(lambda: parse(body), iterations):.3f} ms'
+                for label, parse in parsers
+            )
+            self.stdout.write(f'  upstream body parse: {timings}\n')
+
+    def live_payloads(self, episode_url=None):
+        samples = sample_payloads()
+        payloads = {}
+        for name, endpoint, params in PAYLOAD_ENDPOINTS:
+            if name == 'episode-detail':
+                if not episode_url:
+                    payloads[name] = samples[name]
+                    continue
+                params = {**params, 'episode_url': episode_url}
+            response = api_client.get(endpoint, params)
+            if response.status_code == 200 and isinstance(response.data, dict):
+                payloads[name] = response.data
+            else:
+                self.stdout.write(self.style.WARNING(f'Could not fetch {endpoint}, using the sample payload'))
+                payloads[name] = samples[name]
+        return payloads
+
+    @staticmethod
+    def time_ms(fn, iterations):
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        return (time.perf_counter() - start_time) / iterations * 1000
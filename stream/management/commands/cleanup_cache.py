@@ -8,6 +8,7 @@ import logging
 from django.core.management.base import BaseCommand
 from django.core.cache import cache, caches
 from django.conf import settings
+from stream.api_client import api_client
 
 logger = logging.getLogger('stream.api')
 
@@ -41,6 +42,18 @@ class Command(BaseCommand):
             type=int,
             help='Remove entries older than X seconds'
         )
+        parser.add_argument(
+            '--invalidate-endpoint',
+            action='append',
+            default=[],
+            help='Invalidate every cached response of an API endpoint (repeatable)'
+        )
+        parser.add_argument(
+            '--invalidate-category',
+            action='append',
+            default=[],
+            help='Invalidate every cached API response for a category (repeatable)'
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -48,13 +61,17 @@ class Command(BaseCommand):
         validate = options['validate']
         clear_all = options['all']
         older_than = options['older_than']
+        invalidate_endpoints = options['invalidate_endpoint']
+        invalidate_categories = options['invalidate_category']
         
         if dry_run:
             self.stdout.write(
                 self.style.WARNING('DRY RUN MODE - No changes will be made')
             )
         
-        if clear_all:
+        if invalidate_endpoints or invalidate_categories:
+            self.invalidate_namespaces(invalidate_endpoints, invalidate_categories, dry_run)
+        elif clear_all:
             self.clear_all_cache(dry_run)
         elif validate:
             self.validate_cache_entries(dry_run, pattern)
@@ -74,7 +91,10 @@ class Command(BaseCommand):
         if not dry_run:
             # Clear default cache
             cache.clear()
-            
+
+            # Clear the API cache too; a tiered one tells every worker to drop its L1
+            api_client.cache.default_cache.clear()
+
             # Clear other caches if they exist
             try:
                 fast_cache = caches.get('fast')
@@ -89,6 +109,22 @@ class Command(BaseCommand):
         else:
             self.stdout.write('Would clear all cache entries')
 
+    def invalidate_namespaces(self, endpoints, categories, dry_run=False):
+        """Bump cache generations; old entries are never read again and expire on their own"""
+        for endpoint in endpoints:
+            if dry_run:
+                self.stdout.write(f'Would invalidate endpoint: {endpoint}')
+                continue
+            api_client.invalidate(endpoint=endpoint)
+            self.stdout.write(self.style.SUCCESS(f'Invalidated endpoint: {endpoint}'))
+        
+        for category in categories:
+            if dry_run:
+                self.stdout.write(f'Would invalidate category: {category}')
+                continue
+            api_client.invalidate(category=category)
+            self.stdout.write(self.style.SUCCESS(f'Invalidated category: {category}'))
+
     def validate_cache_entries(self, dry_run=False, pattern=None):
         """Validate cache entries and remove corrupted ones"""
         self.stdout.write('Validating cache entries...')
@@ -249,16 +285,13 @@ class Command(BaseCommand):
         
         if pattern == 'api_cache:*':
             # Generate some common API cache keys
-            import hashlib
-            common_urls = [
-                'api/v1/home?category=all',
-                'api/v1/home?category=anime',
-                'api/v1/anime-terbaru?category=all&page=1',
-                'api/categories/names'
+            common_requests = [
+                ('api/v1/home', {'category': 'all'}),
+                ('api/v1/home', {'category': 'anime'}),
+                ('api/v1/anime-terbaru', {'category': 'all', 'page': 1}),
+                ('api/categories/names', None)
             ]
-            for url in common_urls:
-                key_hash = hashlib.md5(url.encode()).hexdigest()
-                test_keys.append(f'api_cache:{key_hash}')
+            test_keys = api_client.cache.get_cache_keys(common_requests)
         
         elif pattern.startswith('home_data_'):
             test_keys = ['home_data_all', 'home_data_anime']
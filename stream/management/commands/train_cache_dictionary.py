@@ -0,0 +1,146 @@
+"""
+Management command for training and rotating the zstd dictionary used for cached API payloads
+"""
+
+import time
+import zlib
+import random
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from stream import codecs
+from stream.api_client import api_client, APIRequest
+from stream.compression import get_compressor
+from stream.utils.redis_client import get_redis_connection
+
+
+class Command(BaseCommand):
+    help = 'Train a zstd dictionary on sampled api_cache entries and make it the active one'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=2000,
+            help='Maximum number of cached payloads to sample (default: 2000)'
+        )
+        parser.add_argument(
+            '--dict-size',
+            type=int,
+            default=65536,
+            help='Dictionary size in bytes (default: 65536)'
+        )
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=3,
+            help='Dictionaries kept for decoding older entries, including the new one (default: 3)'
+        )
+        parser.add_argument(
+            '--from-api',
+            action='store_true',
+            help='Sample fresh responses from the API instead of the cache (e.g. without Redis)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Train and report the compression ratio without storing the dictionary'
+        )
+
+    def handle(self, *args, **options):
+        compressor = get_compressor()
+        if compressor is None:
+            raise CommandError('zstandard is not installed')
+
+        payloads = self.api_samples() if options['from_api'] else self.cache_samples(options['samples'])
+        samples = self.encoded_samples(payloads)
+        samples = [sample for sample in samples if len(sample) >= compressor.min_size]
+        if len(samples) < 10:
+            raise CommandError(f'Only {len(samples)} payloads to train on, need at least 10')
+
+        # Hold some samples back so the reported ratio isn't measured on the training set
+        random.shuffle(samples)
+        held_out = max(1, len(samples) // 5)
+        evaluation, training = samples[:held_out], samples[held_out:]
+        self.stdout.write(
+            f'Training on {len(training)} payloads ({sum(map(len, training)) / 1024:.0f} KiB), '
+            f'evaluating on {len(evaluation)}'
+        )
+        try:
+            dictionary = compressor.train(training, dict_size=options['dict_size'])
+        except Exception as e:
+            raise CommandError(f'Dictionary training failed: {str(e)}')
+
+        self.report(compressor, dictionary, evaluation)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - dictionary not stored'))
+            return
+        dropped = compressor.store(dictionary, keep=max(1, options['keep']))
+        self.stdout.write(self.style.SUCCESS(f'Activated dictionary {dictionary.dict_id()}'))
+        if dropped:
+            self.stdout.write(f'Dropped old dictionaries: {", ".join(map(str, dropped))}')
+
+    def cache_samples(self, limit):
+        """(endpoint, decoded payload) of up to ``limit`` api_cache entries, read from Redis"""
+        client = get_redis_connection()
+        if client is None:
+            raise CommandError('The default cache is not Redis; use --from-api to sample the API')
+
+        prefix = cache.make_key('')
+        keys = []
+        for redis_key in client.scan_iter(match=cache.make_key('api_cache:*'), count=500):
+            key = redis_key.decode()[len(prefix):]
+            if key.endswith((':negative', ':refreshing')):
+                continue
+            keys.append(key)
+            if len(keys) >= limit:
+                break
+
+        payloads = []
+        for offset in range(0, len(keys), 200):
+            envelopes = api_client.cache.get_envelopes(keys[offset:offset + 200])
+            payloads.extend(
+                (api_client.cache.key_endpoint(key), envelope.data)
+                for key, envelope in envelopes.items() if envelope.data
+            )
+        return payloads
+
+    def encoded_samples(self, payloads):
+        """What the cache compresses: each page skeleton, and each distinct listed item once"""
+        samples, items = [], {}
+        for endpoint, payload in payloads:
+            skeleton, page_items = api_client.cache.items.split(payload, endpoint)
+            samples.append(codecs.encode(skeleton)[1])
+            items.update(page_items)
+        return samples + [encoded for _, encoded in items.values()]
+
+    def api_samples(self):
+        """(endpoint, payload) of the pages warm_cache fetches"""
+        from stream.views import get_categories
+
+        batch = []
+        for category in get_categories():
+            batch.append(APIRequest('api/v1/home', {'category': category}))
+            batch.append(APIRequest('api/v1/jadwal-rilis', {'category': category}))
+            batch.extend(
+                APIRequest('api/v1/anime-terbaru', {'category': category, 'page': page})
+                for page in range(1, 6)
+            )
+        return [(request.endpoint, response.data) for request, response in zip(batch, api_client.get_many(batch))
+                if response.status_code == 200 and response.data]
+
+    def report(self, compressor, dictionary, samples):
+        """Compare zlib, plain zstd and zstd with the new dictionary on the held-out samples"""
+        import zstandard
+
+        plain = zstandard.ZstdCompressor(level=compressor.level)
+        trained = zstandard.ZstdCompressor(level=compressor.level, dict_data=dictionary)
+        raw_size = sum(map(len, samples))
+        self.stdout.write(f'  {"method":<16} {"bytes":>10} {"ratio":>7} {"compress ms":>12}')
+        for label, compress in [('zlib', zlib.compress), ('zstd', plain.compress),
+                                ('zstd+dictionary', trained.compress)]:
+            start_time = time.perf_counter()
+            size = sum(len(compress(sample)) for sample in samples)
+            elapsed = (time.perf_counter() - start_time) * 1000
+            self.stdout.write(f'  {label:<16} {size:>10} {size / raw_size:>7.3f} {elapsed:>12.2f}')
@@ -6,7 +6,7 @@ import time
 import logging
 from django.core.management.base import BaseCommand
 from django.core.cache import cache
-from stream.api_client import make_api_request
+from stream.api_client import APIRequest, make_api_requests
 from stream.views import get_categories
 
 logger = logging.getLogger('stream.api')
@@ -36,7 +36,13 @@ class Command(BaseCommand):
             '--delay',
             type=float,
             default=0.5,
-            help='Delay between requests in seconds (default: 0.5)'
+            help='Delay between request batches in seconds (default: 0.5)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='Number of requests fetched concurrently per batch (default: 8)'
         )
 
     def handle(self, *args, **options):
@@ -44,124 +50,67 @@ class Command(BaseCommand):
         pages = options['pages']
         force_refresh = options['force']
         delay = options['delay']
+        concurrency = max(1, options['concurrency'])
         
         self.stdout.write(
             self.style.SUCCESS(f'Starting cache warming for categories: {", ".join(categories)}')
         )
         
+        # (label, request) pairs, fetched concurrently in batches
+        warm_requests = []
+        for category in categories:
+            warm_requests.append((
+                f'Home page ({category})',
+                APIRequest('api/v1/home', {'category': category})
+            ))
+        for category in categories:
+            for page in range(1, pages + 1):
+                warm_requests.append((
+                    f'Latest page {page} ({category})',
+                    APIRequest('api/v1/anime-terbaru', {'category': category, 'page': page})
+                ))
+        for category in categories:
+            warm_requests.append((
+                f'Schedule ({category})',
+                APIRequest('api/v1/jadwal-rilis', {'category': category})
+            ))
+        warm_requests.append(('Categories', APIRequest('api/categories/names')))
+        
         total_requests = 0
         successful_requests = 0
         failed_requests = 0
         
-        # Warm up home pages
-        for category in categories:
-            self.stdout.write(f'Warming home page for category: {category}')
+        for offset in range(0, len(warm_requests), concurrency):
+            batch = warm_requests[offset:offset + concurrency]
+            self.stdout.write(f'Warming {", ".join(label for label, _ in batch)}')
             try:
-                response = make_api_request(
-                    'api/v1/home',
-                    params={'category': category},
+                responses = make_api_requests(
+                    [request for _, request in batch],
                     force_refresh=force_refresh
                 )
-                if response.status_code == 200:
-                    successful_requests += 1
-                    self.stdout.write(
-                        self.style.SUCCESS(f'  ✓ Home page cached (cached: {response.cached})')
-                    )
-                else:
-                    failed_requests += 1
-                    self.stdout.write(
-                        self.style.ERROR(f'  ✗ Failed to cache home page: {response.status_code}')
-                    )
-                total_requests += 1
-                time.sleep(delay)
             except Exception as e:
-                failed_requests += 1
+                responses = [e] * len(batch)
+            
+            for (label, _), response in zip(batch, responses):
                 total_requests += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  ✗ Error caching home page: {str(e)}')
-                )
-        
-        # Warm up latest content
-        for category in categories:
-            for page in range(1, pages + 1):
-                self.stdout.write(f'Warming latest page {page} for category: {category}')
-                try:
-                    response = make_api_request(
-                        'api/v1/anime-terbaru',
-                        params={'category': category, 'page': page},
-                        force_refresh=force_refresh
-                    )
-                    if response.status_code == 200:
-                        successful_requests += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(f'  ✓ Latest page {page} cached (cached: {response.cached})')
-                        )
-                    else:
-                        failed_requests += 1
-                        self.stdout.write(
-                            self.style.ERROR(f'  ✗ Failed to cache latest page {page}: {response.status_code}')
-                        )
-                    total_requests += 1
-                    time.sleep(delay)
-                except Exception as e:
+                if isinstance(response, Exception):
                     failed_requests += 1
-                    total_requests += 1
                     self.stdout.write(
-                        self.style.ERROR(f'  ✗ Error caching latest page {page}: {str(e)}')
+                        self.style.ERROR(f'  ✗ Error caching {label}: {str(response)}')
                     )
-        
-        # Warm up schedule data
-        for category in categories:
-            self.stdout.write(f'Warming schedule for category: {category}')
-            try:
-                response = make_api_request(
-                    'api/v1/jadwal-rilis',
-                    params={'category': category},
-                    force_refresh=force_refresh
-                )
-                if response.status_code == 200:
+                elif response.status_code == 200:
                     successful_requests += 1
                     self.stdout.write(
-                        self.style.SUCCESS(f'  ✓ Schedule cached (cached: {response.cached})')
+                        self.style.SUCCESS(f'  ✓ {label} cached (cached: {response.cached})')
                     )
                 else:
                     failed_requests += 1
                     self.stdout.write(
-                        self.style.ERROR(f'  ✗ Failed to cache schedule: {response.status_code}')
+                        self.style.ERROR(f'  ✗ Failed to cache {label}: {response.status_code}')
                     )
-                total_requests += 1
+            
+            if offset + concurrency < len(warm_requests):
                 time.sleep(delay)
-            except Exception as e:
-                failed_requests += 1
-                total_requests += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  ✗ Error caching schedule: {str(e)}')
-                )
-        
-        # Warm up categories
-        self.stdout.write('Warming categories list')
-        try:
-            response = make_api_request(
-                'api/categories/names',
-                force_refresh=force_refresh
-            )
-            if response.status_code == 200:
-                successful_requests += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'  ✓ Categories cached (cached: {response.cached})')
-                )
-            else:
-                failed_requests += 1
-                self.stdout.write(
-                    self.style.ERROR(f'  ✗ Failed to cache categories: {response.status_code}')
-                )
-            total_requests += 1
-        except Exception as e:
-            failed_requests += 1
-            total_requests += 1
-            self.stdout.write(
-                self.style.ERROR(f'  ✗ Error caching categories: {str(e)}')
-            )
         
         # Summary
         self.stdout.write('\n' + '='*50)
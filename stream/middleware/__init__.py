@@ -10,6 +10,7 @@ from .compression import CompressionMiddleware
 from .security import SecurityHeadersMiddleware
 from .rate_limit import RateLimitMiddleware
 from .api_health import APIHealthMiddleware
+from .deadline import RequestDeadlineMiddleware
 
 __all__ = [
     'CacheOptimizationMiddleware',
@@ -20,4 +21,5 @@ __all__ = [
     'SecurityHeadersMiddleware',
     'RateLimitMiddleware',
     'APIHealthMiddleware',
+    'RequestDeadlineMiddleware',
 ]
\ No newline at end of file
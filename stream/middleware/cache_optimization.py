@@ -14,7 +14,7 @@ class CacheOptimizationMiddleware(MiddlewareMixin):
     """
     
     def __init__(self, get_response=None):
-        self.get_response = get_response
+        super().__init__(get_response)
         
         # Compile regex patterns for matching URLs
         self.static_file_pattern = re.compile(r'\.(css|js|jpg|jpeg|png|gif|ico|svg|woff|woff2|ttf|eot)$')
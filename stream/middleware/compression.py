@@ -13,7 +13,7 @@ class CompressionMiddleware(MiddlewareMixin):
     """
     
     def __init__(self, get_response=None):
-        self.get_response = get_response
+        super().__init__(get_response)
         
     def process_response(self, request, response):
         """
@@ -0,0 +1,37 @@
+"""
+Request Deadline Middleware
+Gives every request a time budget that API calls made for it respect
+"""
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from ..utils.deadline import set_deadline, reset_deadline
+
+
+class RequestDeadlineMiddleware(MiddlewareMixin):
+    """
+    Middleware to set a per-request deadline, kept below the gunicorn worker
+    timeout so slow upstream calls fall back to stale data or an error page
+    instead of getting the worker killed
+    """
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.budget = getattr(settings, 'REQUEST_DEADLINE', 25)
+
+    def process_request(self, request):
+        """
+        Start the deadline for this request
+        """
+        request._deadline_token = set_deadline(self.budget)
+
+    def process_response(self, request, response):
+        """
+        Clear the deadline so it doesn't leak into the next request on this thread
+        """
+        token = getattr(request, '_deadline_token', None)
+        if token is not None:
+            reset_deadline(token)
+            request._deadline_token = None
+        return response
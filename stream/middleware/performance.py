@@ -17,7 +17,7 @@ class PerformanceMiddleware(MiddlewareMixin):
     """
     
     def __init__(self, get_response=None):
-        self.get_response = get_response
+        super().__init__(get_response)
         
     def process_request(self, request):
         """
@@ -15,7 +15,7 @@ class RateLimitMiddleware(MiddlewareMixin):
     """
     
     def __init__(self, get_response=None):
-        self.get_response = get_response
+        super().__init__(get_response)
         
     def process_request(self, request):
         """
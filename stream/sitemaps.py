@@ -3,9 +3,10 @@ from django.urls import reverse
 from django.utils import timezone
 from django.core.cache import cache
 from datetime import datetime, timedelta
-import requests
 import logging
 
+from .api_client import make_api_request
+
 logger = logging.getLogger(__name__)
 
 
@@ -84,12 +85,9 @@ class AnimeListSitemap(Sitemap):
         if not anime_list:
             try:
                 # Fetch from your API
-                response = requests.get(
-                    'http://apigatway.humanmade.my.id:8080/api/home',
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    data = response.json()
+                response = make_api_request('api/home', cache_timeout=60 * 60)
+                if response.status_code == 200 and response.source != 'error':
+                    data = response.data
                     anime_list = []
                     
                     # Extract anime from different sections
@@ -143,12 +141,9 @@ class EpisodeListSitemap(Sitemap):
         if not episode_list:
             try:
                 # Fetch recent episodes from your API
-                response = requests.get(
-                    'http://apigatway.humanmade.my.id:8080/api/latest',
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    data = response.json()
+                response = make_api_request('api/latest', cache_timeout=60 * 30)
+                if response.status_code == 200 and response.source != 'error':
+                    data = response.data
                     episode_list = data.get('data', [])[:self.limit]
                     
                     # Cache for 2 hours
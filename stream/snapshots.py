@@ -0,0 +1,279 @@
+"""
+Last-known-good snapshots of the hot API endpoints, kept on local disk
+
+The last successful payload of each endpoint in API_SNAPSHOT_ENDPOINTS
+(categories, home per category, the first latest pages, the schedule) is
+kept in one compact file. When the gateway and the cache are both down, the
+API client serves these instead of an error page.
+
+Layout: a header, an index of (key, offset, length, stored_at, digest)
+records and the JSON payloads one after the other. Every save rewrites the
+whole file into a temporary one and renames it over the old, so readers
+never see a partial write. Readers mmap the file and parse JSON straight out
+of the mapping; a rename is picked up on the next read.
+
+Since a save rewrites and fsyncs the whole file, the API client does it on
+its refresh executor (``save_in_background``) and at most once every
+``min_interval`` seconds per request.
+"""
+
+import os
+import json
+import time
+import fcntl
+import mmap
+import struct
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from .codecs import JSON_PARSER, loads_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger('stream.api')
+
+MAGIC = b'KSTRSNP1'
+HEADER = struct.Struct('<8sI')  # magic, record count
+RECORD = struct.Struct('<HIId16s')  # key length, offset, length, stored_at, digest; key bytes follow
+
+
+def _dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def _loads(view: memoryview) -> Any:
+    # orjson parses the mapped bytes in place; the other parsers need a copy
+    return loads_json(view if JSON_PARSER == 'orjson' else bytes(view))
+
+
+class _SnapshotFile:
+    """One version of the snapshot file, mapped read-only, with its parsed index"""
+
+    def __init__(self, identity: Tuple, mapping: mmap.mmap, index: Dict[str, Tuple[int, int, float, bytes]]):
+        self.identity = identity
+        self.mapping = mapping
+        self.index = index
+
+    @classmethod
+    def open(cls, path: str) -> Optional['_SnapshotFile']:
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size < HEADER.size:
+                return None
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC:
+            logger.warning(f"Ignoring snapshot file {path} with an unknown format")
+            return None
+        index = {}
+        position = HEADER.size
+        for _ in range(count):
+            key_length, offset, length, stored_at, digest = RECORD.unpack_from(mapping, position)
+            position += RECORD.size
+            key = mapping[position:position + key_length].decode()
+            position += key_length
+            index[key] = (offset, length, stored_at, digest)
+        return cls((st.st_ino, st.st_size, st.st_mtime_ns), mapping, index)
+
+
+class SnapshotStore:
+    """
+    Last good payload per hot request. ``endpoints`` maps an endpoint to the
+    params that must match for a request to be kept, e.g.
+    ``{'api/v1/anime-terbaru': {'page': [1, 2, 3]}}``; an empty dict keeps
+    every request to that endpoint.
+    """
+
+    def __init__(self, path: str, endpoints: Dict[str, Dict[str, Iterable]], max_entries: int = 64,
+                 min_interval: float = 60):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.endpoints = {
+            endpoint.strip('/').lower(): {
+                name.lower(): {str(value).lower() for value in values}
+                for name, values in (params or {}).items()
+            }
+            for endpoint, params in endpoints.items()
+        }
+        self.max_entries = max_entries
+        self.min_interval = min_interval
+        # Per-process time of the last save started for each key
+        self._saved_at: Dict[str, float] = {}
+        self._file: Optional[_SnapshotFile] = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.stats = {
+            'saved': 0,
+            'unchanged': 0,
+            'throttled': 0,
+            'dropped': 0,
+            'served': 0,
+            'misses': 0,
+            'errors': 0,
+        }
+
+    def key(self, endpoint: str, params: List[Tuple[str, str]]) -> Optional[str]:
+        """Snapshot key for a normalized request, or None when it isn't a hot one"""
+        required = self.endpoints.get(endpoint)
+        if required is None:
+            return None
+        values = dict(params)
+        for name, allowed in required.items():
+            if values.get(name, '').lower() not in allowed:
+                return None
+        return f"{endpoint}?{urlencode(params)}"
+
+    def _current(self) -> Optional[_SnapshotFile]:
+        """The mapped snapshot file, remapped when it has been replaced since the last read"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        snapshot = self._file
+        if snapshot is None or snapshot.identity != (st.st_ino, st.st_size, st.st_mtime_ns):
+            # The old mapping is closed once no reader holds a view of it
+            snapshot = self._file = _SnapshotFile.open(self.path)
+        return snapshot
+
+    def get(self, endpoint: str, params: List[Tuple[str, str]]) -> Optional[Tuple[Any, float]]:
+        """(payload, stored_at) of the last good response to a hot request, or None"""
+        key = self.key(endpoint, params)
+        if key is None:
+            return None
+        try:
+            snapshot = self._current()
+            entry = snapshot.index.get(key) if snapshot is not None else None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            offset, length, stored_at, _ = entry
+            with memoryview(snapshot.mapping) as mapped, mapped[offset:offset + length] as view:
+                data = _loads(view)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Could not read snapshot {key}: {str(e)}")
+            return None
+        self.stats['served'] += 1
+        return data, stored_at
+
+    def save(self, endpoint: str, params: List[Tuple[str, str]], data: Any) -> bool:
+        """Keep ``data`` as the last good payload of a hot request; True when the file was rewritten"""
+        key = self.key(endpoint, params)
+        if key is None or not self._claim(key):
+            return False
+        try:
+            payload = _dumps(data)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Could not save snapshot {key}: {str(e)}")
+            return False
+        return self._store(key, payload)
+
+    def save_in_background(self, endpoint: str, params: List[Tuple[str, str]], data: Any, executor) -> bool:
+        """
+        Like ``save``, but the file is rewritten on ``executor`` (a
+        RefreshExecutor). The payload is serialized here, so the caller may
+        go on changing ``data``. True when a save was queued.
+        """
+        key = self.key(endpoint, params)
+        if key is None or not self._claim(key):
+            return False
+        try:
+            payload = _dumps(data)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Could not save snapshot {key}: {str(e)}")
+            return False
+
+        def dropped():
+            self.stats['dropped'] += 1
+            # Let the next response try again
+            with self._lock:
+                self._saved_at.pop(key, None)
+
+        return executor.submit(f"snapshot:{key}", lambda: self._store(key, payload), on_drop=dropped)
+
+    def _claim(self, key: str) -> bool:
+        """Whether ``key`` may be saved now, at most once per ``min_interval`` seconds"""
+        now = time.time()
+        with self._lock:
+            if now - self._saved_at.get(key, 0) < self.min_interval:
+                self.stats['throttled'] += 1
+                return False
+            self._saved_at[key] = now
+        return True
+
+    def _store(self, key: str, payload: bytes) -> bool:
+        try:
+            digest = hashlib.blake2b(payload, digest_size=16).digest()
+            if self._stored_digest(key) == digest:
+                self.stats['unchanged'] += 1
+                return False
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._write_lock, open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Re-read under the lock: another worker may have rewritten the file
+                entries = self._entries(self._current())
+                entries[key] = (payload, time.time(), digest)
+                if len(entries) > self.max_entries:
+                    for old_key in sorted(entries, key=lambda k: entries[k][1])[:len(entries) - self.max_entries]:
+                        del entries[old_key]
+                self._write(entries)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Could not save snapshot {key}: {str(e)}")
+            return False
+        self.stats['saved'] += 1
+        return True
+
+    def _stored_digest(self, key: str) -> Optional[bytes]:
+        snapshot = self._current()
+        entry = snapshot.index.get(key) if snapshot is not None else None
+        return entry[3] if entry is not None else None
+
+    @staticmethod
+    def _entries(snapshot: Optional[_SnapshotFile]) -> Dict[str, Tuple[bytes, float, bytes]]:
+        if snapshot is None:
+            return {}
+        return {
+            key: (snapshot.mapping[offset:offset + length], stored_at, digest)
+            for key, (offset, length, stored_at, digest) in snapshot.index.items()
+        }
+
+    def _write(self, entries: Dict[str, Tuple[bytes, float, bytes]]):
+        keys = {key: key.encode() for key in entries}
+        offset = HEADER.size + sum(RECORD.size + len(encoded) for encoded in keys.values())
+        records = []
+        for key, (payload, stored_at, digest) in entries.items():
+            records.append(RECORD.pack(len(keys[key]), offset, len(payload), stored_at, digest) + keys[key])
+            offset += len(payload)
+
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(entries)))
+            f.writelines(records)
+            f.writelines(payload for payload, _, _ in entries.values())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def get_stats(self) -> Dict:
+        try:
+            snapshot = self._current()
+        except Exception:
+            snapshot = None
+        return {
+            **self.stats,
+            'entries': len(snapshot.index) if snapshot is not None else 0,
+            'bytes': len(snapshot.mapping) if snapshot is not None else 0,
+        }
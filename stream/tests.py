@@ -1,3 +1,1876 @@
-from django.test import TestCase
+import os
+import copy
+import json
+import math
+import time
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+from urllib.parse import urlsplit
 
-# Create your tests here.
+import redis
+import requests
+from asgiref.sync import async_to_sync
+from requests.structures import CaseInsensitiveDict
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from . import async_views, codecs, compression, views
+from .api_client import (
+    AdmissionController, AdmissionRejected, APIRequest, CacheEnvelope, CircuitBreaker,
+    CircuitBreakerOpenError, DistributedCircuitBreaker, DistributedTokenBudget, GatewayPool,
+    NegativeCache, RefreshExecutor, RobustAPIClient, SmartCache, TokenBudget,
+)
+from .async_api_client import AsyncRobustAPIClient
+from .cache_backends import failover, shared_memory, tiered, tinylfu
+from .middleware import RequestDeadlineMiddleware
+from .snapshots import SnapshotStore
+from .utils import redis_client
+from .utils import deadline
+from .views import is_circuit_breaker_open, record_api_success
+
+
+def wait_for(condition, timeout=2.0):
+    """Poll ``condition`` until it holds, for state set by background threads"""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.01)
+
+
+TIERED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-default',
+    },
+    'l2': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-l2',
+    },
+    'l1': {
+        'BACKEND': 'stream.cache_backends.TinyLFUCache',
+        'LOCATION': 'tests-l1',
+        'OPTIONS': {'MAX_BYTES': 1024 * 1024},
+    },
+    'tiered': {
+        'BACKEND': 'stream.cache_backends.TieredCache',
+        'LOCATION': 'tests-tiered',
+        'OPTIONS': {'L1': 'l1', 'L2': 'l2', 'L1_TIMEOUT': 30},
+    },
+}
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = caches['tiered']
+        # Fresh per-process state, as in a newly started worker
+        self.cache._state = tiered._states[self.cache._state_name] = tiered._TierState()
+        self.l1, self.l2 = caches['l1'], caches['l2']
+        self.l1.clear()
+        self.l2.clear()
+        self.cache._ensure_listener()
+        wait_for(lambda: self.cache._state.subscribed)
+
+    def test_read_fills_l1(self):
+        self.l2.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.l1.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get_stats()['l1_hits'], 1)
+
+    def test_write_replaces_l1_copy(self):
+        self.cache.set('key', 'old')
+        self.cache.set('key', 'new')
+        self.assertEqual(self.l1.get('key'), 'new')
+        self.assertEqual(self.l2.get('key'), 'new')
+
+    def test_invalidation_from_another_node_drops_l1_copy(self):
+        self.cache.set('key', 'old')
+        self.l2.set('key', 'new')
+        self.cache._receive(json.dumps({'node': 'other-host', 'keys': ['key'], 'version': None}))
+        self.assertIsNone(self.l1.get('key'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_invalidation_during_l2_read_prevents_fill(self):
+        self.l2.set('key', 'old')
+        read = self.l2.get_many
+
+        def racing_read(keys, version=None):
+            values = read(keys, version=version)
+            # Another node rewrites the key while this read is in flight
+            self.cache._receive(json.dumps({'node': 'other-host', 'keys': ['key'], 'version': None}))
+            return values
+
+        with mock.patch.object(self.l2, 'get_many', racing_read):
+            self.assertEqual(self.cache.get('key'), 'old')
+        self.assertIsNone(self.l1.get('key'))
+
+    def test_writes_publish_invalidations(self):
+        client = mock.Mock()
+        with mock.patch.object(tiered, 'get_redis_connection', return_value=client):
+            self.cache.set('key', 'value')
+            self.cache.delete('key')
+        messages = [json.loads(call.args[1]) for call in client.publish.call_args_list]
+        self.assertEqual([m['keys'] for m in messages], [['key'], ['key']])
+        self.assertTrue(all(m['node'] == self.cache._state.node for m in messages))
+
+    def test_l1_bypassed_while_unsubscribed(self):
+        self.cache.set('key', 'old')
+        self.l2.set('key', 'new')
+        self.cache._state.subscribed = False
+        self.assertEqual(self.cache.get('key'), 'new')
+
+
+SHARED_PATH = os.path.join(tempfile.gettempdir(), f'kortekstream-tests-{os.getpid()}.shm')
+
+SHARED_CACHES = {
+    **TIERED_CACHES,
+    'shared': {
+        'BACKEND': 'stream.cache_backends.SharedMemoryCache',
+        'LOCATION': SHARED_PATH,
+        'OPTIONS': {'SLOTS': [(2048, 64), (16384, 16)]},
+    },
+    # Two workers on one host: separate per-process state, one shared L1
+    'worker_a': {
+        'BACKEND': 'stream.cache_backends.TieredCache',
+        'LOCATION': 'tests-worker-a',
+        'OPTIONS': {'L1': 'shared', 'L2': 'l2', 'L1_TIMEOUT': 30},
+    },
+    'worker_b': {
+        'BACKEND': 'stream.cache_backends.TieredCache',
+        'LOCATION': 'tests-worker-b',
+        'OPTIONS': {'L1': 'shared', 'L2': 'l2', 'L1_TIMEOUT': 30},
+    },
+}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SharedL1Tests(SimpleTestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        segment = shared_memory._segments.pop(SHARED_PATH, None)
+        if segment is not None:
+            segment.mm.close()
+            os.close(segment.fd)
+        os.unlink(SHARED_PATH)
+
+    def setUp(self):
+        self.shared, self.l2 = caches['shared'], caches['l2']
+        self.shared.clear()
+        self.l2.clear()
+        self.workers = []
+        for alias in ('worker_a', 'worker_b'):
+            worker = caches[alias]
+            worker._state = tiered._states[worker._state_name] = tiered._TierState()
+            worker._ensure_listener()
+            self.workers.append(worker)
+        wait_for(lambda: all(worker._state.subscribed for worker in self.workers))
+
+    def test_two_writers_fill_never_overwrites_newer_value(self):
+        worker_a, worker_b = self.workers
+        self.l2.set('key', 'old')
+        read = self.l2.get_many
+
+        def racing_read(keys, version=None):
+            values = read(keys, version=version)
+            # Worker B writes after A's L2 read started; A never hears of it
+            # over the channel since both workers share one node id
+            worker_b.set('key', 'new')
+            return values
+
+        with mock.patch.object(self.l2, 'get_many', racing_read):
+            self.assertEqual(worker_a.get('key'), 'old')
+        self.assertNotEqual(self.shared.get('key'), 'old')
+        self.assertEqual(worker_a.get('key'), 'new')
+        self.assertEqual(worker_b.get('key'), 'new')
+
+    def test_delete_during_read_prevents_fill(self):
+        worker_a, worker_b = self.workers
+        self.l2.set('key', 'old')
+        read = self.l2.get_many
+
+        def racing_read(keys, version=None):
+            values = read(keys, version=version)
+            worker_b.delete('key')
+            return values
+
+        with mock.patch.object(self.l2, 'get_many', racing_read):
+            worker_a.get('key')
+        self.assertIsNone(self.shared.get('key'))
+
+    def test_write_leaves_fill_to_next_read(self):
+        worker_a, worker_b = self.workers
+        worker_a.set('key', 'value')
+        self.assertIsNone(self.shared.get('key'))
+        self.assertEqual(worker_b.get('key'), 'value')
+        self.assertEqual(self.shared.get('key'), 'value')
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class SharedMemoryCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = caches['shared']
+        self.cache.clear()
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.assertTrue(self.cache.delete('key'))
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_only_when_absent(self):
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 1)
+
+    def test_values_too_large_are_not_cached(self):
+        self.cache.set('key', 'x' * 20000)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expired_entries_are_misses(self):
+        self.cache.set('key', 1, timeout=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_conditional_fill_skips_keys_written_since(self):
+        stamps = self.cache.write_stamps(['a', 'b'])
+        self.cache.set('b', 'newer')
+        skipped = self.cache.set_many_if_unchanged({'a': 'filled', 'b': 'older'}, stamps)
+        self.assertEqual(skipped, ['b'])
+        self.assertEqual(self.cache.get('a'), 'filled')
+        self.assertEqual(self.cache.get('b'), 'newer')
+
+    def test_concurrent_writer_never_tears_reads(self):
+        # A forked writer rewrites the same slot with values of varying
+        # length while this process reads it without locking
+        pid = os.fork()
+        if pid == 0:
+            try:
+                writer = caches['shared']
+                for i in range(3000):
+                    writer.set('key', bytes([i % 256]) * (200 + i % 1500))
+            finally:
+                os._exit(0)
+        reads = 0
+        try:
+            while os.waitpid(pid, os.WNOHANG) == (0, 0):
+                value = self.cache.get('key')
+                if value is not None:
+                    reads += 1
+                    self.assertEqual(len(set(value)), 1)
+                    self.assertTrue(200 <= len(value) < 1700)
+        finally:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.assertGreater(reads, 0)
+
+
+DISK_PATH = os.path.join(tempfile.gettempdir(), f'kortekstream-tests-{os.getpid()}.sqlite3')
+
+DISK_CACHES = {
+    **TIERED_CACHES,
+    'disk': {
+        'BACKEND': 'stream.cache_backends.DiskLRUCache',
+        'LOCATION': DISK_PATH,
+        'OPTIONS': {'MAX_BYTES': 4000, 'CULL_TO': 0.75},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-redis',
+    },
+    'sessions_redis': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-sessions-redis',
+    },
+    'failover_default': {
+        'BACKEND': 'stream.cache_backends.FailoverCache',
+        'LOCATION': 'tests-default',
+        'OPTIONS': {'PRIMARY': 'redis', 'FALLBACK': 'disk', 'FAILURE_THRESHOLD': 2, 'RETRY_AFTER': 0.05},
+    },
+    'failover_sessions': {
+        'BACKEND': 'stream.cache_backends.FailoverCache',
+        'LOCATION': 'tests-sessions',
+        'OPTIONS': {'PRIMARY': 'sessions_redis', 'FALLBACK': 'disk', 'FAILURE_THRESHOLD': 2, 'RETRY_AFTER': 0.05},
+    },
+}
+
+
+class DiskCacheTestMixin:
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(DISK_PATH + suffix):
+                os.unlink(DISK_PATH + suffix)
+
+    def setUp(self):
+        self.disk = caches['disk']
+        self.disk.clear()
+
+
+class TinyLFUCacheTests(SimpleTestCase):
+    # Room for one entry in the window and about fifteen in the main area
+    options = {'MAX_BYTES': 20000, 'WINDOW_RATIO': 0.1}
+
+    def setUp(self):
+        location = f'tinylfu-{self.id()}'
+        self.cache = tinylfu.TinyLFUCache(location, {'OPTIONS': self.options})
+        self.addCleanup(tinylfu._stores.pop, location, None)
+
+    def fill(self, prefix, count):
+        for i in range(count):
+            self.cache.set(f'{prefix}-{i}', 'x' * 1000)
+
+    def present(self, prefix, count):
+        return sum(self.cache.has_key(f'{prefix}-{i}') for i in range(count))
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.assertFalse(self.cache.add('key', {'a': 2}))
+        self.assertTrue(self.cache.delete('key'))
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('count', 1)
+        self.assertEqual(self.cache.incr('count', 2), 3)
+
+    def test_expired_entries_are_misses(self):
+        self.cache.set('key', 'value', timeout=10)
+        with mock.patch('stream.cache_backends.tinylfu.time.time', return_value=time.time() + 11):
+            self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get_stats()['expirations'], 1)
+
+    def test_bounded_by_bytes(self):
+        self.fill('key', 100)
+        stats = self.cache.get_stats()
+        self.assertLessEqual(stats['bytes'], stats['max_bytes'])
+        self.assertLess(stats['entries'], 20)
+
+    def test_oversized_entries_are_rejected(self):
+        self.cache.set('huge', 'x' * 30000)
+        self.assertFalse(self.cache.has_key('huge'))
+        self.assertEqual(self.cache.get_stats()['rejections'], 1)
+
+    def test_hits_promote_entries_to_the_protected_segment(self):
+        self.fill('hot', 3)
+        self.cache.set('pusher', 'x')  # pushes hot-2 out of the window
+        self.assertEqual(self.cache.get_stats()['protected_bytes'], 0)
+        self.cache.get('hot-0')
+        self.assertGreater(self.cache.get_stats()['protected_bytes'], 0)
+
+    def test_scan_does_not_displace_hot_entries(self):
+        self.fill('hot', 10)
+        for _ in range(3):
+            for i in range(10):
+                self.assertIsNotNone(self.cache.get(f'hot-{i}'))
+        self.fill('scan', 200)
+        self.assertEqual(self.present('hot', 10), 10)
+        self.assertLess(self.present('scan', 200), 10)
+        self.assertGreater(self.cache.get_stats()['rejections'], 0)
+
+    def test_frequently_requested_keys_displace_cold_ones(self):
+        self.fill('cold', 20)
+        for _ in range(5):
+            self.assertIsNone(self.cache.get('popular'))
+        self.cache.set('popular', 'x' * 1000)
+        self.cache.set('pusher', 'x' * 1000)
+        self.assertTrue(self.cache.has_key('popular'))
+        self.assertGreater(self.cache.get_stats()['evictions'], 0)
+
+    def test_sketch_ages_counts(self):
+        sketch = tinylfu.FrequencySketch(1024)
+        for _ in range(8):
+            sketch.increment('hot')
+        self.assertEqual(sketch.frequency('hot'), 8)
+        sketch.additions = sketch.sample_size - 1
+        sketch.increment('other')
+        self.assertEqual(sketch.frequency('hot'), 4)
+
+
+@override_settings(CACHES=DISK_CACHES)
+class DiskLRUCacheTests(DiskCacheTestMixin, SimpleTestCase):
+
+    def test_add_only_when_absent_or_expired(self):
+        self.assertTrue(self.disk.add('key', 1))
+        self.assertFalse(self.disk.add('key', 2))
+        self.assertEqual(self.disk.get('key'), 1)
+        self.disk.set('expiring', 1, timeout=0.05)
+        time.sleep(0.1)
+        self.assertTrue(self.disk.add('expiring', 2))
+        self.assertEqual(self.disk.get('expiring'), 2)
+
+    def test_cull_evicts_least_recently_read_down_to_cull_to(self):
+        for i in range(12):
+            self.disk.set(f'key-{i}', 'x' * 400)
+        stats = self.disk.get_stats()
+        self.assertLessEqual(stats['bytes'], self.disk.max_bytes)
+        self.assertGreater(stats['evictions'], 0)
+        self.assertIsNone(self.disk.get('key-0'))
+        self.assertIsNotNone(self.disk.get('key-11'))
+
+    def test_cull_evicts_expired_entries_first(self):
+        self.disk.set('expiring', 'x' * 1500, timeout=0.05)
+        for i in range(5):
+            self.disk.set(f'key-{i}', 'x' * 300)
+        time.sleep(0.1)
+        # Back under CULL_TO once the expired entry is gone: nothing live is evicted
+        self.disk.set('key-5', 'x' * 1000)
+        self.assertFalse(self.disk.has_key('expiring'))
+        self.assertEqual(len(self.disk.get_many([f'key-{i}' for i in range(6)])), 6)
+
+
+@override_settings(CACHES=DISK_CACHES)
+class FailoverCacheTests(DiskCacheTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache, self.sessions = caches['failover_default'], caches['failover_sessions']
+        for cache in (self.cache, self.sessions):
+            # Fresh per-process breaker, as in a newly started worker
+            cache._breaker = failover._breakers[cache.name] = failover._Breaker(2, 0.05)
+            cache.primary.clear()
+
+    def fail_primary(self, cache):
+        return mock.patch.multiple(cache.primary, **{
+            method: mock.Mock(side_effect=ConnectionError('down'))
+            for method in ('get', 'set', 'get_many', 'delete')
+        })
+
+    def test_trips_after_threshold_and_recovers(self):
+        with self.fail_primary(self.cache):
+            self.cache.set('key', 'outage')
+            self.assertTrue(self.cache.available)
+            self.assertEqual(self.cache.get('key'), 'outage')
+            self.assertFalse(self.cache.available)
+            # Open: Redis is not called at all
+            self.cache.primary.get.reset_mock()
+            self.assertEqual(self.cache.get('key'), 'outage')
+            self.cache.primary.get.assert_not_called()
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.available)
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['opens'], stats['recoveries']), (1, 1))
+
+    def test_aliases_keep_separate_keys_in_the_shared_fallback(self):
+        with self.fail_primary(self.cache), self.fail_primary(self.sessions):
+            self.cache.set('key', 'default')
+            self.sessions.set('key', 'session')
+            self.assertEqual(self.cache.get('key'), 'default')
+            self.assertEqual(self.sessions.get('key'), 'session')
+            self.assertEqual(self.cache.get_many(['key', 'missing']), {'key': 'default'})
+
+    def test_recovery_never_clears_the_shared_fallback(self):
+        with self.fail_primary(self.cache), self.fail_primary(self.sessions):
+            for _ in range(2):
+                self.cache.set('key', 'default')
+            self.sessions.set('session', 'data')
+        self.disk.set('unrelated', 'kept')
+        time.sleep(0.1)
+        self.cache.get('key')  # probe succeeds, breaker closes
+        self.assertEqual(self.cache.get_stats()['recoveries'], 1)
+        with self.fail_primary(self.sessions):
+            self.assertEqual(self.sessions.get('session'), 'data')
+        self.assertEqual(self.disk.get('unrelated'), 'kept')
+
+    def test_later_outage_starts_from_empty_namespace(self):
+        with self.fail_primary(self.cache):
+            for _ in range(2):
+                self.cache.set('key', 'stale')
+        time.sleep(0.1)
+        self.cache.get('key')
+        self.assertIsNone(self.cache._breaker.epoch)
+        with self.fail_primary(self.cache):
+            for _ in range(2):
+                self.assertIsNone(self.cache.get('key'))
+
+
+class SnapshotStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = SnapshotStore(os.path.join(directory.name, 'snapshots.bin'),
+                                   endpoints={'api/v1/home': {}}, min_interval=60)
+        self.request = ('api/v1/home', [('category', 'anime')])
+
+    def test_saves_at_most_once_per_interval(self):
+        self.assertTrue(self.store.save(*self.request, {'v': 1}))
+        self.assertFalse(self.store.save(*self.request, {'v': 2}))
+        self.assertEqual(self.store.get(*self.request)[0], {'v': 1})
+        self.assertEqual(self.store.stats['throttled'], 1)
+
+    def test_background_save_runs_on_executor(self):
+        executor = RefreshExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        data = {'v': 1}
+        threads = []
+        with mock.patch('stream.snapshots.os.fsync', lambda fd: threads.append(threading.current_thread().name)):
+            self.assertTrue(self.store.save_in_background(*self.request, data, executor))
+            # Serialized when queued: later changes don't reach the snapshot
+            data['v'] = 2
+            wait_for(lambda: self.store.stats['saved'] == 1)
+        self.assertEqual(threads, ['api-refresh-0'])
+        self.assertEqual(self.store.get(*self.request)[0], {'v': 1})
+        self.assertFalse(self.store.save_in_background(*self.request, data, executor))
+
+
+def _anime(i):
+    return {'judul': f'Anime {i}', 'url': f'https://example.com/anime/{i}/', 'genres': [{'id': 1, 'name': 'Action'}]}
+
+
+@override_settings(CACHES=TIERED_CACHES, API_CACHE_ALIAS='default',
+                   API_CACHE_ITEM_LISTS={'api/v1/home': ['new_eps']})
+class ItemStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.cache = SmartCache()
+        self.page = {'data': {
+            'new_eps': [_anime(i) for i in range(3)],
+            'servers': [{'name': 'Mirror', 'url': 'https://mirror.example.com/'}],
+        }}
+        self.key = self.cache.get_cache_key('api/v1/home', {'category': 'anime'})
+
+    def test_only_configured_lists_are_split(self):
+        skeleton, items = self.cache.items.split(self.page, 'api/v1/home')
+        self.assertEqual(len(items), 3)
+        self.assertEqual(skeleton['data']['servers'], self.page['data']['servers'])
+        self.assertEqual(self.cache.items.split(self.page, 'api/v1/episode-detail'), (self.page, {}))
+
+    def test_hit_rebuilds_page(self):
+        self.cache.set(self.key, self.page)
+        envelope = self.cache.get_envelope(self.key)
+        self.assertEqual(envelope.data, self.page)
+        self.assertFalse(envelope.is_stale())
+
+    def test_partial_item_miss_serves_remaining_items_as_stale(self):
+        self.cache.set(self.key, self.page)
+        caches['default'].delete(caches['default'].get(self.key).items[1])
+        envelope = self.cache.get_envelope(self.key)
+        self.assertEqual(envelope.data['data']['new_eps'], [_anime(0), _anime(2)])
+        self.assertTrue(envelope.is_stale())
+
+
+def upstream_response(data=None, status_code=200, headers=None, delay=0):
+    """A gateway response as requests would return it, after ``delay`` seconds"""
+    time.sleep(delay)
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(data if data is not None else {'data': ['ok']}).encode()
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.elapsed = timedelta(seconds=delay)
+    response.url = 'http://gateway.test/'
+    response.reason = 'OK' if status_code < 400 else 'Error'
+    return response
+
+
+API_SETTINGS = dict(
+    CACHES=TIERED_CACHES,
+    API_CACHE_ALIAS='default',
+    API_CACHE_EARLY_REFRESH_BETA=0,
+    API_RETRY_BUDGET_SHARED=False,
+    API_ADMISSION_LIMITS={},
+    API_HEDGED_ENDPOINTS=[],
+    API_SNAPSHOT_ENDPOINTS={},
+    API_SNAPSHOT_PATH=os.path.join(tempfile.gettempdir(), f'kortekstream-tests-{os.getpid()}.bin'),
+)
+
+
+class APIClientTestMixin:
+    """A client in front of fake gateways; ``self.upstream`` is its session.get"""
+    gateways = 'http://gateway.test'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.api = RobustAPIClient(self.gateways)
+        self.addCleanup(self.api.refresh_executor.shutdown, 1)
+        self.upstream = mock.Mock(side_effect=lambda *args, **kwargs: upstream_response())
+        self.api.session.get = self.upstream
+
+    def store_stale(self, key, data, age=600):
+        """Cache ``data`` as fetched ``age`` seconds ago, past its soft TTL"""
+        with mock.patch('stream.api_client.time.time', return_value=time.time() - age):
+            self.api.cache.set(key, data, timeout=60)
+
+
+@override_settings(**API_SETTINGS)
+class SingleFlightTests(APIClientTestMixin, SimpleTestCase):
+
+    def get_concurrently(self, count=8):
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(self.api.get('api/v1/home')))
+                   for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_concurrent_misses_make_one_upstream_call(self):
+        self.upstream.side_effect = lambda *args, **kwargs: upstream_response({'data': ['new']}, delay=0.2)
+        responses = self.get_concurrently()
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertEqual([r.data for r in responses], [{'data': ['new']}] * 8)
+        self.assertEqual(self.api.single_flight.stats['coalesced_local'], 7)
+
+    def test_stale_copy_is_served_while_one_caller_refreshes(self):
+        key = self.api.cache.get_cache_key('api/v1/home')
+        self.store_stale(key, {'data': ['old']})
+        refreshed = threading.Event()
+
+        def slow_upstream(*args, **kwargs):
+            refreshed.wait(2)
+            return upstream_response({'data': ['new']})
+
+        self.upstream.side_effect = slow_upstream
+        responses = self.get_concurrently()
+        self.assertEqual([(r.data, r.stale) for r in responses], [({'data': ['old']}, True)] * 8)
+        refreshed.set()
+        wait_for(lambda: self.api.cache.get(key)[0] == {'data': ['new']})
+        self.assertEqual(self.upstream.call_count, 1)
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_waits_for_the_lease_holder_in_another_worker(self):
+        redis = fakeredis.FakeRedis()
+        key = self.api.cache.get_cache_key('api/v1/home')
+        redis.set(f'singleflight:{key}', 'other-worker', px=5000)
+        timer = threading.Timer(0.1, self.api.cache.set, (key, {'data': ['theirs']}))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        with mock.patch('stream.api_client.get_redis_connection', return_value=redis):
+            response = self.api.get('api/v1/home')
+            # Never releases a lease it doesn't own
+            self.api.single_flight.release_lease(key, 'mine')
+        self.assertEqual((response.data, response.source), ({'data': ['theirs']}, 'cache'))
+        self.upstream.assert_not_called()
+        self.assertEqual(redis.get(f'singleflight:{key}'), b'other-worker')
+
+
+@override_settings(**API_SETTINGS)
+class CacheEnvelopeTests(APIClientTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.key = self.api.cache.get_cache_key('api/v1/home')
+
+    def test_fresh_entry_is_served_as_is(self):
+        self.api.cache.set(self.key, {'data': ['cached']})
+        response = self.api.get('api/v1/home')
+        self.assertEqual((response.data, response.stale, response.source), ({'data': ['cached']}, False, 'cache'))
+        self.upstream.assert_not_called()
+        self.assertEqual(self.api.refresh_executor.get_stats()['submitted'], 0)
+
+    def test_stale_entry_is_served_while_refreshed(self):
+        self.store_stale(self.key, {'data': ['old']})
+        response = self.api.get('api/v1/home')
+        self.assertEqual((response.data, response.stale), ({'data': ['old']}, True))
+        wait_for(lambda: self.api.cache.get(self.key)[0] == {'data': ['ok']})
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertFalse(self.api.cache.get_envelope(self.key).is_stale())
+
+    @override_settings(API_CACHE_HARD_TTL=1, API_CACHE_TTL_JITTER=0)
+    def test_entry_is_dropped_after_hard_ttl(self):
+        cache = SmartCache()
+        cache.set(self.key, {'data': ['old']}, timeout=1)
+        self.assertIsNotNone(cache.get_envelope(self.key))
+        time.sleep(1.1)
+        self.assertIsNone(cache.get_envelope(self.key))
+
+    def test_early_refresh_gets_likelier_near_soft_ttl(self):
+        envelope = CacheEnvelope(data={}, fetched_at=0, soft_ttl=100, hard_ttl=1000, delta=1)
+        # -log(random()) == 5, so refreshes start 5 seconds before the soft TTL
+        with mock.patch('stream.api_client.random.random', return_value=math.exp(-5)):
+            self.assertFalse(envelope.should_refresh_early(beta=1, now=94))
+            self.assertTrue(envelope.should_refresh_early(beta=1, now=96))
+            self.assertTrue(envelope.should_refresh_early(beta=2, now=91))
+            self.assertFalse(envelope.should_refresh_early(beta=0, now=99))
+
+    def test_early_refresh_serves_fresh_copy_and_refreshes(self):
+        # -log(random()) == 27.6 pulls a 0.5 second fetch 13.8 seconds ahead, past the soft TTL
+        self.api.cache.set(self.key, {'data': ['cached']}, timeout=10, delta=0.5)
+        self.api.cache.early_refresh_beta = 1
+        with mock.patch('stream.api_client.random.random', return_value=1e-12):
+            response = self.api.get('api/v1/home')
+        self.assertEqual((response.data, response.stale), ({'data': ['cached']}, False))
+        wait_for(lambda: self.api.cache.get(self.key)[0] == {'data': ['ok']})
+        self.assertEqual(self.api.stats['early_refreshes'], 1)
+
+
+class RefreshExecutorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.executor = RefreshExecutor(max_workers=1, max_queue=1)
+        self.addCleanup(self.executor.shutdown, 1)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.running = threading.Event()
+
+    def block(self):
+        self.running.set()
+        self.release.wait(2)
+
+    def test_drops_refreshes_when_queue_is_full(self):
+        dropped = []
+        self.assertTrue(self.executor.submit('running', self.block))
+        self.running.wait(1)
+        self.assertTrue(self.executor.submit('queued', lambda: None))
+        self.assertFalse(self.executor.submit('overflow', lambda: None, on_drop=lambda: dropped.append(1)))
+        self.assertEqual(dropped, [1])
+        self.assertEqual(self.executor.get_stats()['dropped_full'], 1)
+
+    def test_key_is_not_queued_twice(self):
+        self.assertTrue(self.executor.submit('key', self.block))
+        self.running.wait(1)
+        self.assertFalse(self.executor.submit('key', lambda: None))
+        self.assertEqual(self.executor.get_stats()['dropped_duplicate'], 1)
+        self.release.set()
+        wait_for(lambda: self.executor.get_stats()['completed'] == 1)
+        self.assertTrue(self.executor.submit('key', lambda: None))
+
+    def test_stats_add_up_across_workers(self):
+        executor = RefreshExecutor(max_workers=4, max_queue=8)
+        self.addCleanup(executor.shutdown, 1)
+
+        def refresh(i):
+            time.sleep(0.001)
+            if i % 3 == 0:
+                raise ValueError(i)
+
+        def submit_all(offset):
+            for i in range(offset, offset + 50):
+                executor.submit(f'key-{i % 20}', lambda i=i: refresh(i))
+
+        threads = [threading.Thread(target=submit_all, args=(n * 50,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wait_for(lambda: executor.get_stats()['in_flight'] == 0)
+        stats = executor.get_stats()
+        self.assertEqual(stats['submitted'] + stats['dropped_duplicate'] + stats['dropped_full'], 200)
+        self.assertEqual(stats['completed'] + stats['failed'], stats['submitted'])
+        self.assertGreater(stats['failed'], 0)
+        self.assertLessEqual(stats['max_latency'], stats['total_latency'])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    breaker_class = CircuitBreaker
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('stream.api_client.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_breaker(self, **kwargs):
+        options = dict(failure_threshold=3, timeout=60, slow_call_duration=1, window_size=10,
+                       minimum_calls=4, half_open_max_probes=2)
+        return self.breaker_class(name='tests', **{**options, **kwargs})
+
+    def probes_in_flight(self, breaker):
+        return breaker._probes_in_flight
+
+    def fail(self, breaker):
+        def down():
+            raise requests.exceptions.ConnectionError('down')
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            breaker.call(down)
+
+    def succeed(self, breaker, duration=0):
+        def answer():
+            self.now += duration
+            return 'ok'
+        return breaker.call(answer)
+
+    def trip(self, breaker):
+        for _ in range(breaker.failure_threshold):
+            self.fail(breaker)
+        self.assertEqual(breaker.state, 'OPEN')
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = self.make_breaker()
+        self.fail(breaker)
+        self.fail(breaker)
+        self.succeed(breaker)
+        self.fail(breaker)
+        self.fail(breaker)
+        self.assertEqual(breaker.state, 'CLOSED')
+        self.fail(breaker)
+        self.assertEqual(breaker.state, 'OPEN')
+        upstream = mock.Mock()
+        with self.assertRaises(CircuitBreakerOpenError):
+            breaker.call(upstream)
+        upstream.assert_not_called()
+
+    def test_client_errors_do_not_count(self):
+        breaker = self.make_breaker()
+        error = requests.exceptions.HTTPError(response=upstream_response(status_code=404))
+        for _ in range(5):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                breaker.call(mock.Mock(side_effect=error))
+        self.assertEqual(breaker.state, 'CLOSED')
+
+    def test_slow_call_rate_opens(self):
+        breaker = self.make_breaker()
+        for _ in range(3):
+            self.succeed(breaker, duration=2)
+        self.assertEqual(breaker.state, 'CLOSED')
+        self.succeed(breaker, duration=2)
+        self.assertEqual(breaker.state, 'OPEN')
+
+    def test_half_opens_after_timeout_and_closes_after_probe_successes(self):
+        breaker = self.make_breaker()
+        self.trip(breaker)
+        self.now += 59
+        with self.assertRaises(CircuitBreakerOpenError):
+            self.succeed(breaker)
+        self.now += 1
+        self.succeed(breaker)
+        self.assertEqual(breaker.state, 'HALF_OPEN')
+        self.succeed(breaker)
+        self.assertEqual(breaker.state, 'CLOSED')
+        self.fail(breaker)
+        self.assertEqual(breaker.state, 'CLOSED')
+
+    def test_failed_probe_reopens(self):
+        breaker = self.make_breaker()
+        self.trip(breaker)
+        self.now += 60
+        self.fail(breaker)
+        self.assertEqual(breaker.state, 'OPEN')
+        with self.assertRaises(CircuitBreakerOpenError):
+            self.succeed(breaker)
+
+    def test_half_open_admits_only_probe_limit(self):
+        breaker = self.make_breaker()
+        self.trip(breaker)
+        self.now += 60
+        release = threading.Event()
+        self.addCleanup(release.set)
+        probes = [threading.Thread(target=breaker.call, args=(release.wait, 2)) for _ in range(2)]
+        for probe in probes:
+            probe.start()
+        wait_for(lambda: self.probes_in_flight(breaker) == 2)
+        with self.assertRaisesRegex(CircuitBreakerOpenError, 'HALF_OPEN'):
+            self.succeed(breaker)
+        release.set()
+        for probe in probes:
+            probe.join()
+        self.assertEqual(breaker.state, 'CLOSED')
+
+    def test_slow_start_sheds_a_shrinking_share_after_closing(self):
+        breaker = self.make_breaker(slow_start_duration=100, slow_start_min_rate=0.1)
+        self.trip(breaker)
+        self.now += 60
+        self.succeed(breaker)
+        self.succeed(breaker)
+        with mock.patch('stream.api_client.random.random', return_value=0.5):
+            # Admits 10% right after closing, 64% after 60 seconds
+            with self.assertRaises(CircuitBreakerOpenError):
+                self.succeed(breaker)
+            self.now += 60
+            self.succeed(breaker)
+        self.assertEqual(breaker.slow_start_rejections, 1)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class DistributedCircuitBreakerTests(CircuitBreakerTests):
+    """The same transitions, run by the Lua scripts against a shared Redis hash"""
+    breaker_class = DistributedCircuitBreaker
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('stream.api_client.get_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def probes_in_flight(self, breaker):
+        return breaker.get_stats()['half_open_probes']
+
+    def test_state_is_shared_between_workers(self):
+        worker, other_worker = self.make_breaker(), self.make_breaker()
+        self.trip(worker)
+        self.assertEqual(self.redis.hget('circuit_breaker:tests', 'state'), b'OPEN')
+        self.assertTrue(other_worker.is_open())
+        with self.assertRaises(CircuitBreakerOpenError):
+            self.succeed(other_worker)
+        self.now += 60
+        self.succeed(other_worker)
+        self.succeed(worker)
+        self.assertEqual(self.redis.hget('circuit_breaker:tests', 'state'), b'CLOSED')
+
+    @override_settings(**API_SETTINGS)
+    def test_api_success_resets_only_its_endpoint(self):
+        api = RobustAPIClient('http://gateway.test')
+        self.addCleanup(api.refresh_executor.shutdown, 1)
+        for endpoint in ('api/v1/home', 'api/v1/search'):
+            for _ in range(10):
+                api.get_circuit_breaker(endpoint).record_failure()
+        with mock.patch('stream.views.api_client', api):
+            record_api_success()
+            self.assertTrue(is_circuit_breaker_open('api/v1/home'))
+            record_api_success('api/v1/home')
+            self.assertFalse(is_circuit_breaker_open('api/v1/home'))
+            self.assertTrue(is_circuit_breaker_open('api/v1/search'))
+
+
+class SyncedDistributedCircuitBreakerTests(DistributedCircuitBreakerTests):
+    """The same transitions with workers trusting their last read of the shared state for a second"""
+
+    def make_breaker(self, **kwargs):
+        return super().make_breaker(**{'sync_interval': 1, **kwargs})
+
+    def test_healthy_endpoint_costs_a_few_round_trips_per_interval(self):
+        breaker = self.make_breaker()
+        with mock.patch.object(breaker, '_run', wraps=breaker._run) as run:
+            for _ in range(50):
+                self.succeed(breaker)
+            self.assertEqual([c.args[0] for c in run.call_args_list], ['before', 'success'])
+            self.now += 1
+            self.succeed(breaker)
+            self.assertEqual(run.call_count, 4)
+        self.assertEqual(run.call_args_list[-1].args[1][-1], 50)
+
+    def test_other_workers_trip_is_seen_after_the_interval(self):
+        worker, other_worker = self.make_breaker(), self.make_breaker()
+        self.succeed(worker)
+        self.trip(other_worker)
+        self.succeed(worker)
+        self.now += 1
+        with self.assertRaises(CircuitBreakerOpenError):
+            self.succeed(worker)
+
+    def test_failure_reports_batched_successes_first(self):
+        breaker = self.make_breaker()
+        self.succeed(breaker)
+        self.fail(breaker)
+        self.fail(breaker)
+        self.succeed(breaker)
+        self.fail(breaker)
+        self.assertEqual(breaker.state, 'CLOSED')
+        self.assertEqual(self.redis.hget('circuit_breaker:tests', 'failures'), b'1')
+
+
+@override_settings(**API_SETTINGS)
+class AsyncViewParityTests(APIClientTestMixin, SimpleTestCase):
+    """The async views build the same context as the sync ones from the same upstream"""
+
+    PAYLOADS = {
+        'api/categories/names': {'data': ['anime', 'donghua']},
+        'api/v1/home': {'data': {'new_eps': [_anime(1)]}, 'confidence_score': 0.9},
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.upstream.side_effect = lambda url, **kwargs: upstream_response(self.payload(url))
+        self.async_api = AsyncRobustAPIClient(self.api)
+        self.async_api._send = self.async_send
+        for target, client in (('stream.api_client.api_client', self.api),
+                               ('stream.views.api_client', self.api),
+                               ('stream.async_api_client.async_api_client', self.async_api)):
+            patcher = mock.patch(target, client)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def payload(self, url):
+        return copy.deepcopy(self.PAYLOADS[urlsplit(url).path.strip('/')])
+
+    async def async_send(self, session, url, params, headers, timeout, endpoint, tried=None):
+        return 200, self.payload(url), {}
+
+    def render_contexts(self, view_name, *args):
+        """Contexts the sync and async view render for one request, each from a cold cache"""
+        request = RequestFactory().get('/')
+        contexts = []
+
+        def render(request, template, context):
+            contexts.append(context)
+            return HttpResponse()
+
+        async def arender(request, template, context):
+            return render(request, template, context)
+
+        async def run_async_view():
+            try:
+                return await getattr(async_views, view_name)(request, *args)
+            finally:
+                await self.async_api.close()
+
+        with mock.patch('stream.views.render', render):
+            getattr(views, view_name)(request, *args)
+        caches['default'].clear()
+        with mock.patch('stream.async_views.arender', arender):
+            async_to_sync(run_async_view)()
+        return contexts
+
+    def test_root_context_matches(self):
+        sync_context, async_context = self.render_contexts('root')
+        self.assertEqual(sync_context['datas'], self.PAYLOADS['api/v1/home'])
+        self.assertEqual(sync_context, async_context)
+
+    def test_home_context_matches(self):
+        sync_context, async_context = self.render_contexts('home', 'donghua')
+        self.assertEqual(sync_context['categories'], ['anime', 'donghua'])
+        self.assertEqual(sync_context, async_context)
+
+
+@override_settings(**API_SETTINGS)
+class GetManyTests(APIClientTestMixin, SimpleTestCase):
+
+    def test_reads_cache_once_and_fetches_misses_concurrently(self):
+        self.upstream.side_effect = lambda url, params=None, **kwargs: upstream_response(
+            {'data': [url.rsplit('/', 1)[-1], params]}, delay=0.2
+        )
+        self.api.cache.set(self.api.cache.get_cache_key('api/v1/cached'), {'data': ['cached']})
+        batch = [
+            ('api/v1/home', {'category': 'anime'}),
+            APIRequest('api/v1/cached'),
+            ('api/v1/search', {'q': 'x'}, 60),
+            ('api/v1/home', {'category': 'anime'}),
+        ]
+        start = time.time()
+        with mock.patch.object(self.api.cache, 'read', wraps=self.api.cache.read) as read:
+            responses = self.api.get_many(batch)
+        self.assertLess(time.time() - start, 0.35)
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual([r.data for r in responses], [
+            {'data': ['home', {'category': 'anime'}]},
+            {'data': ['cached']},
+            {'data': ['search', {'q': 'x'}]},
+            {'data': ['home', {'category': 'anime'}]},
+        ])
+        self.assertEqual([r.source for r in responses], ['api', 'cache', 'api', 'api'])
+        # The repeated request shares the first one's fetch
+        self.assertEqual(self.upstream.call_count, 2)
+
+    def test_failed_miss_does_not_fail_the_batch(self):
+        def upstream(url, **kwargs):
+            if url.endswith('search'):
+                raise requests.exceptions.ConnectionError('down')
+            return upstream_response()
+
+        self.upstream.side_effect = upstream
+        with override_settings(API_MAX_RETRIES=0):
+            home, search = self.api.get_many([('api/v1/home', None), ('api/v1/search', None)])
+        self.assertEqual((home.status_code, home.source), (200, 'api'))
+        self.assertEqual((search.status_code, search.source), (503, 'error'))
+
+
+@override_settings(**API_SETTINGS)
+class RevalidationTests(APIClientTestMixin, SimpleTestCase):
+    VALIDATORS = {'ETag': '"v1"', 'Last-Modified': 'Fri, 16 Oct 2026 08:00:00 GMT'}
+
+    def setUp(self):
+        super().setUp()
+        self.key = self.api.cache.get_cache_key('api/v1/home')
+        self.upstream.side_effect = lambda *args, **kwargs: upstream_response(headers=self.VALIDATORS)
+
+    def not_modified(self, *args, **kwargs):
+        response = upstream_response(status_code=304)
+        response._content = b''
+        return response
+
+    def test_stores_upstream_validators(self):
+        self.api.get('api/v1/home')
+        envelope = self.api.cache.get_envelope(self.key)
+        self.assertEqual((envelope.etag, envelope.last_modified), tuple(self.VALIDATORS.values()))
+
+    def test_not_modified_restarts_ttl_without_decoding(self):
+        with mock.patch('stream.api_client.time.time', return_value=time.time() - 600):
+            self.api.cache.set(self.key, {'data': ['cached']}, timeout=60, etag='"v1"',
+                               last_modified=self.VALIDATORS['Last-Modified'])
+        self.upstream.side_effect = self.not_modified
+        with mock.patch('stream.api_client.loads_json') as loads_json:
+            response = self.api.get('api/v1/home')
+            self.assertTrue(response.stale)
+            wait_for(lambda: not self.api.cache.get_envelope(self.key).is_stale())
+        loads_json.assert_not_called()
+        self.assertEqual(self.upstream.call_args.kwargs['headers'], {
+            'If-None-Match': '"v1"', 'If-Modified-Since': self.VALIDATORS['Last-Modified'],
+        })
+        envelope = self.api.cache.get_envelope(self.key)
+        self.assertEqual((envelope.data, envelope.etag), ({'data': ['cached']}, '"v1"'))
+        self.assertEqual(self.api.stats['not_modified'], 1)
+
+    def test_forced_refresh_revalidates_cached_copy(self):
+        self.api.get('api/v1/home')
+        self.upstream.side_effect = self.not_modified
+        response = self.api.get('api/v1/home', force_refresh=True)
+        self.assertEqual((response.data, response.status_code, response.source),
+                         ({'data': ['ok']}, 200, 'revalidated'))
+        self.assertEqual(self.upstream.call_args.kwargs['headers']['If-None-Match'], '"v1"')
+
+    def test_advertises_compressed_transfer(self):
+        encodings = [e.strip() for e in self.api.session.headers['Accept-Encoding'].split(',')]
+        self.assertIn('gzip', encodings)
+        for encoding, module in (('br', 'brotli'), ('zstd', 'zstandard')):
+            try:
+                __import__(module)
+            except ImportError:
+                continue
+            self.assertIn(encoding, encodings)
+
+
+@override_settings(**API_SETTINGS, API_LATENCY_MIN_SAMPLES=20, API_TIMEOUT_PERCENTILE=99,
+                   API_TIMEOUT_MULTIPLIER=2.0, API_READ_TIMEOUT_MIN=2, API_READ_TIMEOUT_MAX=15,
+                   API_CONNECT_TIMEOUT_MIN=1, API_CONNECT_TIMEOUT_MAX=5)
+class AdaptiveTimeoutTests(APIClientTestMixin, SimpleTestCase):
+
+    def record(self, seconds, count=20, endpoint='api/v1/search'):
+        for _ in range(count):
+            self.api.record_latency(endpoint, seconds)
+
+    def test_ceilings_until_enough_samples(self):
+        self.record(0.5, count=19)
+        self.assertEqual(self.api.get_timeouts('api/v1/search'), (5, 15))
+
+    def test_read_timeout_follows_p99(self):
+        self.record(2, count=99)
+        self.record(7, count=1)
+        histogram = self.api.get_latency_histogram('api/v1/search')
+        # Percentiles are bucket bounds, at most 25% above the samples
+        self.assertTrue(2 <= histogram.percentile(99) < 2.5)
+        self.assertEqual(self.api.get_timeouts('api/v1/search')[1], round(histogram.percentile(99) * 2, 3))
+        self.record(7, count=10)
+        self.assertEqual(self.api.get_timeouts('api/v1/search')[1], 15)
+
+    def test_timeouts_stay_within_floor_and_ceiling(self):
+        self.record(0.01, endpoint='api/v1/home')
+        self.record(30, endpoint='api/v1/search')
+        self.assertEqual(self.api.get_timeouts('api/v1/home')[1], 2)
+        self.assertEqual(self.api.get_timeouts('api/v1/search')[1], 15)
+        gateway = self.api.gateways.choose()
+        for seconds, expected in ((0.05, 1), (10, 5)):
+            for _ in range(20):
+                gateway.connect_latency.record(seconds)
+            self.assertEqual(self.api.get_connect_timeout(gateway), expected)
+
+    def test_stats_report_both_timeouts(self):
+        self.record(0.01)
+        stats = self.api.get_stats()['timeouts']['api/v1/search']
+        self.assertEqual((stats['connect_timeout'], stats['read_timeout'], stats['samples']), (5, 2, 20))
+
+
+@override_settings(**API_SETTINGS, API_MIN_ATTEMPT_TIME=0.5, API_MAX_RETRIES=5)
+class DeadlineTests(APIClientTestMixin, SimpleTestCase):
+
+    def attempt_timeouts(self):
+        return [call.kwargs['timeout'] for call in self.upstream.call_args_list]
+
+    def test_middleware_scopes_deadline_to_the_request(self):
+        seen = []
+        with override_settings(REQUEST_DEADLINE=10):
+            middleware = RequestDeadlineMiddleware(
+                lambda request: seen.append(deadline.remaining()) or HttpResponse()
+            )
+        middleware(RequestFactory().get('/'))
+        self.assertTrue(9 < seen[0] <= 10)
+        self.assertIsNone(deadline.remaining())
+
+    def test_upstream_timeouts_fit_in_the_time_left(self):
+        with deadline.deadline_scope(3):
+            self.api.get('api/v1/home')
+            self.api.get_many([('api/v1/search', None), ('api/v1/latest', None)])
+        self.assertEqual(len(self.attempt_timeouts()), 3)
+        for connect_timeout, read_timeout in self.attempt_timeouts():
+            self.assertLessEqual(max(connect_timeout, read_timeout), 3)
+
+    def test_no_time_left_falls_back_without_calling_upstream(self):
+        key = self.api.cache.get_cache_key('api/v1/home')
+        self.api.cache.set(key, {'data': ['cached']})
+        with deadline.deadline_scope(0.2):
+            stale = self.api.get('api/v1/home', force_refresh=True)
+            missing = self.api.get('api/v1/search')
+        self.upstream.assert_not_called()
+        self.assertEqual((stale.data, stale.source), ({'data': ['cached']}, 'stale_cache'))
+        self.assertEqual((missing.status_code, missing.source), (503, 'error'))
+        self.assertEqual(self.api.stats['deadline_exceeded'], 2)
+
+    def test_retries_stop_at_the_deadline(self):
+        self.upstream.side_effect = requests.exceptions.ConnectionError('down')
+        start = time.time()
+        with mock.patch.object(RobustAPIClient, '_retry_delay', return_value=0.3), deadline.deadline_scope(1):
+            response = self.api.get('api/v1/home')
+        # Attempts at 0 and 0.3s; after another 0.3s wait less than API_MIN_ATTEMPT_TIME would be left
+        self.assertEqual(self.upstream.call_count, 2)
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(**{**API_SETTINGS, 'API_HEDGED_ENDPOINTS': ['api/v1/episode-detail']},
+                   API_LATENCY_MIN_SAMPLES=20, API_HEDGE_PERCENTILE=95)
+class HedgingTests(APIClientTestMixin, SimpleTestCase):
+    gateways = ['http://gw-a.test', 'http://gw-b.test']
+
+    def setUp(self):
+        super().setUp()
+        self.hosts = []
+        lock = threading.Lock()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+        def upstream(url, **kwargs):
+            # The first request stalls, any later one answers at once
+            with lock:
+                self.hosts.append(urlsplit(url).netloc)
+                first = len(self.hosts) == 1
+            if first:
+                self.release.wait(2)
+            return upstream_response({'data': [len(self.hosts)]})
+
+        self.upstream.side_effect = upstream
+        for endpoint in ('api/v1/episode-detail', 'api/v1/anime-detail'):
+            for _ in range(20):
+                self.api.record_latency(endpoint, 0.05)
+
+    def test_slow_request_is_hedged_to_another_gateway(self):
+        start = time.time()
+        response = self.api.get('api/v1/episode-detail')
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(response.data, {'data': [2]})
+        self.assertEqual(len(set(self.hosts)), 2)
+        self.assertEqual(self.api.get_hedge_stats()['hedged'], 1)
+        self.assertEqual(self.api.get_hedge_stats()['wins'], 1)
+        self.assertTrue(0.05 <= self.api.get_hedge_stats()['delays']['api/v1/episode-detail'] < 0.1)
+
+    def test_no_hedge_over_budget(self):
+        self.api.hedge_budget.tokens = 0
+        threading.Timer(0.3, self.release.set).start()
+        self.api.get('api/v1/episode-detail')
+        self.assertEqual(len(self.hosts), 1)
+        self.assertEqual(self.api.get_hedge_stats()['skipped_budget'], 1)
+
+    def test_only_listed_endpoints_are_hedged(self):
+        threading.Timer(0.3, self.release.set).start()
+        self.api.get('api/v1/anime-detail')
+        self.assertEqual(len(self.hosts), 1)
+        self.assertEqual(self.api.get_hedge_stats()['hedged'], 0)
+
+    def test_budget_caps_hedges_at_a_share_of_requests(self):
+        budget = TokenBudget(ratio=0.05, burst=1)
+        budget.tokens = 0
+        spent = 0
+        for _ in range(100):
+            budget.earn()
+            spent += budget.spend()
+        self.assertEqual(spent, 5)
+
+
+@override_settings(**API_SETTINGS, API_RETRY_BUDGET=0.1, API_RETRY_BUDGET_BURST=2, API_MAX_RETRIES=5)
+class RetryBudgetTests(APIClientTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(self.api, '_retry_delay', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_failing(self, endpoint):
+        upstream, self.upstream.side_effect = self.upstream.side_effect, requests.exceptions.ConnectionError('down')
+        calls = self.upstream.call_count
+        try:
+            self.assertEqual(self.api.get(endpoint).status_code, 503)
+        finally:
+            self.upstream.side_effect = upstream
+        return self.upstream.call_count - calls
+
+    def test_retries_stop_when_budget_is_spent(self):
+        self.assertEqual(self.get_failing('api/v1/home'), 3)
+        self.assertEqual(self.get_failing('api/v1/search'), 1)
+        stats = self.api.get_stats()
+        self.assertEqual((stats['retries'], stats['retries_skipped_budget']), (2, 2))
+        self.assertEqual(stats['retry_budget_tokens'], 0)
+
+    def test_successful_requests_earn_retries(self):
+        self.get_failing('api/v1/home')
+        for page in range(10):
+            self.api.get('api/v1/latest', {'page': page})
+        self.assertAlmostEqual(self.api.retry_budget.get_tokens(), 1)
+        self.assertEqual(self.get_failing('api/v1/search'), 2)
+
+    def test_session_does_not_retry_on_its_own(self):
+        self.assertEqual(self.api.session.get_adapter('http://gateway.test').max_retries.total, 0)
+
+    def test_backoff_is_jittered_within_the_exponential_cap(self):
+        with override_settings(API_BACKOFF_FACTOR=1.5):
+            delays = [RobustAPIClient._retry_delay(3) for _ in range(200)]
+        self.assertTrue(all(0 <= delay <= 6 for delay in delays))
+        self.assertGreater(len(set(delays)), 100)
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_budget_is_shared_by_workers(self):
+        with mock.patch('stream.api_client.get_redis_connection', return_value=fakeredis.FakeRedis()):
+            worker, other_worker = (DistributedTokenBudget('retries', ratio=0.5, burst=2) for _ in range(2))
+            self.assertTrue(worker.spend())
+            self.assertTrue(worker.spend())
+            self.assertFalse(other_worker.spend())
+            other_worker.earn()
+            other_worker.earn()
+            self.assertEqual(worker.get_tokens(), 1)
+            self.assertTrue(worker.spend())
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_shared_budget_batches_earnings(self):
+        now = [1000.0]
+        with mock.patch('stream.api_client.get_redis_connection', return_value=fakeredis.FakeRedis()), \
+                mock.patch('stream.api_client.time.time', lambda: now[0]):
+            worker, other_worker = (DistributedTokenBudget('retries', ratio=0.5, burst=2, sync_interval=1)
+                                    for _ in range(2))
+            self.assertTrue(worker.spend())
+            self.assertTrue(worker.spend())
+            with mock.patch.object(worker, '_run', wraps=worker._run) as run:
+                for _ in range(4):
+                    worker.earn()
+                run.assert_not_called()
+                self.assertFalse(other_worker.spend())
+                # Written along with the spend
+                self.assertTrue(worker.spend())
+                self.assertTrue(other_worker.spend())
+                now[0] += 1
+                worker.earn()
+                self.assertEqual(run.call_count, 2)
+            self.assertEqual(other_worker.get_tokens(), 0.5)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+
+    def make_controller(self, **kwargs):
+        options = dict(max_concurrency=1, queue_timeout=0.05, poll_interval=0.01,
+                       classes={'search': ['api/v1/search']})
+        return AdmissionController(**{**options, **kwargs})
+
+    def test_rejects_over_process_limit_after_queue_timeout(self):
+        controller = self.make_controller()
+        with controller.admit('api/v1/home'):
+            start = time.time()
+            with self.assertRaises(AdmissionRejected):
+                controller.acquire('api/v1/home')
+            self.assertLess(time.time() - start, 0.2)
+        with controller.admit('api/v1/home'):
+            pass
+        self.assertEqual(controller.get_stats()['rejected_process'], 1)
+        self.assertEqual(controller.get_stats()['in_flight'], 0)
+
+    def test_queued_call_is_admitted_when_a_slot_frees(self):
+        controller = self.make_controller(queue_timeout=1)
+        admission = controller.acquire('api/v1/home')
+        threading.Timer(0.05, controller.release, (admission,)).start()
+        controller.release(controller.acquire('api/v1/home'))
+        self.assertEqual(controller.get_stats()['admitted'], 2)
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_fleet_limits_per_endpoint_class(self):
+        limits = {'search': {'concurrency': 1, 'rate': 0}, 'default': {'concurrency': 0, 'rate': 2}}
+        workers = [self.make_controller(max_concurrency=10, limits=limits) for _ in range(2)]
+        with mock.patch('stream.api_client.get_redis_connection', return_value=fakeredis.FakeRedis()), \
+                mock.patch('stream.api_client.time.time', return_value=1000.5):
+            search = workers[0].acquire('api/v1/search')
+            with self.assertRaisesRegex(AdmissionRejected, 'concurrency'):
+                workers[1].acquire('api/v1/search', timeout=0)
+            workers[0].release(search)
+            workers[1].release(workers[1].acquire('api/v1/search', timeout=0))
+            workers[0].release(workers[0].acquire('api/v1/home'))
+            workers[1].release(workers[1].acquire('api/v1/latest'))
+            with self.assertRaisesRegex(AdmissionRejected, 'rate'):
+                workers[0].acquire('api/v1/home', timeout=0)
+        self.assertEqual(workers[1].get_stats()['rejected_concurrency'], 1)
+        self.assertEqual(workers[0].get_stats()['rejected_rate'], 1)
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_releases_are_sent_with_the_next_acquire(self):
+        now = [1000.0]
+        client = fakeredis.FakeRedis()
+        controller = self.make_controller(max_concurrency=10, limits={'default': {'concurrency': 1}},
+                                          sync_interval=1)
+        with mock.patch('stream.api_client.get_redis_connection', return_value=client), \
+                mock.patch('stream.api_client.time.time', lambda: now[0]), \
+                mock.patch.object(client, 'pipeline', wraps=client.pipeline) as pipeline:
+            controller.release(controller.acquire('api/v1/home', timeout=0))
+            self.assertEqual(client.zcard('admission:default:leases'), 1)
+            # The released lease frees its slot in the same script call
+            admission = controller.acquire('api/v1/home', timeout=0)
+            self.assertEqual(client.zcard('admission:default:leases'), 1)
+            pipeline.assert_not_called()
+            # Released on its own after a call longer than the interval
+            now[0] += 1
+            controller.release(admission)
+            self.assertEqual(client.zcard('admission:default:leases'), 0)
+            pipeline.assert_called_once()
+
+
+@override_settings(**API_SETTINGS, API_MAX_CONCURRENCY_PER_PROCESS=0, API_ADMISSION_QUEUE_TIMEOUT=0.05)
+class AdmissionRejectionTests(APIClientTestMixin, SimpleTestCase):
+
+    def test_rejected_call_serves_stale_copy_or_fast_error(self):
+        self.api.cache.set(self.api.cache.get_cache_key('api/v1/home'), {'data': ['cached']})
+        start = time.time()
+        stale = self.api.get('api/v1/home', force_refresh=True)
+        missing = self.api.get('api/v1/search')
+        self.assertLess(time.time() - start, 0.5)
+        self.upstream.assert_not_called()
+        self.assertEqual((stale.data, stale.source), ({'data': ['cached']}, 'stale_cache'))
+        self.assertEqual((missing.status_code, missing.source), (503, 'error'))
+        self.assertEqual(self.api.admission.get_stats()['rejected_process'], 2)
+
+
+@override_settings(**API_SETTINGS, API_NEGATIVE_CACHE_TTL=1, API_MAX_RETRIES=0,
+                   API_NEGATIVE_CACHE_EMPTY_ENDPOINTS=['api/v1/search'])
+class NegativeCacheTests(APIClientTestMixin, SimpleTestCase):
+
+    def answer(self, status_code, data=None):
+        self.upstream.side_effect = lambda *args, **kwargs: upstream_response(data or {'error': 'x'}, status_code)
+
+    def test_client_errors_are_answered_from_cache_until_ttl(self):
+        self.answer(404)
+        self.assertEqual(self.api.get('api/v1/anime-detail', {'slug': 'nope'}).status_code, 404)
+        response = self.api.get('api/v1/anime-detail', {'slug': 'nope'})
+        self.assertEqual((response.status_code, response.cached), (404, True))
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertEqual(self.api.negative_cache.get_stats()['hits'], 1)
+        time.sleep(1.1)
+        self.api.get('api/v1/anime-detail', {'slug': 'nope'})
+        self.assertEqual(self.upstream.call_count, 2)
+
+    def test_server_errors_and_rate_limits_are_not_cached(self):
+        for status_code in (429, 500):
+            self.answer(status_code)
+            self.api.get('api/v1/anime-detail', {'slug': status_code})
+            self.api.get('api/v1/anime-detail', {'slug': status_code})
+        self.assertEqual(self.upstream.call_count, 4)
+        self.assertEqual(self.api.negative_cache.get_stats()['stored'], 0)
+
+    def test_empty_results_of_listed_endpoints_are_cached_briefly(self):
+        self.answer(200, {'data': []})
+        self.api.get('api/v1/search', {'q': 'zzz'})
+        response = self.api.get('api/v1/search', {'q': 'zzz'})
+        self.assertEqual((response.data, response.source), ({'data': []}, 'negative_cache'))
+        key = self.api.cache.get_cache_key('api/v1/search', {'q': 'zzz'})
+        self.assertIsNone(self.api.cache.get_envelope(key))
+        # Other endpoints cache empty results like any other
+        self.api.get('api/v1/latest')
+        self.assertIsNotNone(self.api.cache.get_envelope(self.api.cache.get_cache_key('api/v1/latest')))
+        self.assertEqual(self.api.negative_cache.get_stats()['stored'], 1)
+
+    def test_forced_refresh_skips_the_negative_entry(self):
+        self.answer(404)
+        self.api.get('api/v1/anime-detail', {'slug': 'new'})
+        self.answer(200, {'data': ['found']})
+        self.assertEqual(self.api.get('api/v1/anime-detail', {'slug': 'new'}, force_refresh=True).data,
+                         {'data': ['found']})
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_entries_are_capped_closest_to_expiry_first(self):
+        negative_cache = NegativeCache(ttl=60, max_entries=2, cache_backend=caches['default'])
+        with mock.patch('stream.api_client.get_redis_connection', return_value=fakeredis.FakeRedis()):
+            for i, ttl in enumerate((30, 10, 60)):
+                negative_cache.set(f'key-{i}', 404, {}, ttl=ttl)
+            self.assertEqual(negative_cache.get_stats()['entries'], 2)
+        self.assertIsNone(negative_cache.get('key-1'))
+        self.assertIsNotNone(negative_cache.get('key-0'))
+        self.assertEqual(negative_cache.stats['evicted'], 1)
+
+
+class GatewayPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('stream.api_client.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = GatewayPool(['http://gw-a.test', 'http://gw-b.test', 'http://gw-c.test'],
+                                failure_threshold=3, eject_time=30)
+        self.a, self.b, self.c = self.pool.gateways
+
+    def measure(self, gateway, latency, count=1):
+        for _ in range(count):
+            gateway.begin()
+            gateway.end(latency)
+
+    def picks(self, count=300, **kwargs):
+        picked = [self.pool.choose(**kwargs) for _ in range(count)]
+        return {gateway: picked.count(gateway) for gateway in self.pool.gateways}
+
+    def test_power_of_two_choices_prefers_the_lower_score(self):
+        self.measure(self.a, 0.1)
+        self.measure(self.b, 0.5)
+        self.measure(self.c, 1.0)
+        picks = self.picks()
+        # The best of two random gateways: A whenever drawn, C never
+        self.assertEqual(picks[self.c], 0)
+        self.assertTrue(150 < picks[self.a] < 250)
+
+    def test_requests_in_flight_count_against_a_gateway(self):
+        self.measure(self.a, 0.1)
+        self.measure(self.b, 0.5)
+        for _ in range(10):
+            self.a.begin()
+        self.assertGreater(self.a.score(), self.b.score())
+        self.assertEqual(self.pool.choose(exclude={self.c}), self.b)
+
+    def test_unmeasured_gateway_gets_tried(self):
+        self.measure(self.a, 0.1)
+        self.measure(self.b, 0.1)
+        self.assertGreater(self.picks()[self.c], 150)
+
+    def test_excluded_gateways_are_avoided_while_there_are_others(self):
+        self.assertEqual(self.picks(exclude={self.a, self.b}), {self.a: 0, self.b: 0, self.c: 300})
+        self.assertEqual(sum(self.picks(exclude=set(self.pool.gateways)).values()), 300)
+
+    def test_failing_gateway_is_ejected_then_on_probation(self):
+        for _ in range(3):
+            self.a.begin()
+            self.a.end(None, failed=True)
+        self.assertEqual(self.picks()[self.a], 0)
+        self.now += 30
+        self.assertTrue(self.a.is_available())
+        # Back in rotation, where one more failure ejects it again
+        self.a.begin()
+        self.a.end(None, failed=True)
+        self.assertFalse(self.a.is_available())
+
+    def test_all_ejected_picks_the_one_ejected_longest_ago(self):
+        for gateway in (self.b, self.a, self.c):
+            for _ in range(3):
+                gateway.begin()
+                gateway.end(None, failed=True)
+            self.now += 1
+        self.assertEqual(self.pool.choose(), self.b)
+
+    def test_urls_are_rebased_from_the_canonical_gateway(self):
+        self.assertEqual(self.pool.canonical, 'http://gw-a.test')
+        self.assertEqual(self.pool.rebase('http://gw-a.test/api/v1/home?x=1', self.c),
+                         'http://gw-c.test/api/v1/home?x=1')
+
+
+@override_settings(**API_SETTINGS, API_MAX_RETRIES=1)
+class GatewayFailoverTests(APIClientTestMixin, SimpleTestCase):
+    gateways = ['http://gw-a.test', 'http://gw-b.test']
+
+    def test_retry_goes_to_the_other_gateway(self):
+        def upstream(url, **kwargs):
+            if urlsplit(url).netloc == 'gw-a.test':
+                raise requests.exceptions.ConnectionError('down')
+            return upstream_response()
+
+        self.upstream.side_effect = upstream
+        with mock.patch.object(self.api, '_retry_delay', return_value=0), \
+                mock.patch('stream.api_client.random.sample', lambda gateways, k: list(gateways)):
+            response = self.api.get('api/v1/home')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([urlsplit(call.args[0]).netloc for call in self.upstream.call_args_list],
+                         ['gw-a.test', 'gw-b.test'])
+        self.assertEqual(self.api.gateways.get_stats()['http://gw-a.test']['failures'], 1)
+
+
+@override_settings(**API_SETTINGS)
+class CacheRoundTripTests(APIClientTestMixin, SimpleTestCase):
+
+    def count_calls(self, *args, **kwargs):
+        """
+        Cache operations one api.get makes once key generations are known,
+        leaving out those a backend method makes internally (LocMem's get_many calls get)
+        """
+        self.api.cache.get_cache_key(*args)
+        backend = self.api.cache.default_cache
+        calls = []
+        depth = [0]
+
+        def counted(name, method):
+            def call(*call_args, **call_kwargs):
+                if not depth[0]:
+                    calls.append(name)
+                depth[0] += 1
+                try:
+                    return method(*call_args, **call_kwargs)
+                finally:
+                    depth[0] -= 1
+            return call
+
+        names = ('get', 'get_many', 'set', 'set_many', 'add', 'delete')
+        with mock.patch.multiple(backend, **{name: counted(name, getattr(backend, name)) for name in names}):
+            self.api.get(*args, **kwargs)
+        return {name: calls.count(name) for name in names if name in calls}
+
+    def test_hit_reads_envelope_and_negative_entry_in_one_round_trip(self):
+        self.api.cache.set(self.api.cache.get_cache_key('api/v1/home'), {'data': ['cached']})
+        self.assertEqual(self.count_calls('api/v1/home'), {'get_many': 1})
+
+    def test_miss_reads_once_and_writes_once(self):
+        self.assertEqual(self.count_calls('api/v1/home'), {'get_many': 1, 'set': 1})
+
+
+@override_settings(**API_SETTINGS)
+class CacheKeyTests(APIClientTestMixin, SimpleTestCase):
+
+    def key(self, endpoint, params=None):
+        return self.api.cache.get_cache_key(endpoint, params)
+
+    def test_equivalent_requests_share_a_key(self):
+        key = self.key('api/v1/home', {'category': 'anime', 'page': 1, 'all': True})
+        for endpoint, params in (
+            ('/api/v1/home/', {'page': '1', 'category': 'anime', 'all': 'true'}),
+            ('http://other-gateway:8080/API/v1/home', {'Page': 1.0, 'category': ' Anime ', 'all': True}),
+            ('api/v1/home', {'category': 'ANIME', 'page': 1, 'all': True, 'q': None}),
+        ):
+            self.assertEqual(self.key(endpoint, params), key)
+
+    def test_different_requests_get_different_keys(self):
+        self.assertNotEqual(self.key('api/v1/home', {'page': 1}), self.key('api/v1/home', {'page': 2}))
+        # Only API_CACHE_CASEFOLD_PARAMS values are case-insensitive
+        self.assertNotEqual(self.key('api/v1/search', {'q': 'Naruto'}), self.key('api/v1/search', {'q': 'naruto'}))
+
+    def test_keys_are_readable_by_prefix(self):
+        key = self.key('api/v1/home', {'category': 'anime'})
+        self.assertRegex(key, r'^api_cache:api/v1/home:g\d+:anime:g\d+:[0-9a-f]{32}$')
+        self.assertRegex(self.key('api/v1/search', {'q': 'x'}), r'^api_cache:api/v1/search:g\d+:[0-9a-f]{32}$')
+
+    def test_endpoint_bump_invalidates_only_that_endpoint(self):
+        home, search = self.key('api/v1/home', {'page': 1}), self.key('api/v1/search', {'q': 'x'})
+        self.api.cache.set(home, {'data': ['old']})
+        self.api.invalidate(endpoint='api/v1/home')
+        self.assertNotEqual(self.key('api/v1/home', {'page': 1}), home)
+        self.assertEqual(self.key('api/v1/search', {'q': 'x'}), search)
+        self.assertEqual(self.api.get('api/v1/home', {'page': 1}).data, {'data': ['ok']})
+        self.assertEqual(self.upstream.call_count, 1)
+
+    def test_category_bump_invalidates_it_across_endpoints(self):
+        keys = [self.key(endpoint, {'category': category})
+                for endpoint in ('api/v1/home', 'api/v1/latest') for category in ('anime', 'donghua')]
+        self.api.invalidate(category='Anime')
+        new_keys = [self.key(endpoint, {'category': category})
+                    for endpoint in ('api/v1/home', 'api/v1/latest') for category in ('anime', 'donghua')]
+        self.assertEqual([old != new for old, new in zip(keys, new_keys)], [True, False, True, False])
+
+    def test_other_workers_see_a_bump_once_their_generations_expire(self):
+        other_worker = SmartCache()
+        key = other_worker.get_cache_key('api/v1/home')
+        self.api.invalidate(endpoint='api/v1/home')
+        self.assertEqual(other_worker.get_cache_key('api/v1/home'), key)
+        with mock.patch('stream.api_client.time.time', return_value=time.time() + other_worker.generation_ttl):
+            self.assertEqual(other_worker.get_cache_key('api/v1/home'), self.key('api/v1/home'))
+
+    def test_request_invalidation_drops_only_its_entry(self):
+        page_1, page_2 = self.key('api/v1/home', {'page': 1}), self.key('api/v1/home', {'page': 2})
+        self.api.cache.set(page_1, {'data': [1]})
+        self.api.cache.set(page_2, {'data': [2]})
+        self.api.invalidate('api/v1/home', {'page': '1'})
+        self.assertIsNone(self.api.cache.get_envelope(page_1))
+        self.assertIsNotNone(self.api.cache.get_envelope(page_2))
+
+
+class CodecTests(SimpleTestCase):
+    payload = {'data': [_anime(i) for i in range(3)], 'total': 3, 'score': 8.5, 'next': None, 'ok': True,
+               'title': 'Shingeki no Kyojin 進撃'}
+
+    def round_trip(self, codec):
+        tag, encoded = codecs.encode(self.payload, codec)
+        self.assertEqual(tag, codec.tag)
+        self.assertIsInstance(encoded, bytes)
+        self.assertEqual(codecs.decode(tag, encoded), self.payload)
+
+    def test_pickle_round_trip(self):
+        self.round_trip(codecs.PICKLE)
+
+    @skipUnless(codecs.orjson is not None, 'orjson is not installed')
+    def test_orjson_round_trip(self):
+        self.round_trip(codecs.get_codec('orjson'))
+
+    @skipUnless(codecs.msgpack is not None, 'msgpack is not installed')
+    def test_msgpack_round_trip(self):
+        self.round_trip(codecs.get_codec('msgpack'))
+
+    @skipUnless(codecs.orjson is not None, 'orjson is not installed')
+    def test_values_the_codec_cannot_represent_use_pickle(self):
+        value = {1: 'int key', 'when': timedelta(seconds=5)}
+        tag, encoded = codecs.encode(value, codecs.get_codec('orjson'))
+        self.assertEqual(tag, codecs.PICKLE.tag)
+        self.assertEqual(codecs.decode(tag, encoded), value)
+
+    def test_unknown_tags_raise_key_error(self):
+        with self.assertRaises(KeyError):
+            codecs.decode('bson:1', b'')
+        with self.assertRaises(KeyError):
+            codecs.decode('pickle:2', codecs.PICKLE.dumps(self.payload))
+
+    def test_unknown_codec_name_is_a_configuration_error(self):
+        with self.assertRaises(ImproperlyConfigured):
+            codecs.get_codec('msgpak')
+
+    def test_uninstalled_codec_falls_back_to_pickle_with_a_warning(self):
+        msgpack_codec = codecs.CODECS['msgpack:1']
+        with mock.patch.object(msgpack_codec, 'available', False), \
+                self.assertLogs('stream.api', 'WARNING') as logs:
+            self.assertIs(codecs.get_codec('msgpack'), codecs.PICKLE)
+        self.assertIn("'msgpack' is configured but its library is not installed", logs.output[0])
+
+    @override_settings(API_CACHE_CODEC='msgpak')
+    def test_configured_codec_is_checked(self):
+        with mock.patch.object(codecs, '_active', None), self.assertRaises(ImproperlyConfigured):
+            codecs.get_codec()
+
+    @override_settings(**API_SETTINGS)
+    def test_envelopes_round_trip_with_each_available_codec(self):
+        cache = SmartCache()
+        for codec in codecs.CODECS.values():
+            if not codec.available:
+                continue
+            with self.subTest(codec=codec.tag), mock.patch.object(codecs, '_active', codec):
+                cache.set('api_cache:codec-test', copy.deepcopy(self.payload))
+                stored = caches['default'].get('api_cache:codec-test')
+                self.assertEqual(stored.codec, codec.tag)
+                self.assertEqual(cache.get_envelope('api_cache:codec-test').data, self.payload)
+
+
+def _episode_payload(i, variant=0):
+    return json.dumps({
+        'status': 'success', 'source': f'gateway-{variant}',
+        'data': {'title': f'Episode {i}', 'episode': i, 'anime': _anime(i % 7),
+                 'servers': [{'name': f'Server {n}', 'url': f'https://cdn{variant}.example.com/{i}/{n}.m3u8'}
+                             for n in range(3)]},
+    }).encode()
+
+
+@skipUnless(compression.zstandard is not None, 'zstandard is not installed')
+@override_settings(**API_SETTINGS)
+class ZstdDictionaryTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.compressor = self.worker()
+
+    def worker(self):
+        return compression.ZstdDictionaryCompressor(min_size=64, cache_backend=caches['default'])
+
+    def train(self, variant):
+        return self.compressor.train([_episode_payload(i, variant) for i in range(400)], dict_size=2048)
+
+    def test_round_trip_without_a_dictionary(self):
+        payload = _episode_payload(1)
+        tag, compressed = self.compressor.compress(payload)
+        self.assertEqual(tag, 'zstd:0')
+        self.assertEqual(self.worker().decompress(tag, compressed), payload)
+        self.assertEqual(self.compressor.compress(b'tiny'), (None, b'tiny'))
+
+    def test_round_trip_with_a_trained_dictionary(self):
+        payload = _episode_payload(1000)
+        plain = self.compressor.compress(payload)[1]
+        dictionary = self.train(0)
+        self.compressor.store(dictionary)
+        tag, compressed = self.compressor.compress(payload)
+        self.assertEqual(tag, f'zstd:{dictionary.dict_id()}')
+        self.assertLess(len(compressed), len(plain))
+        # Another worker loads the dictionary from the shared cache
+        self.assertEqual(self.worker().decompress(tag, compressed), payload)
+
+    def test_entries_survive_a_rotation_while_their_dictionary_is_kept(self):
+        first, second = self.train(0), self.train(1)
+        self.assertNotEqual(first.dict_id(), second.dict_id())
+        self.compressor.store(first)
+        old = self.compressor.compress(_episode_payload(1))
+        self.compressor.store(second)
+        new = self.compressor.compress(_episode_payload(2))
+        self.assertNotEqual(old[0], new[0])
+        worker = self.worker()
+        self.assertEqual(worker.decompress(*old), _episode_payload(1))
+        self.assertEqual(worker.decompress(*new), _episode_payload(2))
+
+    def test_rotated_out_dictionary_reads_as_a_miss(self):
+        first, second = self.train(0), self.train(1)
+        self.compressor.store(first)
+        old = self.compressor.compress(_episode_payload(1))
+        with mock.patch.object(compression, '_compressor', self.compressor), \
+                mock.patch.object(compression, '_enabled', True):
+            SmartCache().set('api_cache:zstd-test', json.loads(_episode_payload(1)))
+        self.assertEqual(caches['default'].get('api_cache:zstd-test').compression, f'zstd:{first.dict_id()}')
+
+        self.assertEqual(self.compressor.store(second, keep=1), [first.dict_id()])
+        worker = self.worker()
+        with self.assertRaises(KeyError):
+            worker.decompress(*old)
+        with mock.patch.object(compression, '_compressor', worker):
+            self.assertIsNone(SmartCache().get_envelope('api_cache:zstd-test'))
+
+    def test_workers_switch_dictionaries_after_the_refresh_interval(self):
+        worker = self.worker()
+        self.assertEqual(worker.active_id(), 0)
+        dictionary = self.train(0)
+        self.compressor.store(dictionary)
+        self.assertEqual(worker.active_id(), 0)
+        with mock.patch('stream.compression.time.time', return_value=time.time() + worker.refresh_interval):
+            self.assertEqual(worker.active_id(), dictionary.dict_id())
+
+
+class UnreachableRedis:
+    """Redis client whose every command times out after ``delay``"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+
+    def register_script(self, script):
+        return self.fail
+
+    def fail(self, *args, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        raise redis.exceptions.TimeoutError('Timeout reading from socket')
+
+    def __getattr__(self, name):
+        return self.fail
+
+
+@override_settings(**{**API_SETTINGS, 'API_RETRY_BUDGET_SHARED': True,
+                      'API_ADMISSION_LIMITS': {'default': {'concurrency': 10, 'rate': 100}}},
+                   REDIS_RETRY_AFTER=60)
+class RedisOutageTests(APIClientTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.redis = UnreachableRedis()
+        patcher = mock.patch.object(redis_client, '_connection',
+                                    lambda alias: self.redis if alias == 'default' else None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(redis_client._unavailable_until.clear)
+
+    def test_upstream_calls_do_not_wait_on_redis(self):
+        start = time.time()
+        responses = [self.api.get('api/v1/home', {'page': page}) for page in range(5)]
+        self.assertEqual([response.data for response in responses], [{'data': ['ok']}] * 5)
+        self.assertEqual(self.upstream.call_count, 5)
+        self.assertEqual(self.redis.calls, 1)
+        self.assertLess(time.time() - start, 2 * self.redis.delay)
+
+    def test_local_state_takes_over(self):
+        for page in range(3):
+            self.api.get('api/v1/home', {'page': page})
+        self.assertEqual(self.api.get_circuit_breaker('api/v1/home').get_stats()['state'], 'CLOSED')
+        self.assertEqual(self.api.admission.get_stats()['in_flight'], 0)
+        self.assertEqual(self.api.retry_budget.get_tokens(), self.api.retry_budget.burst)
+
+    @override_settings(REDIS_RETRY_AFTER=0.1)
+    def test_redis_is_tried_again_after_retry_after(self):
+        self.api.get('api/v1/home', {'page': 1})
+        self.api.get('api/v1/home', {'page': 2})
+        self.assertEqual(self.redis.calls, 1)
+        time.sleep(0.15)
+        self.api.get('api/v1/home', {'page': 3})
+        self.assertEqual(self.redis.calls, 2)
@@ -1,5 +1,10 @@
+from django.conf import settings
 from django.urls import path
 from .views import root, home, anime_detail, latest, schedule, search, episode_detail, api_health_check, reset_circuit_breaker, history_page, watchlist_page
+
+if getattr(settings, 'ASYNC_VIEWS', False):
+    from .async_views import root, home, anime_detail, latest, schedule, search, episode_detail
+
 app_name = 'stream'
 urlpatterns = [
         path('', root, name='root'),
@@ -3,8 +3,14 @@ Utility functions for the stream application
 """
 
 from .query_optimization import cached_api_call, optimize_episode_data
+from .redis_client import get_redis_connection, report_redis_error
+from .deadline import DeadlineExceeded, deadline_scope
 
 __all__ = [
     'cached_api_call',
     'optimize_episode_data',
-]
\ No newline at end of file
+    'get_redis_connection',
+    'report_redis_error',
+    'DeadlineExceeded',
+    'deadline_scope',
+]
@@ -0,0 +1,62 @@
+"""
+Request-scoped deadlines
+The deadline middleware stores an absolute deadline in a contextvar so API
+calls made while handling the request size their timeouts, retries and
+waits to the time the request has left, instead of outliving the worker
+timeout
+"""
+
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before an upstream call could be made"""
+
+
+def set_deadline(seconds: float) -> contextvars.Token:
+    """Start a deadline ``seconds`` from now, returning the token to reset it"""
+    return _deadline.set(time.time() + seconds)
+
+
+def reset_deadline(token: contextvars.Token):
+    """Restore the deadline from before ``token`` was set"""
+    try:
+        _deadline.reset(token)
+    except ValueError:
+        # Token created in another context, e.g. sync middleware run by
+        # asgiref in a copied context; just clear the deadline
+        _deadline.set(token.old_value if token.old_value is not contextvars.Token.MISSING else None)
+
+
+def get_deadline() -> Optional[float]:
+    """Absolute deadline (epoch seconds) for the current request, or None"""
+    return _deadline.get()
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left before the deadline (never negative), ``default`` without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    return max(deadline - time.time(), 0.0)
+
+
+def cap(seconds: float) -> float:
+    """Limit a timeout or wait to the time left before the deadline"""
+    left = remaining()
+    return seconds if left is None else min(seconds, left)
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Run a block under a deadline, e.g. management commands or tests"""
+    token = set_deadline(seconds)
+    try:
+        yield
+    finally:
+        reset_deadline(token)
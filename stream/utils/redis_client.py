@@ -0,0 +1,89 @@
+"""
+Access to the raw Redis client behind a Django cache alias
+Used for atomic operations (leases, counters, scripts) the cache API doesn't expose
+"""
+
+import time
+import logging
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import caches
+
+try:
+    from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+except ImportError:
+    RedisConnectionError = RedisTimeoutError = None
+
+try:
+    from django_redis.exceptions import ConnectionInterrupted
+except ImportError:
+    ConnectionInterrupted = None
+
+logger = logging.getLogger('stream.api')
+
+# Errors that mean Redis is unreachable, as opposed to a bad call (e.g. incr of a missing key)
+OUTAGE_ERRORS = tuple(error for error in (
+    ConnectionError, TimeoutError, RedisConnectionError, RedisTimeoutError, ConnectionInterrupted,
+) if error)
+
+# Per alias, until when Redis is skipped after an outage error (per process)
+_unavailable_until: Dict[str, float] = {}
+
+
+def get_redis_connection(alias: str = 'default'):
+    """
+    Return the redis-py client used by a cache alias, or None when the alias
+    is not Redis-backed (e.g. LocMemCache in development), its failover
+    breaker is open, or a raw Redis call on it failed with a connection
+    error less than REDIS_RETRY_AFTER seconds ago
+    """
+    if _unavailable_until.get(alias, 0) > time.time():
+        return None
+    return _connection(alias)
+
+
+def report_redis_error(error: Exception, alias: str = 'default'):
+    """
+    Record an error from a raw Redis call. Outage errors make
+    get_redis_connection skip the alias for REDIS_RETRY_AFTER seconds, so
+    callers fall back to process-local state instead of each waiting out a
+    socket timeout.
+    """
+    if not isinstance(error, OUTAGE_ERRORS):
+        return
+    retry_after = getattr(settings, 'REDIS_RETRY_AFTER', 5)
+    if _unavailable_until.get(alias, 0) <= time.time():
+        logger.error(f"Redis behind '{alias}' unreachable, skipping it for {retry_after}s: {str(error)}")
+    _unavailable_until[alias] = time.time() + retry_after
+
+
+def _connection(alias: str):
+    try:
+        backend = caches[alias]
+    except Exception:
+        return None
+
+    # FailoverCache: the Redis alias behind it, unless Redis is known to be down
+    primary_alias = getattr(backend, 'primary_alias', None)
+    if primary_alias is not None:
+        return get_redis_connection(primary_alias) if backend.available else None
+
+    # django-redis backend
+    if hasattr(backend, 'client') and hasattr(backend.client, 'get_client'):
+        try:
+            return backend.client.get_client(write=True)
+        except Exception as e:
+            logger.warning(f"Could not get django-redis client for '{alias}': {str(e)}")
+            return None
+
+    # Django's built-in RedisCache backend
+    redis_cache_client = getattr(backend, '_cache', None)
+    if redis_cache_client is not None and hasattr(redis_cache_client, 'get_client'):
+        try:
+            return redis_cache_client.get_client(write=True)
+        except Exception as e:
+            logger.warning(f"Could not get Redis client for '{alias}': {str(e)}")
+            return None
+
+    return None
@@ -16,21 +16,26 @@ import json
 import re
 import os
 import time
-import hashlib
+import random
 
 # Import API client with fallback
-from .api_client import api_client, make_api_request, get_api_stats, api_health_check, APIResponse
+from .api_client import (
+    api_client, make_api_request, make_api_requests, get_api_stats, api_health_check,
+    reset_circuit_breakers, APIRequest, APIResponse, CircuitBreakerOpenError
+)
+from .utils.deadline import DeadlineExceeded
 
 # Configure logging
 logger = logging.getLogger(__name__)
 performance_logger = logging.getLogger('stream.performance')
 
-BASE_URL = 'http://apigatway.humanmade.my.id:8080'
+# Canonical gateway; requests are spread over settings.API_BASE_URLS by the API client
+BASE_URL = api_client.base_url
 
-# Circuit breaker state
-CIRCUIT_BREAKER_KEY = 'api_circuit_breaker'
-CIRCUIT_BREAKER_FAILURE_THRESHOLD = 10  # Increased from 5 to be less sensitive
-CIRCUIT_BREAKER_TIMEOUT = 60  # Reduced from 5 minutes to 1 minute
+CATEGORIES_REQUEST = APIRequest(
+    'api/categories/names',
+    cache_timeout=getattr(settings, 'CACHE_TIMEOUT_LONG', 3600)
+)
 
 
 def get_seo_context(request, page_type, **kwargs):
@@ -192,77 +197,72 @@ def get_seo_context(request, page_type, **kwargs):
     }
 
 
-def is_circuit_breaker_open():
-    """Check if circuit breaker is open (API is considered down)"""
-    breaker_data = cache.get(CIRCUIT_BREAKER_KEY, {'failures': 0, 'last_failure': 0})
-    
-    # If we have too many failures recently, circuit is open
-    if breaker_data['failures'] >= CIRCUIT_BREAKER_FAILURE_THRESHOLD:
-        time_since_last_failure = time.time() - breaker_data['last_failure']
-        if time_since_last_failure < CIRCUIT_BREAKER_TIMEOUT:
-            logger.info(f"Circuit breaker is open. Time since last failure: {time_since_last_failure:.2f}s, timeout: {CIRCUIT_BREAKER_TIMEOUT}s")
-            return True
-        else:
-            # Reset circuit breaker after timeout
-            logger.info("Circuit breaker timeout reached, resetting...")
-            cache.delete(CIRCUIT_BREAKER_KEY)
-            return False
-    
-    return False
+def is_circuit_breaker_open(endpoint=None):
+    """
+    Check if circuit breaker is open (API is considered down).
+    Without an endpoint, reports whether any endpoint's breaker is open.
+    """
+    if endpoint:
+        return api_client.get_circuit_breaker(endpoint).is_open()
+    return any(
+        api_client.get_circuit_breaker(name).is_open()
+        for name in api_client.get_circuit_breaker_names()
+    )
 
-def record_api_failure():
+def record_api_failure(endpoint='default'):
     """Record an API failure for circuit breaker"""
-    breaker_data = cache.get(CIRCUIT_BREAKER_KEY, {'failures': 0, 'last_failure': 0})
-    breaker_data['failures'] += 1
-    breaker_data['last_failure'] = time.time()
-    cache.set(CIRCUIT_BREAKER_KEY, breaker_data, timeout=CIRCUIT_BREAKER_TIMEOUT * 2)
-    logger.warning(f"API failure recorded. Total failures: {breaker_data['failures']}")
+    breaker = api_client.get_circuit_breaker(endpoint)
+    breaker.record_failure()
+    logger.warning(f"API failure recorded for {breaker.name}. Total failures: {breaker.failure_count}")
 
-def record_api_success():
-    """Record an API success for circuit breaker"""
-    cache.delete(CIRCUIT_BREAKER_KEY)
-    logger.info("API success recorded. Circuit breaker reset.")
+def record_api_success(endpoint=None):
+    """
+    Reset the circuit breaker of an endpoint that answered again. Only that
+    breaker is reset; without an endpoint nothing is (use reset_circuit_breakers).
+    """
+    if not endpoint:
+        logger.warning("API success recorded without an endpoint, no circuit breaker reset")
+        return
+    breaker = api_client.get_circuit_breaker(endpoint)
+    breaker.reset()
+    logger.info(f"API success recorded for {breaker.name}. Circuit breaker reset.")
 
 def make_api_request_with_retry(url, params=None, max_retries=3, timeout=15, backoff_factor=1):
     """
-    Make API request with retry mechanism and exponential backoff
+    Make API request with retry mechanism and exponential backoff.
+    Attempts and waits stay within the request deadline.
     """
-    # Check circuit breaker first, but allow occasional test requests
-    if is_circuit_breaker_open():
-        # Try to make a test request every 10th time to see if API is back
-        breaker_data = cache.get(CIRCUIT_BREAKER_KEY, {'failures': 0, 'last_failure': 0})
-        time_since_last_failure = time.time() - breaker_data['last_failure']
-        
-        # If it's been more than 30 seconds, try one test request
-        if time_since_last_failure > 30:
-            logger.info("Circuit breaker is open, but trying one test request...")
-        else:
-            logger.warning("Circuit breaker is open, skipping API request")
-            raise requests.exceptions.ConnectionError("API circuit breaker is open - service temporarily unavailable")
-    
+    last_error = None
     for attempt in range(max_retries):
         try:
             logger.info(f"API Request attempt {attempt + 1}/{max_retries}: {url} with params={params}")
             
-            # Increase timeout for each retry
-            current_timeout = timeout + (attempt * 5)
-            
-            response = requests.get(url, params=params, timeout=current_timeout)
-            response.raise_for_status()
+            # Increase timeout for each retry; the client caps it to the request deadline
+            # and shares its breaker and gateway pool with this path
+            response = api_client.send_attempt(url, params, timeout=timeout + (attempt * 5))
             
             logger.info(f"API Request successful on attempt {attempt + 1}")
-            record_api_success()  # Record success for circuit breaker
             return response
             
+        except DeadlineExceeded:
+            logger.warning(f"Request deadline reached before attempt {attempt + 1}: {url}")
+            if last_error is not None:
+                raise last_error
+            raise
+            
+        except CircuitBreakerOpenError as e:
+            logger.warning("Circuit breaker is open, skipping API request")
+            raise requests.exceptions.ConnectionError(str(e))
+            
         except requests.exceptions.Timeout as e:
             logger.warning(f"Timeout on attempt {attempt + 1}: {str(e)}")
-            record_api_failure()  # Record failure for circuit breaker
+            last_error = e
             if attempt == max_retries - 1:
                 raise
                 
         except requests.exceptions.ConnectionError as e:
             logger.warning(f"Connection error on attempt {attempt + 1}: {str(e)}")
-            record_api_failure()  # Record failure for circuit breaker
+            last_error = e
             if attempt == max_retries - 1:
                 raise
                 
@@ -270,25 +270,28 @@ def make_api_request_with_retry(url, params=None, max_retries=3, timeout=15, bac
             # For 5xx errors, retry. For 4xx errors, don't retry
             if e.response.status_code >= 500:
                 logger.warning(f"Server error {e.response.status_code} on attempt {attempt + 1}: {str(e)}")
-                record_api_failure()  # Record failure for circuit breaker
+                last_error = e
                 if attempt == max_retries - 1:
                     raise
             else:
-                # Client error, don't retry
+                # Client error, don't retry (the breaker doesn't count 4xx as failures)
                 logger.error(f"Client error {e.response.status_code}: {str(e)}")
-                # Don't record 4xx errors as circuit breaker failures
                 raise
                 
         except Exception as e:
             logger.error(f"Unexpected error on attempt {attempt + 1}: {str(e)}")
-            record_api_failure()  # Record failure for circuit breaker
+            last_error = e
             if attempt == max_retries - 1:
                 raise
         
         # Wait before retrying (exponential backoff)
         if attempt < max_retries - 1:
-            wait_time = backoff_factor * (2 ** attempt)
-            logger.info(f"Waiting {wait_time} seconds before retry...")
+            wait_time = random.uniform(0, backoff_factor * (2 ** attempt))
+            # Within the request deadline and the API client's retry budget, so brownouts aren't amplified
+            if not api_client.allow_retry(wait_time):
+                logger.warning(f"No request deadline or retry budget left to retry {url}")
+                raise last_error
+            logger.info(f"Waiting {wait_time:.2f} seconds before retry...")
             time.sleep(wait_time)
     
     # This should never be reached, but just in case
@@ -326,43 +329,53 @@ def decode_episode_id(encoded_id):
         logger.error(f"Error decoding episode ID: {str(e)}")
         return {}
 
+def _fetch_page_data(endpoint, params=None, cache_timeout=300):
+    """Call the API client for a view, returning (response, error) instead of raising"""
+    try:
+        return make_api_request(endpoint, params=params, cache_timeout=cache_timeout), None
+    except Exception as e:
+        return None, e
+
+def _fetch_page_data_with_categories(endpoint, params=None, cache_timeout=300):
+    """
+    Fetch the categories list and the page data concurrently, returning
+    (categories, response, error)
+    """
+    try:
+        categories_response, response = make_api_requests([
+            CATEGORIES_REQUEST,
+            APIRequest(endpoint, params, cache_timeout),
+        ])
+    except Exception as e:
+        logger.error(f"Failed to get categories: {str(e)}")
+        return ['anime', 'all'], None, e
+    return _categories_from_response(categories_response), response, None
+
+def _categories_from_response(response):
+    """Extract the category list from a categories API response"""
+    if response.status_code == 200 and 'data' in response.data:
+        return response.data.get('data', ['anime', 'all'])
+    logger.warning(f"Categories API returned unexpected response: {response.data}")
+    return ['anime', 'all']
+
 def get_categories():
     """Helper function to get available categories from API using robust client"""
     try:
         response = make_api_request(
-            'api/categories/names',
-            cache_timeout=getattr(settings, 'CACHE_TIMEOUT_LONG', 3600)
+            CATEGORIES_REQUEST.endpoint,
+            cache_timeout=CATEGORIES_REQUEST.cache_timeout
         )
-        
-        if response.status_code == 200 and 'data' in response.data:
-            return response.data.get('data', ['anime', 'all'])
-        else:
-            logger.warning(f"Categories API returned unexpected response: {response.data}")
-            return ['anime', 'all']
+        return _categories_from_response(response)
             
     except Exception as e:
         logger.error(f"Failed to get categories: {str(e)}")
         return ['anime', 'all']  # Fallback categories
 
-@cache_page(getattr(settings, 'CACHE_TIMEOUT_SHORT', 60))
-@vary_on_headers('User-Agent')
-def root(request):
-    """Root page with optimized caching and error handling"""
-    start_time = time.time()
-    
-    # Get available categories from API
-    categories = get_categories()
-    
-    # Get content for the "all" category to show all available content
+def _root_context(request, categories, response, error, start_time):
+    """Build the root page context from the home API response"""
     default_category = "all"
-    
-    try:
-        response = make_api_request(
-            'api/v1/home',
-            params={'category': default_category},
-            cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60)
-        )
-        
+
+    if error is None:
         content_data = response.data
         
         # Add metadata about the response
@@ -372,13 +385,12 @@ def root(request):
                 'stale': response.stale,
                 'source': response.source
             }
-            
-    except Exception as e:
-        logger.error(f"Root page API error: {str(e)}")
+    else:
+        logger.error(f"Root page API error: {str(error)}")
         content_data = {
             "error": "Service temporarily unavailable",
             "message": "Please try again later",
-            "debug_info": str(e) if settings.DEBUG else None
+            "debug_info": str(error) if settings.DEBUG else None
         }
     
     # Log performance
@@ -390,7 +402,7 @@ def root(request):
         'has_error': 'error' in content_data
     }))
     
-    context = {
+    return {
         "categories": categories,
         "datas": content_data,
         "category": default_category,
@@ -398,32 +410,35 @@ def root(request):
         "active_page": "home",
         "seo_context": get_seo_context(request, 'home', category='all')
     }
-    
-    return render(request, 'stream/root.html', context)
 
-@cache_page(getattr(settings, 'CACHE_TIMEOUT_MEDIUM', 300))
+@cache_page(getattr(settings, 'CACHE_TIMEOUT_SHORT', 60))
 @vary_on_headers('User-Agent')
-def home(request, category):
-    """Category home page with robust error handling and caching"""
+def root(request):
+    """Root page with optimized caching and error handling"""
     start_time = time.time()
     
-    # Get available categories
-    categories = get_categories()
+    # Get available categories and the content for the "all" category together
+    categories, response, error = _fetch_page_data_with_categories(
+        'api/v1/home',
+        params={'category': 'all'},
+        cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60)
+    )
     
-    # Validate category
+    context = _root_context(request, categories, response, error, start_time)
+    return render(request, 'stream/root.html', context)
+
+def _home_category(category, categories):
+    """Validate the requested category against the available ones"""
     if category not in categories:
         logger.warning(f"Invalid category requested: {category}")
         category = categories[0] if categories else 'all'
-    
+    return category
+
+def _home_context(request, category, categories, response, error, start_time):
+    """Build the category home page context from the home API response"""
     error_details = None
     
-    try:
-        response = make_api_request(
-            'api/v1/home',
-            params={'category': category},
-            cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60)
-        )
-        
+    if error is None:
         data = response.data
         
         # Validate confidence score if present
@@ -448,14 +463,14 @@ def home(request, category):
             
         logger.info(f"Home page loaded for category {category}: confidence={confidence_score}")
         
-    except Exception as e:
-        error_details = f"Service Error: {str(e)}" if settings.DEBUG else "Service temporarily unavailable"
-        logger.error(f"Home page error for category {category}: {str(e)}")
+    else:
+        error_details = f"Service Error: {str(error)}" if settings.DEBUG else "Service temporarily unavailable"
+        logger.error(f"Home page error for category {category}: {str(error)}")
         data = {
             "error": "Service temporarily unavailable",
             "message": "Please try again later",
             "error_details": error_details,
-            "debug_info": str(e) if settings.DEBUG else None
+            "debug_info": str(error) if settings.DEBUG else None
         }
     
     # Log performance
@@ -468,7 +483,7 @@ def home(request, category):
         'confidence_score': data.get('confidence_score', 'N/A')
     }))
     
-    context = {
+    return {
         "datas": data,
         "category": category,
         "categories": categories,
@@ -477,9 +492,50 @@ def home(request, category):
         "active_page": "category",
         "seo_context": get_seo_context(request, 'home', category=category)
     }
+
+@cache_page(getattr(settings, 'CACHE_TIMEOUT_MEDIUM', 300))
+@vary_on_headers('User-Agent')
+def home(request, category):
+    """Category home page with robust error handling and caching"""
+    start_time = time.time()
+    cache_timeout = getattr(settings, 'CACHE_TIMEOUT_SHORT', 60)
+    
+    # The catch-all route also matches junk like /wp-login.php/, so the
+    # category is validated before the home endpoint is called for it
+    categories = _cached_categories(request)
+    if categories is None:
+        categories = get_categories()
+        cache.set("categories_list", categories, 3600)
+    category = _home_category(category, categories)
+    
+    response, error = _fetch_page_data('api/v1/home', params={'category': category},
+                                       cache_timeout=cache_timeout)
+    
+    context = _home_context(request, category, categories, response, error, start_time)
     return render(request, 'stream/index.html', context)
 
-def anime_detail(request):
+def _page_data(view_name, subject, response, error):
+    """
+    Shared error handling for the detail/listing views: returns (data, error_details)
+    """
+    if error is not None:
+        error_details = f"Unexpected view error: {str(error)}"
+        logger.error(f"Unexpected view error in {view_name} for {subject}: {str(error)}")
+        return {
+            "error": error_details,
+            "error_message_for_user": "An unexpected error occurred in the application."
+        }, error_details
+
+    data = response.data
+    error_details = None
+    if response.source == 'error':
+        error_details = data.get('message', 'Service temporarily unavailable')
+        logger.error(f"API error in {view_name} for {subject}: {data.get('error')}")
+        data['error_message_for_user'] = error_details
+    return data, error_details
+
+def _anime_detail_request(request, categories):
+    """Resolve the identifier, category and API parameters for anime_detail"""
     # Check if this is a retry request that should clear cache
     is_retry_request = request.GET.get('_retry') or request.GET.get('_clear_cache')
     
@@ -488,65 +544,36 @@ def anime_detail(request):
     slug = request.GET.get('slug')
     anime_slug = request.GET.get('anime_slug')
     
-    # Get available categories
-    categories = get_categories()
     default_category = categories[0] if categories else 'all'
     category = request.GET.get('category', default_category)
     
     # Use the first non-empty parameter as the identifier
     identifier = anime_slug or slug or anime_id
     
-    if not identifier:
-        return render(request, 'stream/detail.html', {
-            "error": "No anime identifier provided",
-            "category": category,
-            "categories": categories
-        })
-
-    error_details = None
-    
-    try:
-        # Prepare parameters for API request
-        params = {}
-        if anime_id:
-            params['id'] = anime_id
-        if slug:
-            params['slug'] = slug
-        if anime_slug:
-            params['anime_slug'] = anime_slug
-        if category:
-            params['category'] = category
-            
-        # For retry requests, use shorter cache timeout or bypass cache
-        cache_timeout = getattr(settings, 'CACHE_TIMEOUT_MEDIUM', 300)  # 5 minutes cache
-        if is_retry_request:
-            cache_timeout = 60  # 1 minute cache for retries
-            # Clear existing cache for this specific request
-            api_cache_key = f"api_cache:anime-detail:{hashlib.md5(str(params).encode()).hexdigest()}"
-            cache.delete(api_cache_key)
-            logger.info(f"Retry request detected, clearing cache for anime: {identifier}")
-        
-        # Make API request using the robust client
-        response = make_api_request(
-            'api/v1/anime-detail',
-            params=params,
-            cache_timeout=cache_timeout
-        )
+    # Prepare parameters for API request
+    params = {}
+    if anime_id:
+        params['id'] = anime_id
+    if slug:
+        params['slug'] = slug
+    if anime_slug:
+        params['anime_slug'] = anime_slug
+    if category:
+        params['category'] = category
         
-        data = response.data
+    # For retry requests, use shorter cache timeout or bypass cache
+    cache_timeout = getattr(settings, 'CACHE_TIMEOUT_MEDIUM', 300)  # 5 minutes cache
+    if identifier and is_retry_request:
+        cache_timeout = 60  # 1 minute cache for retries
+        # Clear existing cache for this specific request
+        api_client.invalidate('api/v1/anime-detail', params)
+        logger.info(f"Retry request detected, clearing cache for anime: {identifier}")
+    
+    return identifier, category, params, cache_timeout
 
-        if response.source == 'error':
-            error_details = data.get('message', 'Service temporarily unavailable')
-            logger.error(f"API error in anime_detail for identifier {identifier}: {data.get('error')}")
-            data['error_message_for_user'] = error_details
-
-    except Exception as e:
-        error_details = f"Unexpected view error: {str(e)}"
-        logger.error(f"Unexpected view error in anime_detail for identifier {identifier}: {str(e)}")
-        data = {
-            "error": error_details,
-            "error_message_for_user": "An unexpected error occurred in the application."
-        }
+def _anime_detail_context(request, identifier, category, categories, response, error):
+    """Build the anime detail page context from the anime-detail API response"""
+    data, error_details = _page_data('anime_detail', f"identifier {identifier}", response, error)
 
     # Normalize the data structure for the template
     # Some APIs return data.data (nested), others return data directly
@@ -573,48 +600,55 @@ def anime_detail(request):
     elif 'data' in normalized_data:
         anime_title = normalized_data['data'].get('judul', '')
     
-    context = {
+    return {
         "detail": normalized_data,
         "category": category,
         "anime_slug": identifier,
         "categories": categories,
         "active_page": "detail",  # For navigation active state
         "seo_context": get_seo_context(request, 'anime_detail', anime_title=anime_title, category=category),
-        "error_occurred": response.source == 'error' if 'response' in locals() else True
+        "error_occurred": response is None or response.source == 'error'
     }
-    
-    return render(request, 'stream/detail.html', context)
 
-def latest(request):
-    # Get category from query parameter, default to first available category
+def anime_detail(request):
+    # Get available categories
     categories = get_categories()
-    default_category = categories[0] if categories else 'all'
-    category = request.GET.get('category', default_category)
-    # Get page from query parameter, default to 1
-    page = request.GET.get('page', 1)
+    identifier, category, params, cache_timeout = _anime_detail_request(request, categories)
     
-    error_details = None
+    if not identifier:
+        return render(request, 'stream/detail.html', {
+            "error": "No anime identifier provided",
+            "category": category,
+            "categories": categories
+        })
 
-    try:
-        response = make_api_request(
-            'api/v1/anime-terbaru',
-            params={'category': category, 'page': page},
-            cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60) # 1 minute cache
-        )
-        data = response.data
+    # Make API request using the robust client
+    response, error = _fetch_page_data('api/v1/anime-detail', params=params, cache_timeout=cache_timeout)
+    
+    context = _anime_detail_context(request, identifier, category, categories, response, error)
+    return render(request, 'stream/detail.html', context)
 
-        if response.source == 'error':
-            error_details = data.get('message', 'Service temporarily unavailable')
-            logger.error(f"API error in latest for category {category}: {data.get('error')}")
-            data['error_message_for_user'] = error_details
+def _add_encoded_ids(items, category):
+    """Attach an encoded episode ID to each listed episode"""
+    for item in items:
+        # Create encoded ID for each episode
+        try:
+            if 'url' in item:
+                episode_data = {
+                    'episode_slug': item.get('url', ''),
+                    'episode_url': item.get('url', '')
+                }
+                item['encoded_id'] = encode_episode_id(episode_data, category)
+            else:
+                # Ensure there's at least an empty string to avoid template errors
+                item['encoded_id'] = ''
+        except Exception as e:
+            logger.error(f"Error encoding episode ID in latest view: {str(e)}")
+            item['encoded_id'] = ''
 
-    except Exception as e:
-        error_details = f"Unexpected view error: {str(e)}"
-        logger.error(f"Unexpected view error in latest for category {category}: {str(e)}")
-        data = {
-            "error": error_details,
-            "error_message_for_user": "An unexpected error occurred in the application."
-        }
+def _latest_context(request, category, page, categories, response, error):
+    """Build the latest episodes page context from the anime-terbaru API response"""
+    data, error_details = _page_data('latest', f"category {category}", response, error)
 
     # Process the data to add encoded episode IDs
     if not data.get("error"):
@@ -622,85 +656,44 @@ def latest(request):
             # Process data for all categories
             for cat_name, cat_data in data['data_by_category'].items():
                 if 'data' in cat_data:
-                    for item in cat_data['data']:
-                        # Create encoded ID for each episode
-                        try:
-                            if 'url' in item:
-                                episode_data = {
-                                    'episode_slug': item.get('url', ''),
-                                    'episode_url': item.get('url', '')
-                                }
-                                item['encoded_id'] = encode_episode_id(episode_data, cat_name)
-                            else:
-                                # Ensure there's at least an empty string to avoid template errors
-                                item['encoded_id'] = ''
-                        except Exception as e:
-                            logger.error(f"Error encoding episode ID in latest view: {str(e)}")
-                            item['encoded_id'] = ''
+                    _add_encoded_ids(cat_data['data'], cat_name)
         elif 'data' in data:
             # Process data for a specific category
-            for item in data['data']:
-                # Create encoded ID for each episode
-                try:
-                    if 'url' in item:
-                        episode_data = {
-                            'episode_slug': item.get('url', ''),
-                            'episode_url': item.get('url', '')
-                        }
-                        item['encoded_id'] = encode_episode_id(episode_data, category)
-                    else:
-                        # Ensure there's at least an empty string to avoid template errors
-                        item['encoded_id'] = ''
-                except Exception as e:
-                    logger.error(f"Error encoding episode ID in latest view: {str(e)}")
-                    item['encoded_id'] = ''
+            _add_encoded_ids(data['data'], category)
     
-    context = {
+    return {
         "datas": data,
         "category": category,
         "page": int(page),
         "categories": categories,
         "active_page": "latest",  # For navigation active state
         "seo_context": get_seo_context(request, 'latest', category=category),
-        "error_occurred": response.source == 'error' if 'response' in locals() else True
+        "error_occurred": response is None or response.source == 'error'
     }
-    
-    return render(request, 'stream/latest.html', context)
 
-def schedule(request):
+def latest(request):
     # Get category from query parameter, default to first available category
     categories = get_categories()
     default_category = categories[0] if categories else 'all'
     category = request.GET.get('category', default_category)
-    # Get day from query parameter, if provided
-    day = request.GET.get('day')
+    # Get page from query parameter, default to 1
+    page = request.GET.get('page', 1)
+    
+    response, error = _fetch_page_data(
+        'api/v1/anime-terbaru',
+        params={'category': category, 'page': page},
+        cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60) # 1 minute cache
+    )
     
+    context = _latest_context(request, category, page, categories, response, error)
+    return render(request, 'stream/latest.html', context)
+
+def _schedule_context(request, category, day, categories, response, error):
+    """Build the release schedule page context from the jadwal-rilis API response"""
     # Define days of the week (Indonesian names as used in API)
     days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     
-    error_details = None
-
-    try:
-        # Use the general schedule endpoint
-        response = make_api_request(
-            f"api/v1/jadwal-rilis",
-            params={'category': category},
-            cache_timeout=getattr(settings, 'CACHE_TIMEOUT_MEDIUM', 300) # 5 minutes cache
-        )
-        data = response.data
-
-        if response.source == 'error':
-            error_details = data.get('message', 'Service temporarily unavailable')
-            logger.error(f"API error in schedule for category {category}: {data.get('error')}")
-            data['error_message_for_user'] = error_details
-
-    except Exception as e:
-        error_details = f"Unexpected view error: {str(e)}"
-        logger.error(f"Unexpected view error in schedule for category {category}: {str(e)}")
-        data = {
-            "error": error_details,
-            "error_message_for_user": "An unexpected error occurred in the application."
-        }
+    data, error_details = _page_data('schedule', f"category {category}", response, error)
     
     # Handle _metadata field - Django templates don't allow attributes starting with underscore
     if '_metadata' in data:
@@ -712,7 +705,7 @@ def schedule(request):
             if '_metadata' in cat_data:
                 cat_data['metadata'] = cat_data.pop('_metadata')
     
-    context = {
+    return {
         "datas": data,
         "category": category,
         "categories": categories,
@@ -720,64 +713,43 @@ def schedule(request):
         "days": days,
         "active_page": "schedule",  # For navigation active state
         "seo_context": get_seo_context(request, 'schedule', category=category),
-        "error_occurred": response.source == 'error' if 'response' in locals() else True
+        "error_occurred": response is None or response.source == 'error'
     }
-    
-    return render(request, 'stream/schedule.html', context)
 
-def search(request):
-    """
-    View function for searching content across categories
-    """
-    # Get search parameters from request
-    query = request.GET.get('q', '')
-    page = request.GET.get('page', 1)
-    
-    # Get available categories
+def schedule(request):
+    # Get category from query parameter, default to first available category
     categories = get_categories()
     default_category = categories[0] if categories else 'all'
     category = request.GET.get('category', default_category)
+    # Get day from query parameter, if provided
+    day = request.GET.get('day')
+    
+    # Use the general schedule endpoint
+    response, error = _fetch_page_data(
+        "api/v1/jadwal-rilis",
+        params={'category': category},
+        cache_timeout=getattr(settings, 'CACHE_TIMEOUT_MEDIUM', 300) # 5 minutes cache
+    )
     
+    context = _schedule_context(request, category, day, categories, response, error)
+    return render(request, 'stream/schedule.html', context)
+
+def _search_context(request, query, category, page, categories, response, error):
+    """Build the search results context; response and error are None when there is no query"""
     data = None
     error_details = None
-    response = None
 
-    # Only make API request if there's a search query
     if query:
-        try:
-            # Make the API request using the robust client
-            response = make_api_request(
-                'api/v1/search',
-                params={
-                    'q': query,
-                    'category': category,
-                    'page': page
-                },
-                cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60) # 1 minute cache
-            )
-            data = response.data
+        data, error_details = _page_data('search', f"query '{query}'", response, error)
 
-            if response.source == 'error':
-                error_details = data.get('message', 'Service temporarily unavailable')
-                logger.error(f"API error in search for query '{query}': {data.get('error')}")
-                data['error_message_for_user'] = error_details
-            
-            # Validate confidence_score
-            elif data.get("confidence_score", 0) <= 0.5:
-                error_details = f"Low confidence score: {data.get('confidence_score', 0)}"
-                logger.warning(f"Low confidence score for '{query}': {data.get('confidence_score', 0)}")
-                data['error_message_for_user'] = "Data quality is low, please try again"
-
-        except Exception as e:
-            error_details = f"Unexpected view error: {str(e)}"
-            logger.error(f"Unexpected view error in search for query '{query}': {str(e)}")
-            data = {
-                "error": error_details,
-                "error_message_for_user": "An unexpected error occurred in the application."
-            }
+        # Validate confidence_score
+        if response is not None and response.source != 'error' and data.get("confidence_score", 0) <= 0.5:
+            error_details = f"Low confidence score: {data.get('confidence_score', 0)}"
+            logger.warning(f"Low confidence score for '{query}': {data.get('confidence_score', 0)}")
+            data['error_message_for_user'] = "Data quality is low, please try again"
     
     # Prepare context for the template
-    context = {
+    return {
         "datas": data,
         "category": category,
         "categories": categories,
@@ -789,29 +761,56 @@ def search(request):
         "seo_context": get_seo_context(request, 'search', search_query=query, category=category),
         "error_occurred": (response.source == 'error' if response else (True if query else False))
     }
+
+def search(request):
+    """
+    View function for searching content across categories
+    """
+    # Get search parameters from request
+    query = request.GET.get('q', '')
+    page = request.GET.get('page', 1)
+    
+    # Get available categories
+    categories = get_categories()
+    default_category = categories[0] if categories else 'all'
+    category = request.GET.get('category', default_category)
+    
+    response = error = None
+
+    # Only make API request if there's a search query
+    if query:
+        response, error = _fetch_page_data(
+            'api/v1/search',
+            params={
+                'q': query,
+                'category': category,
+                'page': page
+            },
+            cache_timeout=getattr(settings, 'CACHE_TIMEOUT_SHORT', 60) # 1 minute cache
+        )
     
+    context = _search_context(request, query, category, page, categories, response, error)
     return render(request, 'stream/search_results.html', context)
 
-@cache_page(getattr(settings, 'CACHE_TIMEOUT_LONG', 900))
-@vary_on_headers('User-Agent')
-def episode_detail(request, encoded_id=None):
+def _cached_categories(request):
+    """Categories list from the fast local cache, None when it has to be fetched"""
+    if request.GET.get('_retry') or request.GET.get('_clear_cache'):
+        return None
+    return cache.get("categories_list") or None
+
+def _episode_detail_request(request, encoded_id, categories):
     """
-    Optimized episode detail view with robust error handling and caching
-    Supports both encoded ID in URL path and legacy query parameters
+    Resolve the episode identifier and API parameters for episode_detail
+    categories may be None when the list isn't known yet; the category is
+    then None too unless the encoded ID or query string names one
     """
-    start_time = time.time()
-    
     # Check if this is a retry request that should clear cache (define early)
     is_retry_request = request.GET.get('_retry') or request.GET.get('_clear_cache')
     
-    # Get available categories - use fast cache for this common operation
-    cache_key = "categories_list"
-    categories = cache.get(cache_key)
-    if not categories or is_retry_request:
-        categories = get_categories()
-        cache.set(cache_key, categories, 3600)  # Cache for 1 hour
-    
-    default_category = categories[0] if categories else 'all'
+    if categories is None:
+        default_category = None
+    else:
+        default_category = categories[0] if categories else 'all'
     
     # Initialize parameters
     episode_id = None
@@ -842,61 +841,63 @@ def episode_detail(request, encoded_id=None):
     # Use the first non-empty parameter as the identifier
     identifier = episode_slug or episode_url or episode_id
     
-    if not identifier:
-        return render(request, 'stream/episode_detail.html', {
-            "error": "No episode identifier provided",
-            "category": category,
-            "categories": categories,
-            "active_page": "episode_detail"
-        })
-    
-    error_details = None
-    
-    try:
-        # Prepare parameters for API request - only include necessary parameters
-        params = {}
-        if episode_id:
-            params['id'] = episode_id
-        elif episode_url:
-            params['episode_url'] = episode_url
-        elif episode_slug:
-            params['episode_slug'] = episode_slug
-        
-        # Always include category
-        params['category'] = category
+    # Prepare parameters for API request - only include necessary parameters
+    params = {}
+    if episode_id:
+        params['id'] = episode_id
+    elif episode_url:
+        params['episode_url'] = episode_url
+    elif episode_slug:
+        params['episode_slug'] = episode_slug
+    
+    # Always include category
+    params['category'] = category
+    
+    # Increase cache timeout for episode details
+    cache_timeout = getattr(settings, 'CACHE_TIMEOUT_LONG', 900)
+    if not settings.DEBUG:
+        cache_timeout = 1800  # 30 minutes in production
+    
+    # For retry requests, use shorter cache timeout or bypass cache
+    if identifier and category is not None and is_retry_request:
+        cache_timeout = 60  # 1 minute cache for retries
+        # Clear existing cache for this specific request
+        api_client.invalidate('api/v1/episode-detail', params)
         
-        # Increase cache timeout for episode details
-        cache_timeout = getattr(settings, 'CACHE_TIMEOUT_LONG', 900)
-        if not settings.DEBUG:
-            cache_timeout = 1800  # 30 minutes in production
+        # Clear additional related caches
+        if encoded_id:
+            cache.delete(f"decoded_id:{encoded_id}")
         
-        # For retry requests, use shorter cache timeout or bypass cache
-        if is_retry_request:
-            cache_timeout = 60  # 1 minute cache for retries
-            # Clear existing cache for this specific request
-            api_cache_key = f"api_cache:episode-detail:{hashlib.md5(str(params).encode()).hexdigest()}"
-            cache.delete(api_cache_key)
-            
-            # Clear additional related caches
-            if encoded_id:
-                cache.delete(f"decoded_id:{encoded_id}")
-            
-            # Clear any cached encoded IDs for episodes
-            cache_patterns_to_clear = [
-                f"encoded_id:{category}:*",
-                f"seo_context:episode_detail:{category}:*"
-            ]
-            
-            logger.info(f"Retry request detected, clearing cache for episode: {identifier}")
-            logger.info(f"Cleared cache patterns: {cache_patterns_to_clear}")
-        
-        # Make API request using robust client
-        response = make_api_request(
-            'api/v1/episode-detail',
-            params=params,
-            cache_timeout=cache_timeout
-        )
+        # Clear any cached encoded IDs for episodes
+        cache_patterns_to_clear = [
+            f"encoded_id:{category}:*",
+            f"seo_context:episode_detail:{category}:*"
+        ]
         
+        logger.info(f"Retry request detected, clearing cache for episode: {identifier}")
+        logger.info(f"Cleared cache patterns: {cache_patterns_to_clear}")
+    
+    return {
+        'categories': categories,
+        'category': category,
+        'identifier': identifier,
+        'encoded_id': encoded_id,
+        'episode_id': episode_id,
+        'episode_url': episode_url,
+        'episode_slug': episode_slug,
+        'params': params,
+        'cache_timeout': cache_timeout,
+        'is_retry_request': is_retry_request,
+    }
+
+def _episode_detail_context(request, lookup, response, error, start_time):
+    """Build the episode detail page context from the episode-detail API response"""
+    category = lookup['category']
+    identifier = lookup['identifier']
+    encoded_id = lookup['encoded_id']
+    error_details = None
+    
+    if error is None:
         data = response.data
         
         # Add response metadata - only if needed
@@ -913,15 +914,15 @@ def episode_detail(request, encoded_id=None):
             
         logger.info(f"Episode detail loaded: {identifier} (category: {category})")
         
-    except Exception as e:
-        error_details = f"Service Error: {str(e)}" if settings.DEBUG else "Service temporarily unavailable"
-        logger.error(f"Episode detail error for {identifier}: {str(e)}")
+    else:
+        error_details = f"Service Error: {str(error)}" if settings.DEBUG else "Service temporarily unavailable"
+        logger.error(f"Episode detail error for {identifier}: {str(error)}")
         data = {
             "error": "Service temporarily unavailable",
             "message": "Unable to load episode details",
             "error_details": error_details,
             "success": False,
-            "debug_info": str(e) if settings.DEBUG else None
+            "debug_info": str(error) if settings.DEBUG else None
         }
     
     # Handle _metadata field - Django templates don't allow attributes starting with underscore
@@ -945,9 +946,9 @@ def episode_detail(request, encoded_id=None):
         # Create a clean encoded ID for this episode if we don't have one
         if not encoded_id:
             episode_data = {
-                'episode_slug': episode_slug,
-                'episode_url': episode_url,
-                'id': episode_id
+                'episode_slug': lookup['episode_slug'],
+                'episode_url': lookup['episode_url'],
+                'id': lookup['episode_id']
             }
             encoded_id = encode_episode_id(episode_data, category)
         
@@ -1036,25 +1037,69 @@ def episode_detail(request, encoded_id=None):
     # Get SEO context with caching
     seo_cache_key = f"seo_context:episode_detail:{category}:{episode_title}"
     seo_context = cache.get(seo_cache_key)
-    if not seo_context or is_retry_request:
+    if not seo_context or lookup['is_retry_request']:
         seo_context = get_seo_context(request, 'episode_detail', episode_title=episode_title, category=category)
         cache.set(seo_cache_key, seo_context, 3600)  # Cache for 1 hour
         
-    context = {
+    return {
         "episode_data": normalized_data,
         "category": category,
         "episode_identifier": identifier,
         "encoded_id": encoded_id,
-        "categories": categories,
+        "categories": lookup['categories'],
         "error_details": error_details,
         "debug": settings.DEBUG,
         "active_page": "episode_detail",
         "seo_context": seo_context,
-        "error_occurred": response.source == 'error' if 'response' in locals() else (normalized_data.get('error') or normalized_data.get('success') == False)
+        "error_occurred": response.source == 'error' if response is not None else (normalized_data.get('error') or normalized_data.get('success') == False)
     }
     
+
+@cache_page(getattr(settings, 'CACHE_TIMEOUT_LONG', 900))
+@vary_on_headers('User-Agent')
+def episode_detail(request, encoded_id=None):
+    """
+    Optimized episode detail view with robust error handling and caching
+    Supports both encoded ID in URL path and legacy query parameters
+    """
+    start_time = time.time()
+    lookup = _episode_detail_request(request, encoded_id, _cached_categories(request))
+    
+    if lookup['categories'] is None and (lookup['category'] is None or not lookup['identifier']):
+        # The default category and the error page both need the categories first
+        categories = get_categories()
+        cache.set("categories_list", categories, 3600)  # Cache for 1 hour
+        lookup = _episode_detail_request(request, encoded_id, categories)
+    
+    if not lookup['identifier']:
+        return render(request, 'stream/episode_detail.html', {
+            "error": "No episode identifier provided",
+            "category": lookup['category'],
+            "categories": lookup['categories'],
+            "active_page": "episode_detail"
+        })
+    
+    # Make API request using robust client, fetching the categories
+    # alongside when they weren't cached
+    if lookup['categories'] is None:
+        categories, response, error = _fetch_page_data_with_categories(
+            'api/v1/episode-detail',
+            params=lookup['params'],
+            cache_timeout=lookup['cache_timeout']
+        )
+        cache.set("categories_list", categories, 3600)  # Cache for 1 hour
+        lookup['categories'] = categories
+    else:
+        response, error = _fetch_page_data(
+            'api/v1/episode-detail',
+            params=lookup['params'],
+            cache_timeout=lookup['cache_timeout']
+        )
+    
+    context = _episode_detail_context(request, lookup, response, error, start_time)
     return render(request, 'stream/episode_detail.html', context)
 
+
 @require_GET
 def favicon_view(request):
     """
@@ -1206,8 +1251,8 @@ def reset_circuit_breaker(request):
     Reset circuit breaker secara manual
     """
     try:
-        # Delete circuit breaker data
-        cache.delete(CIRCUIT_BREAKER_KEY)
+        # Reset the shared per-endpoint breakers for every worker
+        reset_circuit_breakers()
         logger.info("Circuit breaker has been manually reset")
         
         return JsonResponse({
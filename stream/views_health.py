@@ -39,6 +39,14 @@ def health_check(request):
         redis_status = "error"
         redis_error = str(e)
     
+    # The cache answers from its local disk tier while Redis is down
+    cache_failover = None
+    if hasattr(cache, 'get_stats') and hasattr(cache, 'available'):
+        cache_failover = cache.get_stats()
+        if redis_status == "ok" and not cache_failover['healthy']:
+            redis_status = "failover"
+            redis_error = cache_failover['last_error']
+    
     # Check system resources
     system_status = {
         "cpu_usage": psutil.cpu_percent(interval=0.1),
@@ -64,7 +72,8 @@ def health_check(request):
             },
             "redis": {
                 "status": redis_status,
-                "error": redis_error
+                "error": redis_error,
+                "failover": cache_failover
             }
         },
         "system": system_status,
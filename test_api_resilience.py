@@ -14,6 +14,7 @@ sys.path.append('/home/korteks/Documents/project/fekortekstream/kortekstreamV2')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 django.setup()
 
+from stream.api_client import api_client
 from stream.views import make_api_request_with_retry, is_circuit_breaker_open, record_api_failure, record_api_success
 from django.core.cache import cache
 
@@ -25,7 +26,7 @@ def test_api_endpoint():
     # Test 1: Normal API call
     print("\n1. Testing normal API call...")
     try:
-        url = "http://apigatway.humanmade.my.id:8080/api/v1/episode-detail"
+        url = f"{api_client.base_url}/api/v1/episode-detail"
         params = {
             'episode_url': 'https://v1.samehadaku.how/anime/one-piece/',
             'category': 'anime'
@@ -62,7 +63,7 @@ def test_api_endpoint():
         print("❌ Cache is not working")
     
     # Reset circuit breaker
-    record_api_success()
+    record_api_success('default')
     print(f"\n5. Circuit breaker reset: {'OPEN' if is_circuit_breaker_open() else 'CLOSED'}")
 
 if __name__ == "__main__":